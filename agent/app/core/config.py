@@ -5,8 +5,22 @@ class Settings(BaseSettings):
     SERVER_URL: str
     CLIENT_TOKEN: str
     AGENT_TOKEN: str | None = None
-    
+
+    # Caché local de drivers (direccionada por hash SHA-256 del contenido)
+    DRIVER_CACHE_DIR: str = "driver_cache"
+    DRIVER_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2 GB
+    DRIVER_DOWNLOAD_RETRIES: int = 3
+
+    # Instalación de impresoras
+    INSTALL_STEP_TIMEOUT: int = 180  # segundos por comando externo
+    MAX_CONCURRENT_INSTALLS: int = 4
+
+    # Túneles: segundos sin tráfico ni conexiones antes de cerrarlos
+    TUNNEL_IDLE_TIMEOUT: int = 900
+    # Conexiones SSH de los túneles: segundos para conectar y recibir el banner/autenticar
+    SSH_CONNECT_TIMEOUT: int = 15
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,141 @@
+# agent/app/core/ssh_pool.py
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Tuple
+
+import paramiko
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# (host, puerto, usuario, huella de la contraseña)
+PoolKey = Tuple[str, int, str, str]
+
+
+def pool_key(host: str, port: int, username: str, password: str) -> PoolKey:
+    """
+    Clave de la conexión compartida. Incluye una huella de la contraseña:
+    credenciales distintas nunca reutilizan un transporte ya autenticado.
+    """
+    fingerprint = hashlib.sha256((password or '').encode()).hexdigest()[:16]
+    return host, port, username, fingerprint
+
+
+class _PooledTransport:
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.transport = client.get_transport()
+        # paramiko admite un solo handler por transporte: se despacha por puerto
+        self.forwards: Dict[int, Callable] = {}
+
+    def dispatch(self, chan, origin, server):
+        handler = self.forwards.get(server[1])
+        if handler is None:
+            logger.warning(f"Canal recibido para puerto sin túnel: {server[1]}")
+            chan.close()
+            return
+        handler(chan, origin, server)
+
+
+class SSHTransportPool:
+    """
+    Reutiliza una conexión SSH por (host, puerto, usuario, credenciales) para
+    todos los port-forwards hacia ese servidor. La conexión se cierra cuando
+    se libera el último túnel que la usa.
+
+    `_lock` solo protege los diccionarios; las operaciones de red (conectar,
+    pedir o cancelar un forward) van bajo el candado de su clave, así que un
+    servidor que no responde no retiene los túneles hacia los demás.
+    """
+
+    def __init__(self):
+        self._entries: Dict[PoolKey, _PooledTransport] = {}
+        self._key_locks: Dict[PoolKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def add_forward(self, host: str, port: int, username: str, password: str,
+                    remote_port: int, handler: Callable) -> PoolKey:
+        """
+        Registra un port-forward remoto sobre la conexión compartida (bloqueante).
+
+        Returns:
+            PoolKey: Clave de la conexión, necesaria para `remove_forward`
+        """
+        key = pool_key(host, port, username, password)
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or not entry.transport.is_active():
+                if entry is not None:
+                    entry.client.close()
+                entry = _PooledTransport(self._connect(host, port, username, password))
+                with self._lock:
+                    self._entries[key] = entry
+            else:
+                logger.info(f"♻️ Reutilizando conexión SSH a {host}:{port} ({len(entry.forwards)} túneles)")
+
+            with self._lock:
+                entry.forwards[remote_port] = handler
+            try:
+                entry.transport.request_port_forward('', remote_port, handler=entry.dispatch)
+            except Exception:
+                with self._lock:
+                    entry.forwards.pop(remote_port, None)
+                    self._close_if_unused(key)
+                raise
+        return key
+
+    def remove_forward(self, key: PoolKey, remote_port: int):
+        """Cancela un port-forward y cierra la conexión si ya no tiene túneles."""
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    return
+                removed = entry.forwards.pop(remote_port, None) is not None
+            if removed and entry.transport.is_active():
+                try:
+                    entry.transport.cancel_port_forward('', remote_port)
+                except Exception as e:
+                    logger.debug(f"Error cancelando port-forward {remote_port}: {e}")
+            with self._lock:
+                self._close_if_unused(key)
+
+    def is_active(self, key: PoolKey) -> bool:
+        entry = self._entries.get(key)
+        return bool(entry and entry.transport.is_active())
+
+    def _key_lock(self, key: PoolKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _connect(host: str, port: int, username: str, password: str) -> paramiko.SSHClient:
+        logger.info(f"Conectando a {host}:{port}")
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        timeout = settings.SSH_CONNECT_TIMEOUT
+        try:
+            client.connect(
+                host, port=port, username=username, password=password, look_for_keys=False,
+                timeout=timeout, banner_timeout=timeout, auth_timeout=timeout
+            )
+        except Exception:
+            client.close()
+            raise
+        client.get_transport().set_keepalive(30)
+        logger.info("Conexión SSH establecida")
+        return client
+
+    def _close_if_unused(self, key: PoolKey):
+        """Con `_lock` tomado."""
+        entry = self._entries.get(key)
+        if entry is not None and not entry.forwards:
+            del self._entries[key]
+            entry.client.close()
+            logger.info(f"Conexión SSH a {key[0]}:{key[1]} cerrada (sin túneles)")
+
+
+ssh_pool = SSHTransportPool()
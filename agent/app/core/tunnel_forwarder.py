@@ -0,0 +1,328 @@
+# agent/app/core/tunnel_forwarder.py
+import errno
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 256 * 1024       # Lectura por llamada (socket y canal SSH)
+CONNECT_TIMEOUT = 10           # Segundos para conectar con el equipo destino
+IDLE_POLL = 1.0                # Espera del selector cuando no hay envíos pendientes
+BUSY_POLL = 0.01               # Espera cuando un canal SSH tiene datos por enviar
+
+
+class TunnelStats:
+    """Contadores de un túnel: bytes y conexiones."""
+
+    __slots__ = ('bytes_to_target', 'bytes_from_target', 'connections_total',
+                 'connections_active', 'connect_errors', 'last_activity')
+
+    def __init__(self):
+        self.bytes_to_target = 0
+        self.bytes_from_target = 0
+        self.connections_total = 0
+        self.connections_active = 0
+        self.connect_errors = 0
+        self.last_activity = time.time()
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Pipe:
+    """Una conexión reenviada: canal SSH <-> socket TCP del equipo destino."""
+
+    def __init__(self, tunnel_id: str, chan, sock: socket.socket, stats: TunnelStats):
+        self.tunnel_id = tunnel_id
+        self.chan = chan
+        self.sock = sock
+        self.stats = stats
+        self.connected = False
+        self.connect_deadline = time.monotonic() + CONNECT_TIMEOUT
+        self.buffer = bytearray(BUFFER_SIZE)        # Reutilizado en cada recv_into
+        self.to_sock: Optional[memoryview] = None   # Pendiente hacia el destino
+        self.to_chan: Optional[memoryview] = None   # Pendiente hacia el canal SSH
+        self.sock_eof = False
+        self.chan_eof = False
+        self.closed = False
+
+
+class TunnelForwarder:
+    """
+    Motor de reenvío basado en un único selector para todos los túneles.
+
+    Cada canal aceptado por paramiko se empareja con un socket no bloqueante
+    hacia el equipo destino y ambos se atienden desde un solo hilo, de modo
+    que un túnel puede servir muchas conexiones simultáneas. Mientras un
+    lado tiene datos pendientes se deja de leer del otro (backpressure).
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._incoming = deque()
+        self._pipes: Dict[int, _Pipe] = {}
+        self._stats: Dict[str, TunnelStats] = {}
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='tunnel-forwarder', daemon=True)
+            self._thread.start()
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+
+    def register_tunnel(self, tunnel_id: str):
+        with self._lock:
+            self._stats.setdefault(tunnel_id, TunnelStats())
+
+    def stats(self, tunnel_id: str = None) -> Dict[str, Dict]:
+        """Devuelve una copia de los contadores (de un túnel o de todos)."""
+        with self._lock:
+            items = self._stats.items() if tunnel_id is None else (
+                [(tunnel_id, self._stats[tunnel_id])] if tunnel_id in self._stats else []
+            )
+            return {tid: s.as_dict() for tid, s in items}
+
+    def add_channel(self, tunnel_id: str, chan, target: Tuple[str, int]):
+        """
+        Registra un canal entrante; puede llamarse desde el hilo de paramiko.
+
+        Args:
+            tunnel_id (str): Túnel al que pertenece el canal
+            chan: Canal paramiko aceptado
+            target (Tuple[str, int]): Host y puerto del equipo destino
+        """
+        self.start()
+        with self._lock:
+            stats = self._stats.setdefault(tunnel_id, TunnelStats())
+            stats.connections_total += 1
+            stats.connections_active += 1
+        self._incoming.append((tunnel_id, chan, target))
+        self._wakeup()
+
+    def close_tunnel(self, tunnel_id: str) -> Dict:
+        """Cierra todas las conexiones de un túnel y devuelve sus contadores finales."""
+        self._incoming.append((tunnel_id, None, None))
+        self._wakeup()
+        with self._lock:
+            stats = self._stats.pop(tunnel_id, None)
+        return stats.as_dict() if stats else {}
+
+    # --- Hilo del selector ---
+
+    def _run(self):
+        while True:
+            busy = any(p.to_chan is not None for p in self._pipes.values())
+            try:
+                events = self._selector.select(BUSY_POLL if busy else IDLE_POLL)
+            except OSError as e:
+                logger.error(f"Error en el selector de túneles: {e}")
+                time.sleep(IDLE_POLL)
+                continue
+
+            for key, mask in events:
+                if key.data is None:
+                    self._drain_wakeup()
+                    continue
+                pipe, side = key.data
+                if pipe.closed:
+                    continue
+                try:
+                    if side == 'sock':
+                        self._on_sock(pipe, mask)
+                    else:
+                        self._on_chan(pipe)
+                except Exception as e:
+                    logger.debug(f"Conexión del túnel {pipe.tunnel_id} terminada: {e}")
+                    self._close_pipe(pipe)
+
+            # Los canales SSH no notifican escritura: reintentar envíos pendientes
+            now = time.monotonic()
+            for pipe in list(self._pipes.values()):
+                if pipe.closed:
+                    continue
+                try:
+                    if pipe.to_chan is not None:
+                        self._flush_to_chan(pipe)
+                    if not pipe.connected and now > pipe.connect_deadline:
+                        raise TimeoutError("timeout conectando con el destino")
+                except Exception as e:
+                    logger.debug(f"Conexión del túnel {pipe.tunnel_id} terminada: {e}")
+                    self._close_pipe(pipe)
+
+    def _drain_wakeup(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        while self._incoming:
+            tunnel_id, chan, target = self._incoming.popleft()
+            if chan is None:
+                for pipe in [p for p in self._pipes.values() if p.tunnel_id == tunnel_id]:
+                    self._close_pipe(pipe)
+            else:
+                self._open_pipe(tunnel_id, chan, target)
+
+    def _open_pipe(self, tunnel_id: str, chan, target: Tuple[str, int]):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        chan.setblocking(False)
+        stats = self._stats.get(tunnel_id) or TunnelStats()
+        pipe = _Pipe(tunnel_id, chan, sock, stats)
+        self._pipes[id(pipe)] = pipe
+
+        err = sock.connect_ex(target)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', -1)):
+            logger.error(f"Error conectando a {target[0]}:{target[1]} - {errno.errorcode.get(err, err)}")
+            stats.connect_errors += 1
+            self._close_pipe(pipe)
+            return
+
+        # El canal no se lee hasta que el destino acepte la conexión
+        self._selector.register(sock, selectors.EVENT_WRITE, (pipe, 'sock'))
+
+    def _set_chan_reading(self, pipe: _Pipe, enabled: bool):
+        registered = self._is_registered(pipe.chan)
+        if enabled and not registered:
+            self._selector.register(pipe.chan, selectors.EVENT_READ, (pipe, 'chan'))
+        elif not enabled and registered:
+            self._selector.unregister(pipe.chan)
+
+    def _is_registered(self, fileobj) -> bool:
+        try:
+            self._selector.get_key(fileobj)
+            return True
+        except (KeyError, ValueError):
+            return False
+
+    def _update_sock_events(self, pipe: _Pipe):
+        events = 0
+        if pipe.to_sock is not None or not pipe.connected:
+            events |= selectors.EVENT_WRITE
+        if pipe.connected and not pipe.sock_eof and pipe.to_chan is None:
+            events |= selectors.EVENT_READ
+        if events:
+            if self._is_registered(pipe.sock):
+                self._selector.modify(pipe.sock, events, (pipe, 'sock'))
+            else:
+                self._selector.register(pipe.sock, events, (pipe, 'sock'))
+        elif self._is_registered(pipe.sock):
+            self._selector.unregister(pipe.sock)
+
+    def _on_sock(self, pipe: _Pipe, mask: int):
+        if not pipe.connected:
+            err = pipe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                pipe.stats.connect_errors += 1
+                raise ConnectionError(f"no se pudo conectar con el destino: {errno.errorcode.get(err, err)}")
+            pipe.connected = True
+            self._set_chan_reading(pipe, True)
+            self._update_sock_events(pipe)
+            return
+
+        if mask & selectors.EVENT_WRITE and pipe.to_sock is not None:
+            self._flush_to_sock(pipe)
+
+        if mask & selectors.EVENT_READ:
+            try:
+                n = pipe.sock.recv_into(pipe.buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            if n == 0:
+                pipe.sock_eof = True
+                if pipe.to_chan is None:
+                    pipe.chan.shutdown_write()
+                self._update_sock_events(pipe)
+                self._maybe_finish(pipe)
+                return
+            pipe.stats.bytes_from_target += n
+            pipe.stats.last_activity = time.time()
+            # El buffer se reutiliza: solo se vuelve a leer cuando el canal drenó
+            pipe.to_chan = memoryview(pipe.buffer)[:n]
+            self._flush_to_chan(pipe)
+            self._update_sock_events(pipe)
+
+    def _on_chan(self, pipe: _Pipe):
+        try:
+            data = pipe.chan.recv(BUFFER_SIZE)
+        except socket.timeout:
+            return
+        if not data:
+            pipe.chan_eof = True
+            self._set_chan_reading(pipe, False)
+            if pipe.to_sock is None:
+                pipe.sock.shutdown(socket.SHUT_WR)
+            self._maybe_finish(pipe)
+            return
+        pipe.stats.bytes_to_target += len(data)
+        pipe.stats.last_activity = time.time()
+        pipe.to_sock = memoryview(data)
+        self._flush_to_sock(pipe)
+
+    def _flush_to_sock(self, pipe: _Pipe):
+        try:
+            sent = pipe.sock.send(pipe.to_sock)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        pipe.to_sock = pipe.to_sock[sent:] if sent < len(pipe.to_sock) else None
+        # Backpressure: no leer del canal mientras el destino no drene
+        self._set_chan_reading(pipe, pipe.to_sock is None and not pipe.chan_eof)
+        if pipe.to_sock is None and pipe.chan_eof:
+            pipe.sock.shutdown(socket.SHUT_WR)
+        self._update_sock_events(pipe)
+        self._maybe_finish(pipe)
+
+    def _flush_to_chan(self, pipe: _Pipe):
+        if not pipe.chan.send_ready():
+            return
+        try:
+            sent = pipe.chan.send(pipe.to_chan)
+        except socket.timeout:
+            sent = 0
+        pipe.to_chan = pipe.to_chan[sent:] if sent < len(pipe.to_chan) else None
+        if pipe.to_chan is None:
+            if pipe.sock_eof:
+                pipe.chan.shutdown_write()
+            # Reanudar la lectura del destino ya que el canal drenó
+            self._update_sock_events(pipe)
+            self._maybe_finish(pipe)
+
+    def _maybe_finish(self, pipe: _Pipe):
+        if pipe.sock_eof and pipe.chan_eof and pipe.to_sock is None and pipe.to_chan is None:
+            self._close_pipe(pipe)
+
+    def _close_pipe(self, pipe: _Pipe):
+        if pipe.closed:
+            return
+        pipe.closed = True
+        self._pipes.pop(id(pipe), None)
+        for fileobj in (pipe.sock, pipe.chan):
+            if self._is_registered(fileobj):
+                self._selector.unregister(fileobj)
+            try:
+                fileobj.close()
+            except Exception:
+                pass
+        with self._lock:
+            pipe.stats.connections_active = max(0, pipe.stats.connections_active - 1)
+
+
+forwarder = TunnelForwarder()
@@ -0,0 +1,244 @@
+# agent/app/core/tunnel_mux.py
+"""
+Multiplexación de streams TCP sobre el websocket del agente.
+
+Cada mensaje binario del websocket es un frame:
+
+    op (1 byte) | stream_id (4 bytes, big endian) | payload
+
+El servidor abre los streams (OPEN con el tunnel_id como payload), el agente
+conecta con el equipo destino y responde OPEN_OK o CLOSE. El control de flujo
+es por créditos: cada lado puede enviar hasta INITIAL_WINDOW bytes sin
+confirmar y el receptor devuelve WINDOW a medida que escribe en su socket.
+
+Este módulo se mantiene idéntico en agent/app/core y server/app/core.
+"""
+import asyncio
+import logging
+import struct
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!BI')
+WINDOW = struct.Struct('!I')
+
+OPEN, OPEN_OK, DATA, EOF, CLOSE, WINDOW_UPDATE = range(1, 7)
+
+INITIAL_WINDOW = 512 * 1024   # Bytes en vuelo por stream y sentido
+MAX_FRAME = 64 * 1024         # Payload máximo por frame DATA
+OPEN_TIMEOUT = 15             # Segundos para que el agente acepte un stream
+
+
+class MuxStream:
+    """Un stream TCP dentro de la sesión multiplexada."""
+
+    def __init__(self, session: 'MuxSession', stream_id: int, tag: str):
+        self.session = session
+        self.id = stream_id
+        self.tag = tag
+        self.credit = INITIAL_WINDOW
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.opened = asyncio.get_running_loop().create_future()
+        self.closed = False
+        self.remote_eof = False
+        self.close_reason = ''
+        self._credit_event = asyncio.Event()
+        self._credit_event.set()
+        self._unacked = 0
+
+    async def send(self, data: bytes):
+        """Envía datos respetando el crédito del receptor."""
+        view = memoryview(data)
+        while view:
+            while self.credit <= 0:
+                if self.closed:
+                    raise ConnectionResetError(self.close_reason or 'stream cerrado')
+                self._credit_event.clear()
+                await self._credit_event.wait()
+            if self.closed:
+                raise ConnectionResetError(self.close_reason or 'stream cerrado')
+            n = min(len(view), self.credit, MAX_FRAME)
+            await self.session._send(DATA, self.id, view[:n])
+            self.credit -= n
+            self.session._count(self.tag, 'bytes_out', n)
+            view = view[n:]
+
+    async def send_eof(self):
+        if not self.closed:
+            await self.session._send(EOF, self.id)
+
+    async def consumed(self, n: int):
+        """Confirma bytes ya escritos localmente y devuelve crédito al emisor."""
+        self._unacked += n
+        if self._unacked >= INITIAL_WINDOW // 2 and not self.closed:
+            increment, self._unacked = self._unacked, 0
+            await self.session._send(WINDOW_UPDATE, self.id, WINDOW.pack(increment))
+
+    async def close(self, reason: str = ''):
+        if self.closed:
+            return
+        self._mark_closed(reason)
+        try:
+            await self.session._send(CLOSE, self.id, reason.encode())
+        except Exception:
+            pass
+
+    def _grant(self, increment: int):
+        self.credit += increment
+        self._credit_event.set()
+
+    def _mark_closed(self, reason: str = ''):
+        self.closed = True
+        self.close_reason = reason
+        self.session._forget(self)
+        self.inbound.put_nowait(None)
+        self._credit_event.set()
+        if not self.opened.done():
+            self.opened.set_exception(ConnectionRefusedError(reason or 'stream rechazado'))
+
+
+class MuxSession:
+    """
+    Sesión multiplexada sobre un websocket.
+
+    Args:
+        send_bytes: Corrutina que envía un mensaje binario por el websocket
+        open_handler: Corrutina llamada con cada stream abierto por el otro lado
+    """
+
+    def __init__(self, send_bytes: Callable[[bytes], Awaitable[None]],
+                 open_handler: Optional[Callable[[MuxStream], Awaitable[None]]] = None):
+        self._send_bytes = send_bytes
+        self._open_handler = open_handler
+        self._send_lock = asyncio.Lock()
+        self._next_id = 1
+        self._tasks = set()
+        self.streams: Dict[int, MuxStream] = {}
+        self.stats: Dict[str, Dict] = {}
+
+    async def _send(self, op: int, stream_id: int, payload=b''):
+        frame = HEADER.pack(op, stream_id) + bytes(payload)
+        async with self._send_lock:
+            await self._send_bytes(frame)
+
+    def _count(self, tag: str, key: str, n: int = 1):
+        stats = self.stats.setdefault(tag, {
+            'bytes_in': 0, 'bytes_out': 0, 'streams_total': 0, 'streams_active': 0,
+            'last_activity': time.time()
+        })
+        stats[key] += n
+        stats['last_activity'] = time.time()
+
+    def _register(self, stream_id: int, tag: str) -> MuxStream:
+        stream = MuxStream(self, stream_id, tag)
+        self.streams[stream_id] = stream
+        self._count(tag, 'streams_total')
+        self._count(tag, 'streams_active')
+        return stream
+
+    def _forget(self, stream: MuxStream):
+        if self.streams.pop(stream.id, None) is not None:
+            self._count(stream.tag, 'streams_active', -1)
+
+    async def open_stream(self, tag: str, timeout: float = OPEN_TIMEOUT) -> MuxStream:
+        """Abre un stream hacia el otro extremo y espera su OPEN_OK."""
+        stream_id = self._next_id
+        self._next_id = self._next_id % 0xFFFFFFFF + 1
+        stream = self._register(stream_id, tag)
+        await self._send(OPEN, stream_id, tag.encode())
+        try:
+            await asyncio.wait_for(asyncio.shield(stream.opened), timeout)
+        except Exception:
+            await stream.close('timeout de apertura')
+            raise
+        return stream
+
+    async def accept(self, stream: MuxStream):
+        if not stream.opened.done():
+            stream.opened.set_result(True)
+        await self._send(OPEN_OK, stream.id)
+
+    async def feed(self, frame: bytes):
+        """Procesa un mensaje binario recibido del websocket (no bloquea)."""
+        if len(frame) < HEADER.size:
+            return
+        op, stream_id = HEADER.unpack_from(frame)
+        payload = memoryview(frame)[HEADER.size:]
+
+        if op == OPEN:
+            if self._open_handler is None:
+                await self._send(CLOSE, stream_id, b'apertura no permitida')
+                return
+            stream = self._register(stream_id, bytes(payload).decode())
+            task = asyncio.create_task(self._open_handler(stream))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return
+
+        if op == DATA:
+            self._count(stream.tag, 'bytes_in', len(payload))
+            stream.inbound.put_nowait(payload)
+        elif op == WINDOW_UPDATE:
+            stream._grant(WINDOW.unpack(payload)[0])
+        elif op == OPEN_OK:
+            if not stream.opened.done():
+                stream.opened.set_result(True)
+        elif op == EOF:
+            stream.remote_eof = True
+            stream.inbound.put_nowait(None)
+        elif op == CLOSE:
+            stream._mark_closed(bytes(payload).decode(errors='replace'))
+
+    async def bridge(self, stream: MuxStream, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Conecta un stream con un socket local hasta que ambos lados terminen."""
+
+        async def upstream():
+            while True:
+                data = await reader.read(MAX_FRAME)
+                if not data:
+                    await stream.send_eof()
+                    return
+                await stream.send(data)
+
+        async def downstream():
+            while True:
+                data = await stream.inbound.get()
+                if data is None:
+                    if stream.remote_eof and not stream.closed and writer.can_write_eof():
+                        writer.write_eof()
+                    return
+                writer.write(data)
+                await writer.drain()
+                await stream.consumed(len(data))
+
+        tasks = {asyncio.create_task(upstream()), asyncio.create_task(downstream())}
+        try:
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if stream.closed or any(t.exception() for t in done if not t.cancelled()):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            await stream.close()
+
+    async def close_tag(self, tag: str, reason: str = ''):
+        """Cierra todos los streams de un túnel."""
+        for stream in [s for s in self.streams.values() if s.tag == tag]:
+            await stream.close(reason)
+
+    def close_all(self, reason: str = 'sesión cerrada'):
+        """Marca todos los streams como cerrados (websocket caído)."""
+        for stream in list(self.streams.values()):
+            stream._mark_closed(reason)
+        for task in list(self._tasks):
+            task.cancel()
@@ -2,13 +2,8 @@
 import logging
 import asyncio
 import websockets
-import zipfile
-import tempfile
 import json
 import base64
-import paramiko
-import threading
-import select
 import time
 import platform
 import socket
@@ -21,7 +16,11 @@ from .system_info_service import SystemInfoService
 from .printer_service import PrinterService
 from .printer_monitor_service import PrinterMonitorService
 from ..core.message_queue import MessageQueue, MessagePriority
+from ..core.tunnel_forwarder import forwarder as tunnel_forwarder
+from ..core.tunnel_mux import MuxSession
+from ..core.ssh_pool import ssh_pool
 from .smb_service import SMBScannerService
+from .driver_cache_service import DriverCacheService
 from datetime import datetime
 from ..core.config import settings
 
@@ -38,6 +37,7 @@ class AgentService:
         self.system_info = SystemInfoService()
         self.printer_monitor = PrinterMonitorService(settings.SERVER_URL)
         self.printer_service = PrinterService()
+        self.driver_cache = DriverCacheService(on_evict=self.printer_service.driver_packages.forget)
         self.smb_service = SMBScannerService()
         self.reconnect_interval = 10
         self.system_info = SystemInfoService()
@@ -46,6 +46,8 @@ class AgentService:
         self.is_shutting_down = False
         self.current_status = AgentStatus.OFFLINE
         self.message_queue = MessageQueue()
+        self._background_tasks = set()
+        self.tunnel_mux = None
         
         
     
@@ -227,6 +229,7 @@ class AgentService:
                     tasks.append(asyncio.create_task(self._handle_connection(websocket)))
                     tasks.append(asyncio.create_task(self._periodic_updates(websocket)))
                     tasks.append(asyncio.create_task(self._heartbeat_loop(websocket)))
+                    tasks.append(asyncio.create_task(self._tunnel_reaper_loop(websocket)))
                     
                     try:
                         # Esperar a que cualquier tarea termine o lance una excepción
@@ -282,10 +285,15 @@ class AgentService:
         """Maneja la conexión WebSocket activa."""
         try:
             logger.info("Manejador de conexión iniciado")
+            self.tunnel_mux = MuxSession(websocket.send, open_handler=self._on_mux_stream)
             while True:
                 try:
                     logger.debug("Esperando mensaje del servidor...")
                     message = await websocket.recv()
+                    if isinstance(message, bytes):
+                        # Frames binarios: tráfico de túneles multiplexados
+                        await self.tunnel_mux.feed(message)
+                        continue
                     logger.info(f"Mensaje recibido del servidor: {message}")
                     
                     try:
@@ -314,6 +322,9 @@ class AgentService:
         except Exception as e:
             logger.error(f"Error fatal en el manejador de conexión: {e}")
             raise
+        finally:
+            if self.tunnel_mux:
+                self.tunnel_mux.close_all()
 
     async def _process_message(self, data, websocket):
         """Procesa los mensajes recibidos del servidor."""
@@ -324,7 +335,8 @@ class AgentService:
             
             if message_type == 'install_printer':
                 logger.info("Procesando comando de instalación de impresora")
-                await self._handle_printer_installation(data, websocket)
+                # En segundo plano: heartbeats y túneles siguen atendiéndose
+                self._spawn(self._handle_printer_installation(data, websocket))
                 
             elif message_type == 'heartbeat':
                 logger.debug("Procesando heartbeat")
@@ -348,12 +360,14 @@ class AgentService:
                 
             else:
                 logger.warning(f"Tipo de mensaje desconocido: {message_type}")
-                await self._send_error_response(websocket, f"Tipo de mensaje no soportado: {message_type}")
+                await self._send_error_response(
+                    websocket, f"Tipo de mensaje no soportado: {message_type}", data.get('request_id')
+                )
                 
         except Exception as e:
             error_msg = f"Error procesando mensaje: {str(e)}"
             logger.error(error_msg)
-            await self._send_error_response(websocket, error_msg)
+            await self._send_error_response(websocket, error_msg, data.get('request_id'))
             # No relanzar la excepción para mantener la conexión viva
 
     async def _handle_heartbeat(self, websocket):
@@ -388,6 +402,14 @@ class AgentService:
                             'timestamp': datetime.utcnow().isoformat()
                         }))
                         last_heartbeat = current_time
+
+                        # Siempre se informa: el servidor concilia Tunnel.status con esta lista
+                        stats = self._tunnel_stats()
+                        await websocket.send(json.dumps({
+                            'type': 'tunnel_stats',
+                            'tunnels': {tid: stats.get(tid, {}) for tid in self.active_tunnels},
+                            'timestamp': datetime.utcnow().isoformat()
+                        }))
                         
                     except Exception as e:
                         logger.error(f"Error enviando heartbeat: {e}")
@@ -399,23 +421,44 @@ class AgentService:
         except Exception as e:
             logger.error(f"Error fatal en heartbeat loop: {e}")
             raise  # Propagar el error para reiniciar la conexión
-    async def _send_error_response(self, websocket, error_message: str):
-        """Envía una respuesta de error al servidor."""
+    async def _send_error_response(self, websocket, error_message: str, request_id=None):
+        """Envía una respuesta de error al servidor (con el request_id del comando, si lo hay)."""
         try:
             await websocket.send(json.dumps({
                 'type': 'error',
+                'request_id': request_id,
                 'message': error_message
             }))
         except Exception as e:
             logger.error(f"Error enviando respuesta de error: {e}")
+    def _spawn(self, coro):
+        """Lanza una tarea en segundo plano manteniendo una referencia hasta que termine."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
     async def _handle_printer_installation(self, data, websocket):
         """Maneja la instalación de impresoras."""
+        job_id = data.get('job_id')
+        request_id = data.get('request_id')
+        printer_ip = data.get('printer_ip')
+
+        async def send_progress(step: str, message: str):
+            await websocket.send(json.dumps({
+                'type': 'installation_progress',
+                'request_id': request_id,
+                'job_id': job_id,
+                'printer_ip': printer_ip,
+                'step': step,
+                'message': message
+            }))
+
         try:
             driver_url = data.get('driver_url')
             if not driver_url:
                 raise ValueError("Driver URL not provided in the command.")
 
-            printer_ip = data.get('printer_ip')
             manufacturer = data.get('manufacturer')
             model = data.get('model')
             driver_filename = data.get('driver_filename')
@@ -423,65 +466,41 @@ class AgentService:
             driver_name = os.path.splitext(driver_filename)[0]
             logger.debug(f"Nombre del driver a usar: {driver_name}")
 
-            with tempfile.TemporaryDirectory() as temp_dir:
-                driver_path = os.path.join(temp_dir, driver_filename)
-                logger.debug(f"Driver se guardará en: {driver_path}")
-                
-                async with aiohttp.ClientSession() as session:
-                    logger.debug(f"Iniciando descarga desde: {driver_url}")
-                    async with session.get(driver_url) as response:
-                        if response.status != 200:
-                            raise Exception(f"Error downloading driver: {response.status}")
-                        
-                        # Verificar el Content-Type
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'application/zip' not in content_type.lower():
-                            logger.warning(f"Content-Type inesperado: {content_type}")
-                        
-                        content = await response.read()
-                        logger.debug(f"Descargados {len(content)} bytes")
-                        
-                        # Verificar si el contenido parece un ZIP
-                        if len(content) < 4 or content[:4] != b'PK\x03\x04':
-                            # Intentar decodificar el contenido para ver qué recibimos
-                            try:
-                                text_content = content.decode('utf-8')[:200]
-                                logger.error(f"Contenido no válido recibido: {text_content}")
-                            except:
-                                logger.error("Contenido binario no válido recibido")
-                            raise Exception("El archivo descargado no es un ZIP válido")
-                        
-                        with open(driver_path, 'wb') as f:
-                            f.write(content)
-                        
-                        try:
-                            with zipfile.ZipFile(driver_path, 'r') as zip_ref:
-                                extract_dir = os.path.join(temp_dir, "extracted")
-                                os.makedirs(extract_dir, exist_ok=True)
-                                zip_ref.extractall(extract_dir)
-                                logger.debug(f"ZIP extraído en: {extract_dir}")
-                        except Exception as e:
-                            logger.error(f"Error con el archivo ZIP: {e}")
-                            raise
-
-                        result = await self.printer_service.install(
-                            driver_path,
-                            printer_ip,
-                            manufacturer,
-                            model,
-                            driver_name
-                        )
-                        
-                        logger.info(f"Printer installation result: {result}")
-                        await websocket.send(json.dumps({
-                            'type': 'installation_result',
-                            'success': result['success'],
-                            'message': result['message']
-                        }))
+            # Descarga en streaming (o caché local si el hash ya se conoce)
+            await send_progress('download', f"Obteniendo driver {driver_filename}")
+            driver_path, driver_hash = await self.driver_cache.fetch(
+                driver_url,
+                data.get('driver_sha256')
+            )
+            logger.debug(f"Driver disponible en: {driver_path} (sha256 {driver_hash})")
+
+            # La extracción selectiva y la búsqueda del INF las hace PrinterService
+            result = await self.printer_service.install(
+                driver_path,
+                printer_ip,
+                manufacturer,
+                model,
+                driver_name,
+                driver_hash=driver_hash,
+                progress=send_progress
+            )
 
         except Exception as e:
             logger.error(f"Error during printer installation: {e}")
-            await self._send_error_response(websocket, f"Error en instalación: {e}")
+            result = {'success': False, 'message': f"Error en instalación: {e}"}
+
+        logger.info(f"Printer installation result: {result}")
+        try:
+            await websocket.send(json.dumps({
+                'type': 'installation_result',
+                'request_id': request_id,
+                'job_id': job_id,
+                'printer_ip': printer_ip,
+                'success': result['success'],
+                'message': result['message']
+            }))
+        except Exception as e:
+            logger.error(f"No se pudo enviar el resultado de la instalación: {e}")
 
     async def _handle_printer_created(self, data, websocket):
         """Maneja la notificación de una nueva impresora creada."""
@@ -526,7 +545,7 @@ class AgentService:
         except Exception as e:
             error_msg = f"Error procesando nueva impresora: {str(e)}"
             logger.error(error_msg)
-            await self._send_error_response(websocket, error_msg)
+            await self._send_error_response(websocket, error_msg, data.get('request_id'))
 
     async def _handle_printer_scan(self, data, websocket):
         """Maneja una solicitud de escaneo de impresoras."""
@@ -550,6 +569,7 @@ class AgentService:
             
             await websocket.send(json.dumps({
                 'type': 'scan_results',
+                'request_id': data.get('request_id'),
                 'printers': discovered_printers,
                 'timestamp': datetime.utcnow().isoformat()
             }))
@@ -557,7 +577,7 @@ class AgentService:
         except Exception as e:
             error_msg = f"Error en escaneo de impresoras: {str(e)}"
             logger.error(error_msg)
-            await self._send_error_response(websocket, error_msg)
+            await self._send_error_response(websocket, error_msg, data.get('request_id'))
 
     async def _periodic_updates(self, websocket):
         """
@@ -642,132 +662,160 @@ class AgentService:
             if tunnel_id in self.active_tunnels:
                 raise ValueError(f"Ya existe un túnel activo para {tunnel_id}")
 
+            if data.get('mode') == 'ws':
+                # Túnel multiplexado: los streams llegan por el propio websocket
+                self.active_tunnels[tunnel_id] = {
+                    'config': data,
+                    'websocket': websocket,
+                    'status': 'active',
+                    'mode': 'ws',
+                    'created_at': time.time()
+                }
+                await websocket.send(json.dumps({
+                    'type': 'tunnel_status',
+                    'request_id': data.get('request_id'),
+                    'tunnel_id': tunnel_id,
+                    'status': 'active',
+                    'message': 'Túnel multiplexado listo'
+                }))
+                return
+
             # Registrar el túnel y su websocket
             self.active_tunnels[tunnel_id] = {
                 'config': data,
                 'websocket': websocket,
-                'status': 'starting'
+                'status': 'starting',
+                'created_at': time.time()
             }
 
             await websocket.send(json.dumps({
                 'type': 'tunnel_status',
+                'request_id': data.get('request_id'),
                 'tunnel_id': tunnel_id,
                 'status': 'starting',
                 'message': 'Iniciando túnel SSH...'
             }))
 
-            # Crear el túnel en un thread separado
-            tunnel_thread = threading.Thread(
-                target=self._create_tunnel,
-                args=(
-                    data['ssh_host'],
-                    int(data['ssh_port']),
-                    data['username'],
-                    data['password'],
-                    data['remote_host'],
-                    int(data['remote_port']),
-                    int(data['local_port']),
-                    tunnel_id,
-                    asyncio.get_event_loop()
+            remote_host = data['remote_host']
+            remote_port = int(data['remote_port'])
+            local_port = int(data['local_port'])
+
+            def on_channel(chan, origin, server):
+                # Llamado por paramiko por cada conexión entrante, sin hilo propio
+                tunnel_forwarder.add_channel(tunnel_id, chan, (remote_host, remote_port))
+
+            tunnel_forwarder.register_tunnel(tunnel_id)
+            loop = asyncio.get_running_loop()
+            try:
+                # La conexión SSH se comparte entre túneles al mismo servidor/usuario
+                pool_key = await loop.run_in_executor(
+                    None, ssh_pool.add_forward,
+                    data['ssh_host'], int(data['ssh_port']), data['username'], data['password'],
+                    local_port, on_channel
                 )
-            )
-            tunnel_thread.daemon = True
-            
-            self.active_tunnels[tunnel_id]['thread'] = tunnel_thread
-            tunnel_thread.start()
+            except Exception:
+                self.active_tunnels.pop(tunnel_id, None)
+                tunnel_forwarder.close_tunnel(tunnel_id)
+                raise
+
+            if tunnel_id not in self.active_tunnels:
+                # Cerrado mientras se establecía la conexión
+                await loop.run_in_executor(None, ssh_pool.remove_forward, pool_key, local_port)
+                tunnel_forwarder.close_tunnel(tunnel_id)
+                return
+
+            self.active_tunnels[tunnel_id].update(status='active', pool_key=pool_key)
+            logger.info(f"Túnel remoto establecido: {remote_host}:{remote_port} <- localhost:{local_port}")
+            await self._send_tunnel_status(tunnel_id, 'active', 'Túnel establecido')
 
         except Exception as e:
             error_msg = f"Error creando túnel SSH: {str(e)}"
             logger.error(error_msg)
             await websocket.send(json.dumps({
                 'type': 'tunnel_status',
+                'request_id': data.get('request_id'),
                 'status': 'error',
                 'message': error_msg
             }))
 
-    def _create_tunnel(self, ssh_host, ssh_port, username, password, remote_host, remote_port, local_port, tunnel_id, loop):
-        """Crea y mantiene un túnel SSH."""
-        try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            logger.info(f"Conectando a {ssh_host}:{ssh_port}")
-            ssh.connect(
-                ssh_host, 
-                port=ssh_port,
-                username=username,
-                password=password,
-                look_for_keys=False
-            )
-            logger.info("Conexión SSH establecida")
-
-            transport = ssh.get_transport()
-            transport.request_port_forward('', local_port)
-
-            def handle_channel():
-                while tunnel_id in self.active_tunnels:
-                    try:
-                        chan = transport.accept()
-                        if chan is None:
-                            continue
-                        sock = socket.socket()
-                        try:
-                            sock.connect((remote_host, remote_port))
-                        except Exception as e:
-                            logger.error(f"Error conectando a {remote_host}:{remote_port} - {e}")
-                            chan.close()
-                            continue
-
-                        self._handle_tunnel(chan, sock)
-                    except Exception as e:
-                        logger.error(f"Error en el canal: {e}")
-                        break
-
-            handler_thread = threading.Thread(target=handle_channel)
-            handler_thread.daemon = True
-            handler_thread.start()
+    async def _on_mux_stream(self, stream):
+        """Atiende un stream abierto por el servidor en un túnel multiplexado."""
+        tunnel = self.active_tunnels.get(stream.tag)
+        if not tunnel or tunnel.get('mode') != 'ws':
+            await stream.close('túnel no activo')
+            return
 
-            logger.info(f"Túnel remoto establecido: {remote_host}:{remote_port} <- localhost:{local_port}")
-
-            future = asyncio.run_coroutine_threadsafe(
-                self._send_tunnel_status(tunnel_id, 'active', 'Túnel establecido'),
-                loop
+        config = tunnel['config']
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(config['remote_host'], int(config['remote_port'])),
+                timeout=10
             )
-            future.result()
-
-            while tunnel_id in self.active_tunnels:
-                if not ssh.get_transport():
-                    break
-                time.sleep(1)
-
-            transport.cancel_port_forward('', local_port)
-            ssh.close()
-
         except Exception as e:
-            error_msg = f"Error en el túnel: {str(e)}"
-            logger.error(error_msg)
-            future = asyncio.run_coroutine_threadsafe(
-                self._send_tunnel_status(tunnel_id, 'error', error_msg),
-                loop
-            )
-            future.result()
+            logger.error(f"Error conectando a {config['remote_host']}:{config['remote_port']} - {e}")
+            await stream.close(f"destino inalcanzable: {e}")
+            return
+
+        await self.tunnel_mux.accept(stream)
+        await self.tunnel_mux.bridge(stream, reader, writer)
+
+    def _tunnel_stats(self):
+        """Contadores de todos los túneles activos (SSH y multiplexados)."""
+        stats = tunnel_forwarder.stats()
+        if self.tunnel_mux:
+            stats.update({tag: dict(values) for tag, values in self.tunnel_mux.stats.items()})
+        return stats
+
+    async def _close_tunnel(self, tunnel_id):
+        """Libera los recursos de un túnel y devuelve sus contadores finales."""
+        if tunnel_id not in self.active_tunnels:
+            return None
+        final_stats = self._tunnel_stats().get(tunnel_id, {})
+        tunnel_info = self.active_tunnels.pop(tunnel_id)
+
+        if tunnel_info.get('mode') == 'ws':
+            await self.tunnel_mux.close_tag(tunnel_id, 'túnel cerrado')
+            self.tunnel_mux.stats.pop(tunnel_id, None)
+        else:
+            if 'pool_key' in tunnel_info:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, ssh_pool.remove_forward,
+                    tunnel_info['pool_key'], int(tunnel_info['config']['local_port'])
+                )
+            tunnel_forwarder.close_tunnel(tunnel_id)
+
+        logger.info(f"Túnel {tunnel_id} finalizado: {final_stats}")
+        return final_stats
 
-    def _handle_tunnel(self, chan, sock):
-        """Maneja la transferencia de datos del túnel."""
+    async def _tunnel_reaper_loop(self, websocket):
+        """Cierra túneles inactivos o cuya conexión SSH se perdió."""
         while True:
-            r, w, x = select.select([sock, chan], [], [])
-            if sock in r:
-                data = sock.recv(1024)
-                if len(data) == 0:
-                    break
-                chan.send(data)
-            if chan in r:
-                data = chan.recv(1024)
-                if len(data) == 0:
-                    break
-                sock.send(data)
-        chan.close()
-        sock.close()
+            await asyncio.sleep(60)
+            now = time.time()
+            stats = self._tunnel_stats()
+            for tunnel_id, info in list(self.active_tunnels.items()):
+                if info.get('status') != 'active':
+                    continue
+                tunnel_stats = stats.get(tunnel_id, {})
+                active = tunnel_stats.get('connections_active', tunnel_stats.get('streams_active', 0))
+                last_activity = max(tunnel_stats.get('last_activity', 0), info.get('created_at', now))
+
+                if info.get('mode') != 'ws' and not ssh_pool.is_active(info['pool_key']):
+                    status, message = 'error', 'Conexión SSH perdida'
+                elif active == 0 and now - last_activity > settings.TUNNEL_IDLE_TIMEOUT:
+                    status, message = 'closed', f'Cerrado por inactividad ({int(now - last_activity)}s)'
+                else:
+                    continue
+
+                logger.info(f"🧹 {message}: {tunnel_id}")
+                final_stats = await self._close_tunnel(tunnel_id)
+                await websocket.send(json.dumps({
+                    'type': 'tunnel_status',
+                    'tunnel_id': tunnel_id,
+                    'status': status,
+                    'message': message,
+                    'stats': final_stats
+                }))
 
     async def _handle_tunnel_closure(self, data, websocket):
         """Maneja el cierre de túneles SSH."""
@@ -777,17 +825,20 @@ class AgentService:
                 raise ValueError("Se requiere tunnel_id")
 
             if tunnel_id in self.active_tunnels:
-                tunnel_info = self.active_tunnels.pop(tunnel_id)
+                final_stats = await self._close_tunnel(tunnel_id)
                 
                 await websocket.send(json.dumps({
                     'type': 'tunnel_status',
+                    'request_id': data.get('request_id'),
                     'tunnel_id': tunnel_id,
                     'status': 'closed',
-                    'message': 'Túnel cerrado correctamente'
+                    'message': 'Túnel cerrado correctamente',
+                    'stats': final_stats
                 }))
             else:
                 await websocket.send(json.dumps({
                     'type': 'tunnel_status',
+                    'request_id': data.get('request_id'),
                     'tunnel_id': tunnel_id,
                     'status': 'error',
                     'message': 'Túnel no encontrado'
@@ -798,6 +849,7 @@ class AgentService:
             logger.error(error_msg)
             await websocket.send(json.dumps({
                 'type': 'tunnel_status',
+                'request_id': data.get('request_id'),
                 'status': 'error',
                 'message': error_msg
             }))
@@ -806,9 +858,12 @@ class AgentService:
         """Envía actualizaciones de estado del túnel al servidor."""
         try:
             if tunnel_id in self.active_tunnels and 'websocket' in self.active_tunnels[tunnel_id]:
-                websocket = self.active_tunnels[tunnel_id]['websocket']
+                tunnel = self.active_tunnels[tunnel_id]
+                websocket = tunnel['websocket']
                 await websocket.send(json.dumps({
                     'type': 'tunnel_status',
+                    # Responde a la petición create_tunnel que abrió el túnel
+                    'request_id': tunnel['config'].get('request_id'),
                     'tunnel_id': tunnel_id,
                     'status': status,
                     'message': message
@@ -0,0 +1,192 @@
+# agent/app/services/driver_cache_service.py
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class DriverCacheService:
+    """
+    Descarga drivers en streaming hacia disco y los guarda en una caché LRU
+    direccionada por el hash SHA-256 de su contenido.
+
+    Las descargas interrumpidas quedan en `partial/` y se reanudan con
+    HTTP Range en el siguiente intento.
+    """
+
+    CHUNK_SIZE = 1024 * 1024  # 1 MB por escritura
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.on_evict = on_evict
+        self.cache_dir = os.path.abspath(cache_dir or settings.DRIVER_CACHE_DIR)
+        self.max_bytes = max_bytes or settings.DRIVER_CACHE_MAX_BYTES
+        self.partial_dir = os.path.join(self.cache_dir, 'partial')
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def _cache_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha256}.zip")
+
+    def get_cached(self, sha256: str) -> Optional[str]:
+        """
+        Devuelve la ruta del driver en caché y actualiza su posición LRU.
+
+        Args:
+            sha256 (str): Hash del contenido del driver
+
+        Returns:
+            Optional[str]: Ruta al archivo o None si no está en caché
+        """
+        path = self._cache_path(sha256.lower())
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)  # El mtime marca el último uso
+        return path
+
+    async def fetch(self, url: str, expected_sha256: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Obtiene un driver desde la caché o lo descarga al disco.
+
+        Args:
+            url (str): URL de descarga del driver
+            expected_sha256 (str, optional): Hash esperado enviado por el servidor
+
+        Returns:
+            Tuple[str, str]: Ruta del archivo en caché y su hash SHA-256
+
+        Raises:
+            Exception: Si la descarga falla o el hash no coincide
+        """
+        expected = expected_sha256.lower() if expected_sha256 else None
+        if expected:
+            cached = self.get_cached(expected)
+            if cached:
+                logger.info(f"📦 Driver {expected[:12]} encontrado en caché")
+                return cached, expected
+
+        key = expected or hashlib.sha256(url.encode()).hexdigest()
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            # Otra instalación concurrente pudo haberlo descargado mientras esperábamos
+            if expected:
+                cached = self.get_cached(expected)
+                if cached:
+                    return cached, expected
+
+            partial_path = os.path.join(self.partial_dir, f"{key}.part")
+            digest = None
+            for attempt in range(1, settings.DRIVER_DOWNLOAD_RETRIES + 1):
+                try:
+                    digest = await self._download(url, partial_path)
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"⚠️ Descarga interrumpida (intento {attempt}): {e}")
+                    if attempt == settings.DRIVER_DOWNLOAD_RETRIES:
+                        raise Exception(f"Error downloading driver: {e}")
+                    await asyncio.sleep(2 ** attempt)
+
+            with open(partial_path, 'rb') as f:
+                magic = f.read(4)
+            if magic != ZIP_MAGIC:
+                os.remove(partial_path)
+                raise Exception("El archivo descargado no es un ZIP válido")
+
+            if expected and digest != expected:
+                os.remove(partial_path)
+                raise Exception(
+                    f"Hash del driver no coincide (esperado {expected}, obtenido {digest})"
+                )
+
+            final_path = self._cache_path(digest)
+            os.replace(partial_path, final_path)
+            logger.info(f"✅ Driver guardado en caché: {final_path}")
+
+            self._evict(keep=final_path)
+            return final_path, digest
+
+    async def _download(self, url: str, partial_path: str) -> str:
+        """Descarga (o reanuda) el archivo en `partial_path` y devuelve su SHA-256."""
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        hasher = hashlib.sha256()
+        if offset:
+            # Rehashear el prefijo ya descargado fuera del event loop
+            loop = asyncio.get_running_loop()
+            hasher = await loop.run_in_executor(None, self._hash_file, partial_path)
+            logger.info(f"🔁 Reanudando descarga desde el byte {offset}")
+
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            logger.debug(f"Iniciando descarga desde: {url}")
+            async with session.get(url, headers=headers) as response:
+                if response.status == 416 and offset:
+                    # El parcial ya estaba completo; la verificación de hash decide
+                    return hasher.hexdigest()
+
+                if response.status == 206:
+                    mode = 'ab'
+                elif response.status == 200:
+                    if offset:
+                        logger.info("El servidor no soporta Range, descargando desde cero")
+                        hasher = hashlib.sha256()
+                    mode = 'wb'
+                else:
+                    raise Exception(f"Error downloading driver: {response.status}")
+
+                content_type = response.headers.get('Content-Type', '')
+                if 'application/zip' not in content_type.lower():
+                    logger.warning(f"Content-Type inesperado: {content_type}")
+
+                written = 0
+                with open(partial_path, mode) as f:
+                    async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+
+                logger.debug(f"Descargados {written} bytes")
+                return hasher.hexdigest()
+
+    def _hash_file(self, path: str):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher
+
+    def _evict(self, keep: str = None):
+        """Elimina los drivers menos usados hasta respetar el tamaño máximo."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.zip') and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                if self.on_evict:
+                    # Liberar también lo derivado del driver (extracción, metadatos)
+                    self.on_evict(os.path.basename(path)[:-len('.zip')])
+                logger.info(f"🧹 Driver eliminado de la caché: {os.path.basename(path)}")
+            except OSError as e:
+                logger.warning(f"No se pudo eliminar {path} de la caché: {e}")
@@ -0,0 +1,351 @@
+# agent/app/services/driver_package_service.py
+import asyncio
+import json
+import logging
+import os
+import platform
+import posixpath
+import re
+import shutil
+import subprocess
+import zipfile
+from typing import Any, Dict, List, Optional, Set
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Directivas de instalación de impresoras que apuntan a archivos concretos
+FILE_DIRECTIVES = ('driverfile', 'datafile', 'configfile', 'helpfile')
+SECTION_RE = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+STRING_RE = re.compile(r'%([^%]+)%')
+
+
+def _decode_inf(raw: bytes) -> str:
+    """Decodifica un INF respetando BOM UTF-16/UTF-8 y el ANSI de Windows."""
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return raw.decode('utf-16')
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return raw.decode('utf-8-sig')
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', errors='replace')
+
+
+def _strip_comment(line: str) -> str:
+    """Quita comentarios `;` que no estén dentro de comillas."""
+    in_quotes = False
+    for i, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ';' and not in_quotes:
+            return line[:i]
+    return line
+
+
+def parse_inf(text: str) -> Dict[str, Any]:
+    """
+    Analiza un archivo INF y obtiene sus metadatos y archivos referenciados.
+
+    Args:
+        text (str): Contenido del INF
+
+    Returns:
+        Dict[str, Any]: Proveedor, clase, versión, modelos y archivos referenciados
+    """
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for raw_line in text.splitlines():
+        line = _strip_comment(raw_line).strip()
+        if not line:
+            continue
+        match = SECTION_RE.match(line)
+        if match:
+            current = match.group(1).strip().lower()
+            sections.setdefault(current, [])
+        elif current is not None:
+            sections[current].append(line)
+
+    def split_entry(line: str):
+        key, sep, value = line.partition('=')
+        return key.strip().strip('"'), value.strip() if sep else None
+
+    strings = {}
+    for line in sections.get('strings', []):
+        key, value = split_entry(line)
+        if value is not None:
+            strings[key.lower()] = value.strip('"')
+
+    def resolve(value: str) -> str:
+        return STRING_RE.sub(lambda m: strings.get(m.group(1).lower(), m.group(0)), value)
+
+    version = {}
+    for line in sections.get('version', []):
+        key, value = split_entry(line)
+        if value is not None:
+            version[key.lower()] = resolve(value.strip('"'))
+
+    files: Set[str] = set()
+
+    # Catálogo firmado (CatalogFile, CatalogFile.NTamd64, ...)
+    for key, value in version.items():
+        if key.startswith('catalogfile') and value:
+            files.add(value)
+
+    # Archivos declarados en SourceDisksFiles[.arquitectura]
+    for name, lines in sections.items():
+        if name.startswith('sourcedisksfiles'):
+            for line in lines:
+                key, _ = split_entry(line)
+                if key:
+                    files.add(key)
+
+    # Secciones de instalación: CopyFiles y directivas de impresora
+    for lines in sections.values():
+        for line in lines:
+            key, value = split_entry(line)
+            if value is None:
+                continue
+            directive = key.lower()
+            if directive == 'copyfiles':
+                for item in value.split(','):
+                    item = item.strip()
+                    if not item:
+                        continue
+                    if item.startswith('@'):
+                        files.add(item[1:])
+                    else:
+                        for file_line in sections.get(item.lower(), []):
+                            file_name = file_line.split(',')[0].strip()
+                            if file_name:
+                                files.add(file_name)
+            elif directive in FILE_DIRECTIVES and value:
+                files.add(value.split(',')[0].strip())
+
+    # Modelos declarados por los fabricantes
+    models: List[str] = []
+    for line in sections.get('manufacturer', []):
+        _, value = split_entry(line)
+        if not value:
+            continue
+        parts = [p.strip() for p in value.split(',')]
+        base, decorations = parts[0], parts[1:]
+        for section_name in [base] + [f"{base}.{d}" for d in decorations if d]:
+            for model_line in sections.get(section_name.lower(), []):
+                model_name, _ = split_entry(model_line)
+                model_name = resolve(model_name)
+                if model_name and model_name not in models:
+                    models.append(model_name)
+
+    return {
+        'provider': version.get('provider'),
+        'class': version.get('class'),
+        'driver_ver': version.get('driverver'),
+        'models': models,
+        'files': sorted(resolve(f) for f in files)
+    }
+
+
+class DriverPackageService:
+    """
+    Prepara paquetes de drivers en una sola pasada.
+
+    Indexa el directorio central del ZIP, lee el INF directamente del
+    archivo y extrae solo el INF y los archivos que referencia. La
+    extracción y los metadatos analizados se guardan por hash del driver
+    para que instalaciones repetidas no vuelvan a descomprimir nada.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        base_dir = os.path.abspath(cache_dir or settings.DRIVER_CACHE_DIR)
+        self.extract_root = os.path.join(base_dir, 'extracted')
+        self.meta_root = os.path.join(base_dir, 'meta')
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(self.extract_root, exist_ok=True)
+        os.makedirs(self.meta_root, exist_ok=True)
+
+    async def prepare(self, zip_path: str, model: str, driver_hash: str = None,
+                      dest_dir: str = None) -> str:
+        """
+        Deja listo el INF adecuado para el modelo y devuelve su ruta.
+
+        Args:
+            zip_path (str): Ruta al ZIP del driver
+            model (str): Modelo de la impresora (para elegir entre varios INF)
+            driver_hash (str, optional): SHA-256 del ZIP; habilita la caché
+            dest_dir (str, optional): Directorio destino cuando no hay hash
+
+        Returns:
+            str: Ruta absoluta al archivo INF extraído
+        """
+        if not driver_hash:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._prepare_sync, zip_path, model, None, dest_dir)
+
+        lock = self._locks.setdefault(driver_hash, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self._prepare_sync, zip_path, model, driver_hash,
+                os.path.join(self.extract_root, driver_hash)
+            )
+
+    def get_metadata(self, driver_hash: str) -> Optional[Dict[str, Any]]:
+        """Devuelve los metadatos INF cacheados para un driver, si existen."""
+        if driver_hash in self._metadata:
+            return self._metadata[driver_hash]
+        meta_path = os.path.join(self.meta_root, f"{driver_hash}.json")
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    self._metadata[driver_hash] = json.load(f)
+                return self._metadata[driver_hash]
+            except (OSError, ValueError) as e:
+                logger.warning(f"Metadatos corruptos para {driver_hash}: {e}")
+        return None
+
+    def forget(self, driver_hash: str):
+        """Elimina la extracción y los metadatos de un driver desalojado de la caché."""
+        self._metadata.pop(driver_hash, None)
+        shutil.rmtree(os.path.join(self.extract_root, driver_hash), ignore_errors=True)
+        try:
+            os.remove(os.path.join(self.meta_root, f"{driver_hash}.json"))
+        except FileNotFoundError:
+            pass
+
+    def _prepare_sync(self, zip_path: str, model: str, driver_hash: Optional[str], dest_dir: str) -> str:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            metadata = self.get_metadata(driver_hash) if driver_hash else None
+            if metadata is None:
+                metadata = self._index_package(zip_ref)
+                if driver_hash:
+                    self._save_metadata(driver_hash, metadata)
+
+            inf = self._select_inf(metadata['infs'], model)
+            inf_path = os.path.join(dest_dir, *inf['arcname'].split('/'))
+
+            missing = [name for name in inf['extract'] if not os.path.exists(os.path.join(dest_dir, *name.split('/')))]
+            if missing:
+                logger.info(f"Extrayendo {len(missing)} archivos para {inf['name']} en {dest_dir}")
+                for name in missing:
+                    zip_ref.extract(name, dest_dir)
+            else:
+                logger.info(f"📦 Reutilizando extracción existente de {inf['name']}")
+
+        self._expand_compressed(os.path.dirname(inf_path))
+        logger.info(f"Usando archivo INF final: {inf_path}")
+        return inf_path
+
+    @staticmethod
+    def _expand_compressed(driver_dir: str):
+        """
+        Expande los `.dl_` (comprimidos de Windows) junto al INF.
+
+        Corre dentro de `prepare`, bajo el candado del hash, así que dos
+        instalaciones simultáneas del mismo driver no escriben los mismos
+        archivos; los ya expandidos en la caché no se repiten. Se expande a
+        un temporal y se renombra para no dar por bueno un archivo a medias.
+        """
+        if platform.system() != 'Windows':
+            return
+        for file in os.listdir(driver_dir):
+            if not file.endswith('.dl_'):
+                continue
+            expanded = os.path.join(driver_dir, file[:-1])
+            if os.path.exists(expanded):
+                continue
+            partial = f"{expanded}.part"
+            subprocess.run(
+                ['expand', os.path.join(driver_dir, file), partial],
+                check=True, capture_output=True, timeout=settings.INSTALL_STEP_TIMEOUT
+            )
+            os.replace(partial, expanded)
+            logger.info(f"Expandido {file} a {file[:-1]}")
+
+    def _index_package(self, zip_ref: zipfile.ZipFile) -> Dict[str, Any]:
+        """Indexa el directorio central y resuelve los archivos de cada INF."""
+        entries = [info for info in zip_ref.infolist() if not info.is_dir()]
+        by_basename: Dict[str, List[str]] = {}
+        for info in entries:
+            by_basename.setdefault(posixpath.basename(info.filename).lower(), []).append(info.filename)
+
+        infs = []
+        for info in entries:
+            if not info.filename.lower().endswith('.inf'):
+                continue
+            inf_dir = posixpath.dirname(info.filename)
+            parsed = parse_inf(_decode_inf(zip_ref.read(info)))
+            logger.info(f"Encontrado archivo INF: {info.filename} ({info.file_size} bytes)")
+
+            extract = {info.filename}
+            missing = []
+            wanted = list(parsed['files'])
+            stem = posixpath.splitext(posixpath.basename(info.filename))[0]
+            wanted.append(f"{stem}.ppd")  # CUPS usa el PPD hermano del INF
+            for file_name in wanted:
+                match = self._find_member(by_basename, inf_dir, file_name)
+                if match:
+                    extract.add(match)
+                elif not file_name.lower().endswith('.ppd'):
+                    missing.append(file_name)
+
+            if missing or not parsed['files']:
+                # INF que no podemos resolver por completo: extraer su carpeta
+                logger.warning(
+                    f"INF {info.filename} con {len(missing)} referencias sin resolver, "
+                    f"se extraerá su directorio completo"
+                )
+                prefix = f"{inf_dir}/" if inf_dir else ''
+                extract.update(e.filename for e in entries if e.filename.startswith(prefix))
+
+            infs.append({
+                'arcname': info.filename,
+                'name': posixpath.basename(info.filename),
+                'size': info.file_size,
+                'extract': sorted(extract),
+                **{k: parsed[k] for k in ('provider', 'class', 'driver_ver', 'models')}
+            })
+
+        if not infs:
+            logger.error("No se encontraron archivos .inf")
+            raise Exception("No se encontró archivo .inf en el driver descomprimido.")
+
+        return {'infs': infs}
+
+    @staticmethod
+    def _find_member(by_basename: Dict[str, List[str]], inf_dir: str, file_name: str) -> Optional[str]:
+        """Busca un archivo referenciado (o su versión comprimida `.xx_`) bajo la carpeta del INF."""
+        base = posixpath.basename(file_name.replace('\\', '/')).lower()
+        candidates = by_basename.get(base, []) + by_basename.get(base[:-1] + '_', [])
+        prefix = f"{inf_dir}/" if inf_dir else ''
+        scoped = [c for c in candidates if c.startswith(prefix)] or candidates
+        return min(scoped, key=len) if scoped else None
+
+    @staticmethod
+    def _select_inf(infs: List[Dict[str, Any]], model: str) -> Dict[str, Any]:
+        """Elige el INF más relevante: coincidencia con el modelo o el de mayor tamaño."""
+        if len(infs) == 1:
+            logger.info(f"Usando único archivo INF encontrado: {infs[0]['name']}")
+            return infs[0]
+
+        logger.info(f"Encontrados {len(infs)} archivos INF, buscando el más apropiado")
+        model_lower = (model or '').lower()
+        for inf in infs:
+            if model_lower and model_lower in inf['name'].lower():
+                logger.info(f"Seleccionado INF por coincidencia de modelo: {inf['name']}")
+                return inf
+
+        selected = max(infs, key=lambda x: x['size'])
+        logger.info(f"Seleccionado INF por tamaño: {selected['name']}")
+        return selected
+
+    def _save_metadata(self, driver_hash: str, metadata: Dict[str, Any]):
+        self._metadata[driver_hash] = metadata
+        meta_path = os.path.join(self.meta_root, f"{driver_hash}.json")
+        try:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            logger.warning(f"No se pudieron guardar metadatos de {driver_hash}: {e}")
@@ -83,19 +83,29 @@ class PrinterMonitorService:
             logger.debug(f"🔍 Request URL: {url}")
             logger.debug(f"🔑 Headers configurados: {headers}")
             
+            printers = []
+            params = {"limit": 500}
             async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    response_text = await response.text()
-                    logger.debug(f"📥 Respuesta ({response.status}): {response_text[:200]}...")
-                    
-                    if response.status == 200:
-                        printers = json.loads(response_text)
-                        logger.info(f"✅ Se obtuvieron {len(printers)} impresoras")
-                        logger.debug(f"📋 Lista de impresoras: {json.dumps(printers, indent=2)}")
-                        return printers
-                    else:
-                        logger.error(f"❌ Error {response.status}: {response_text}")
-                        return []
+                # Se pide paginado y se siguen los cursores de X-Next-Cursor
+                while True:
+                    async with session.get(url, headers=headers, params=params) as response:
+                        response_text = await response.text()
+                        logger.debug(f"📥 Respuesta ({response.status}): {response_text[:200]}...")
+
+                        if response.status != 200:
+                            logger.error(f"❌ Error {response.status}: {response_text}")
+                            return []
+
+                        printers.extend(json.loads(response_text))
+                        next_cursor = response.headers.get("X-Next-Cursor")
+
+                    if not next_cursor:
+                        break
+                    params = {"limit": 500, "cursor": next_cursor}
+
+            logger.info(f"✅ Se obtuvieron {len(printers)} impresoras")
+            logger.debug(f"📋 Lista de impresoras: {json.dumps(printers, indent=2)}")
+            return printers
 
         except json.JSONDecodeError as e:
             logger.error(f"❌ Error decodificando JSON: {str(e)}", exc_info=True)
@@ -632,9 +642,16 @@ class PrinterMonitorService:
                 ) as response:
                     response_text = await response.text()
                     
-                    if response.status == 200:
+                    if response.status in (200, 202):
                         logger.info(f"✅ Datos actualizados exitosamente para {ip}")
                         return True
+                    elif response.status == 429:
+                        # El servidor está saturado: el reporte se repite en el próximo ciclo
+                        logger.warning(
+                            f"⏳ Servidor ocupado, reporte de {ip} pospuesto "
+                            f"(Retry-After: {response.headers.get('Retry-After')})"
+                        )
+                        return False
                     else:
                         logger.error(f"❌ Error actualizando datos para {ip}")
                         logger.error(f"Status: {response.status}")
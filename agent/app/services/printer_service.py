@@ -1,131 +1,153 @@
 # agent/app/services/printer_service.py
 import os
+import asyncio
 import tempfile
 import zipfile
-import time
 import subprocess
 import platform
 import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from ..core.config import settings
+from .driver_package_service import DriverPackageService
+
+# Callback de progreso: (paso, mensaje) -> corrutina
+ProgressCallback = Callable[[str, str], Awaitable[None]]
+
+
+@dataclass
+class CommandResult:
+    returncode: int
+    stdout: str
+    stderr: str
+
 
 class PrinterService:
-    async def install(self, compressed_driver_path: str, printer_ip: str, manufacturer: str, model: str, driver_name: str = None):
+    def __init__(self):
+        self.driver_packages = DriverPackageService()
+        # Una instalación por impresora a la vez; distintas impresoras en paralelo
+        self._printer_locks: Dict[str, asyncio.Lock] = {}
+        self._install_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_INSTALLS)
+        # El almacén de drivers de Windows (pnputil/printui) no tolera escrituras concurrentes
+        self._driver_store_lock = asyncio.Lock()
+
+    async def _run(self, args: List[str], timeout: float = None, check: bool = False) -> CommandResult:
         """
-        Descomprime el archivo del driver e instala la impresora.
-        
+        Ejecuta un comando externo sin bloquear el event loop.
+
+        Args:
+            args (List[str]): Comando y argumentos
+            timeout (float, optional): Segundos máximos antes de matar el proceso
+            check (bool): Lanza CalledProcessError si el código de salida no es 0
+
+        Returns:
+            CommandResult: Código de salida y salidas decodificadas
+
+        Raises:
+            subprocess.TimeoutExpired: Si el comando supera el timeout
+            subprocess.CalledProcessError: Si `check` y el comando falla
+        """
+        timeout = timeout or settings.INSTALL_STEP_TIMEOUT
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(args, timeout)
+
+        result = CommandResult(
+            returncode=process.returncode,
+            stdout=stdout.decode(errors='replace'),
+            stderr=stderr.decode(errors='replace')
+        )
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, args, result.stdout, result.stderr)
+        return result
+
+    async def _powershell(self, command: str, check: bool = False, timeout: float = None) -> CommandResult:
+        return await self._run(['powershell', '-Command', command], timeout=timeout, check=check)
+
+    @staticmethod
+    async def _report(progress: Optional[ProgressCallback], step: str, message: str):
+        logging.info(message)
+        if progress:
+            try:
+                await progress(step, message)
+            except Exception as e:
+                logging.warning(f"No se pudo notificar el progreso: {e}")
+
+    async def install(self, compressed_driver_path: str, printer_ip: str, manufacturer: str, model: str,
+                      driver_name: str = None, driver_hash: str = None,
+                      progress: Optional[ProgressCallback] = None):
+        """
+        Prepara el driver (extracción selectiva) e instala la impresora.
+
         Args:
             compressed_driver_path (str): Ruta al archivo ZIP del driver
             printer_ip (str): IP de la impresora
             manufacturer (str): Fabricante de la impresora
             model (str): Modelo de la impresora
             driver_name (str, optional): Nombre del driver sin extensión
+            driver_hash (str, optional): SHA-256 del ZIP; reutiliza extracciones previas
+            progress (ProgressCallback, optional): Recibe cada paso de la instalación
         """
-        try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                logging.info(f"Extrayendo drivers en: {temp_dir}")
-                # Descomprimir el archivo ZIP
-                with zipfile.ZipFile(compressed_driver_path, 'r') as zip_ref:
-                    # Listar contenido antes de extraer
-                    contents = zip_ref.namelist()
-                    logging.debug(f"Contenido del ZIP: {contents}")
-                    zip_ref.extractall(temp_dir)
-
-                # Buscar archivos .inf de manera inteligente
-                inf_files = []
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        # Normalizar el nombre del archivo a minúsculas
-                        filename_lower = file.lower()
-                        if filename_lower.endswith('.inf'):
-                            full_path = os.path.join(root, file)
-                            inf_files.append({
-                                'path': full_path,
-                                'name': file,
-                                'size': os.path.getsize(full_path)
-                            })
-                            logging.info(f"Encontrado archivo INF: {file} ({os.path.getsize(full_path)} bytes)")
-
-                if not inf_files:
-                    logging.error("No se encontraron archivos .inf")
-                    raise Exception("No se encontró archivo .inf en el driver descomprimido.")
-
-                # Si hay múltiples archivos .inf, intentar encontrar el más relevante
-                selected_inf = None
-                if len(inf_files) > 1:
-                    logging.info(f"Encontrados {len(inf_files)} archivos INF, buscando el más apropiado")
-                    for inf in inf_files:
-                        # Priorizar archivos que contengan el modelo en el nombre
-                        if model.lower() in inf['name'].lower():
-                            selected_inf = inf
-                            logging.info(f"Seleccionado INF por coincidencia de modelo: {inf['name']}")
-                            break
-
-                    # Si no se encuentra por modelo, usar el más grande (suele ser el principal)
-                    if not selected_inf:
-                        selected_inf = max(inf_files, key=lambda x: x['size'])
-                        logging.info(f"Seleccionado INF por tamaño: {selected_inf['name']}")
-                else:
-                    selected_inf = inf_files[0]
-                    logging.info(f"Usando único archivo INF encontrado: {selected_inf['name']}")
+        lock = self._printer_locks.setdefault(printer_ip, asyncio.Lock())
+        if lock.locked():
+            await self._report(progress, 'queued', f"Instalación en curso para {printer_ip}, esperando turno")
 
-                inf_path = selected_inf['path']
-                logging.info(f"Usando archivo INF final: {inf_path}")
+        try:
+            async with lock, self._install_slots:
+                await self._report(progress, 'extract', f"Preparando driver para {manufacturer} {model}")
+                if driver_hash:
+                    inf_path = await self.driver_packages.prepare(compressed_driver_path, model, driver_hash)
+                    return await self._install_for_platform(inf_path, printer_ip, manufacturer, model, driver_name, progress)
 
-                # Instalar el driver según el sistema operativo
-                if platform.system() == 'Windows':
-                    return await self._install_windows(inf_path, printer_ip, manufacturer, model, driver_name)
-                else:
-                    return await self._install_linux(inf_path, printer_ip, manufacturer, model)
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    logging.info(f"Extrayendo drivers en: {temp_dir}")
+                    inf_path = await self.driver_packages.prepare(compressed_driver_path, model, dest_dir=temp_dir)
+                    return await self._install_for_platform(inf_path, printer_ip, manufacturer, model, driver_name, progress)
 
+        except zipfile.BadZipFile:
+            logging.error("El archivo proporcionado no es un archivo ZIP válido.")
+            return {
+                'success': False,
+                'message': "Error en instalación: el driver no es un archivo ZIP válido"
+            }
         except Exception as e:
             logging.error(f"Error installing printer: {str(e)}")
             return {
                 'success': False,
                 'message': f"Error en instalación: {str(e)}"
             }
-    async def _extract_driver(self, driver_data: bytes, temp_dir: str):
-        """
-        Descomprime el archivo de driver y busca el archivo .inf.
-        """
-        try:
-            # Guardar el archivo comprimido en un directorio temporal
-            zip_path = os.path.join(temp_dir, 'driver.zip')
-            with open(zip_path, 'wb') as f:
-                f.write(driver_data)
-
-            # Descomprimir el archivo
-            with zipfile.ZipFile(zip_path) as z:
-                z.extractall(temp_dir)
-                inf_files = [os.path.join(temp_dir, f) for f in z.namelist() if f.endswith('.inf')]
-                if not inf_files:
-                    raise Exception("No se encontró archivo .inf en el driver descomprimido.")
-                return inf_files[0]  # Retornar la ruta del primer archivo .inf encontrado
-        except zipfile.BadZipFile:
-            raise Exception("El archivo proporcionado no es un archivo ZIP válido.")
-        except Exception as e:
-            raise Exception(f"Error al descomprimir el archivo: {str(e)}")
 
-    async def _install_windows(self, inf_path: str, printer_ip: str, manufacturer: str, model: str, driver_name: str):
+    async def _install_for_platform(self, inf_path: str, printer_ip: str, manufacturer: str, model: str,
+                                    driver_name: str, progress: Optional[ProgressCallback] = None):
+        """Instala el driver según el sistema operativo."""
+        if platform.system() == 'Windows':
+            return await self._install_windows(inf_path, printer_ip, manufacturer, model, driver_name, progress)
+        return await self._install_linux(inf_path, printer_ip, manufacturer, model, progress)
+
+    async def _install_windows(self, inf_path: str, printer_ip: str, manufacturer: str, model: str,
+                               driver_name: str, progress: Optional[ProgressCallback] = None):
         try:
             logging.info(f"Instalando driver desde {inf_path}")
             logging.info(f"Usando nombre de driver: {driver_name}")
-                
-            # 1. Expandir archivos DLL
-            driver_dir = os.path.dirname(inf_path)
-            for file in os.listdir(driver_dir):
-                if file.endswith('.dl_'):
-                    original = os.path.join(driver_dir, file)
-                    expanded = os.path.join(driver_dir, file[:-1])
-                    subprocess.run(['expand', original, expanded], check=True)
-                    logging.info(f"Expandido {file} a {file[:-1]}")
-
-            # 2. Instalar el driver usando pnputil
-            logging.info("Instalando driver usando pnputil...")
-            subprocess.run(['pnputil', '-i', '-a', inf_path], check=True)
-
-            # 3. Instalar específicamente como driver de impresora
-            logging.info(f"Instalando driver de impresora: {driver_name}")
-            try:
-                subprocess.run([
+
+            # 1. Los .dl_ ya los expandió DriverPackageService.prepare
+            async with self._driver_store_lock:
+                # 2. Instalar el driver usando pnputil
+                await self._report(progress, 'driver_store', "Instalando driver usando pnputil...")
+                await self._run(['pnputil', '-i', '-a', inf_path], check=True)
+
+                # 3. Instalar específicamente como driver de impresora
+                await self._report(progress, 'printer_driver', f"Instalando driver de impresora: {driver_name}")
+                result = await self._run([
                     'rundll32',
                     'printui.dll,PrintUIEntry',
                     '/ia',
@@ -135,108 +157,85 @@ class PrinterService:
                     'x64',
                     '/f',
                     inf_path
-                ], check=True)
-            except subprocess.CalledProcessError:
-                logging.warning("Error en rundll32, continuando...")
+                ])
+                if result.returncode != 0:
+                    logging.warning("Error en rundll32, continuando...")
 
             # 4. Verificar la instalación del driver
-            time.sleep(5)
-            logging.info("Verificando instalación del driver...")
-            result = subprocess.run([
-                'powershell',
-                '-Command',
-                'Get-PrinterDriver | Select-Object Name, Manufacturer | Format-List'
-            ], capture_output=True, text=True)
+            await asyncio.sleep(5)
+            await self._report(progress, 'verify_driver', "Verificando instalación del driver...")
+            result = await self._powershell('Get-PrinterDriver | Select-Object Name, Manufacturer | Format-List')
             logging.info(f"Drivers instalados:\n{result.stdout}")
 
             # 5. Verificar y manejar el puerto TCP/IP
             port_name = f"IP_{printer_ip}"
-            logging.info(f"Verificando puerto TCP/IP: {port_name}")
-            check_port = subprocess.run([
-                'powershell',
-                '-Command',
-                f'Get-PrinterPort -Name "{port_name}" 2>$null'
-            ], capture_output=True, text=True)
+            await self._report(progress, 'port', f"Verificando puerto TCP/IP: {port_name}")
+            check_port = await self._powershell(f'Get-PrinterPort -Name "{port_name}" 2>$null')
 
             if "Name" in check_port.stdout:
                 logging.info("El puerto ya existe, verificando configuración...")
                 # Verificar si el puerto existente tiene la IP correcta
-                port_info = subprocess.run([
-                    'powershell',
-                    '-Command',
+                port_info = await self._powershell(
                     f'Get-PrinterPort -Name "{port_name}" | Select-Object PrinterHostAddress'
-                ], capture_output=True, text=True)
-                
+                )
+
                 current_ip = port_info.stdout.strip()
                 if printer_ip not in current_ip:
                     logging.info("La IP del puerto no coincide, eliminando y recreando...")
-                    subprocess.run([
-                        'powershell',
-                        '-Command',
-                        f'Remove-PrinterPort -Name "{port_name}"'
-                    ], check=True)
-                    time.sleep(2)
-                    subprocess.run([
-                        'powershell',
-                        '-Command',
-                        f'Add-PrinterPort -Name "{port_name}" -PrinterHostAddress "{printer_ip}"'
-                    ], check=True)
+                    await self._powershell(f'Remove-PrinterPort -Name "{port_name}"', check=True)
+                    await asyncio.sleep(2)
+                    await self._powershell(
+                        f'Add-PrinterPort -Name "{port_name}" -PrinterHostAddress "{printer_ip}"', check=True
+                    )
                 else:
                     logging.info("Puerto existente tiene la configuración correcta")
             else:
                 logging.info("Creando nuevo puerto TCP/IP...")
-                subprocess.run([
-                    'powershell',
-                    '-Command',
-                    f'Add-PrinterPort -Name "{port_name}" -PrinterHostAddress "{printer_ip}"'
-                ], check=True)
+                await self._powershell(
+                    f'Add-PrinterPort -Name "{port_name}" -PrinterHostAddress "{printer_ip}"', check=True
+                )
 
             # 6. Verificar y manejar la impresora
             printer_name = f"{manufacturer} {model}"
-            logging.info(f"Verificando si la impresora {printer_name} ya existe...")
-            check_printer = subprocess.run([
-                'powershell',
-                '-Command',
-                f'Get-Printer -Name "{printer_name}" 2>$null'
-            ], capture_output=True, text=True)
+            await self._report(progress, 'printer', f"Verificando si la impresora {printer_name} ya existe...")
+            check_printer = await self._powershell(f'Get-Printer -Name "{printer_name}" 2>$null')
 
             if "Name" in check_printer.stdout:
                 logging.info("La impresora ya existe, verificando configuración...")
                 # Obtener información de la impresora existente
-                printer_info = subprocess.run([
-                    'powershell',
-                    '-Command',
+                printer_info = await self._powershell(
                     f'Get-Printer -Name "{printer_name}" | Select-Object DriverName, PortName'
-                ], capture_output=True, text=True)
-                
+                )
+
                 # Si el driver o puerto no coinciden, eliminar y recrear
                 if driver_name not in printer_info.stdout or port_name not in printer_info.stdout:
                     logging.info("La configuración no coincide, eliminando y recreando la impresora...")
-                    subprocess.run([
-                        'powershell',
-                        '-Command',
-                        f'Remove-Printer -Name "{printer_name}"'
-                    ], check=True)
-                    time.sleep(2)
-                    subprocess.run([
-                        'powershell',
-                        '-Command',
-                        f'Add-Printer -Name "{printer_name}" -DriverName "{driver_name}" -PortName "{port_name}"'
-                    ], check=True)
+                    await self._powershell(f'Remove-Printer -Name "{printer_name}"', check=True)
+                    await asyncio.sleep(2)
+                    await self._powershell(
+                        f'Add-Printer -Name "{printer_name}" -DriverName "{driver_name}" -PortName "{port_name}"',
+                        check=True
+                    )
                 else:
                     logging.info("La impresora existente tiene la configuración correcta")
             else:
                 logging.info("Instalando nueva impresora...")
-                subprocess.run([
-                    'powershell',
-                    '-Command',
-                    f'Add-Printer -Name "{printer_name}" -DriverName "{driver_name}" -PortName "{port_name}"'
-                ], check=True)
+                await self._powershell(
+                    f'Add-Printer -Name "{printer_name}" -DriverName "{driver_name}" -PortName "{port_name}"',
+                    check=True
+                )
 
             return {
                 'success': True,
                 'message': f'Impresora {printer_name} instalada/actualizada correctamente'
             }
+        except subprocess.TimeoutExpired as e:
+            error_msg = f"Tiempo de espera agotado ({e.timeout}s) ejecutando {e.cmd[0]}"
+            logging.error(f"Error en instalación: {error_msg}")
+            return {
+                'success': False,
+                'message': f"Error en instalación: {error_msg}"
+            }
         except Exception as e:
             error_msg = str(e)
             logging.error(f"Error en instalación: {error_msg}")
@@ -244,13 +243,14 @@ class PrinterService:
                 'success': False,
                 'message': f"Error en instalación: {error_msg}"
             }
-    async def _install_linux(self, inf_path: str, printer_ip: str, manufacturer: str, model: str):
+    async def _install_linux(self, inf_path: str, printer_ip: str, manufacturer: str, model: str,
+                             progress: Optional[ProgressCallback] = None):
         """
         Realiza la instalación en sistemas Linux usando CUPS.
         """
         try:
             # 1. Verificar si CUPS está instalado
-            subprocess.run(['lpstat', '-v'], check=True, capture_output=True)
+            await self._run(['lpstat', '-v'], check=True)
 
             # 2. Generar un nombre único para la impresora
             printer_name = f"{manufacturer}_{model}".replace(' ', '_')
@@ -262,16 +262,17 @@ class PrinterService:
                 ppd_path = await self._convert_inf_to_ppd(inf_path)
 
             # 4. Agregar la impresora
-            subprocess.run([
+            await self._report(progress, 'printer', f"Agregando impresora {printer_name} a CUPS")
+            await self._run([
                 'lpadmin',
                 '-p', printer_name,
                 '-v', f"socket://{printer_ip}",
                 '-P', ppd_path,
                 '-E'  # Habilitar la impresora
-            ], check=True, capture_output=True, text=True)
+            ], check=True)
 
             # 5. Establecer como impresora predeterminada
-            subprocess.run(['lpoptions', '-d', printer_name], check=True, capture_output=True, text=True)
+            await self._run(['lpoptions', '-d', printer_name], check=True)
 
             return {
                 'success': True,
@@ -283,6 +284,11 @@ class PrinterService:
                 'success': False,
                 'message': f"Error en instalación Linux: {error_msg}"
             }
+        except subprocess.TimeoutExpired as e:
+            return {
+                'success': False,
+                'message': f"Error en instalación Linux: tiempo de espera agotado ({e.timeout}s) en {e.cmd[0]}"
+            }
 
     async def _convert_inf_to_ppd(self, inf_path: str) -> str:
         """
@@ -309,16 +315,16 @@ class PrinterService:
         """
         try:
             if platform.system() == 'Windows':
-                subprocess.run(['powershell', '-Command', f'Remove-Printer -Name "{printer_name}"'], check=True, capture_output=True, text=True)
+                await self._powershell(f'Remove-Printer -Name "{printer_name}"', check=True)
             else:
-                subprocess.run(['lpadmin', '-x', printer_name], check=True, capture_output=True, text=True)
+                await self._run(['lpadmin', '-x', printer_name], check=True)
 
             return {
                 'success': True,
                 'message': f'Impresora {printer_name} desinstalada correctamente'
             }
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr if e.stderr else str(e)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            error_msg = getattr(e, 'stderr', None) or str(e)
             return {
                 'success': False,
                 'message': f"Error en desinstalación: {error_msg}"
@@ -330,23 +336,21 @@ class PrinterService:
         """
         try:
             if platform.system() == 'Windows':
-                result = subprocess.run([
-                    'powershell',
-                    '-Command',
-                    'Get-Printer | Select-Object Name,DriverName,PortName | ConvertTo-Json'
-                ], check=True, capture_output=True, text=True)
+                result = await self._powershell(
+                    'Get-Printer | Select-Object Name,DriverName,PortName | ConvertTo-Json', check=True
+                )
                 return {
                     'success': True,
                     'printers': result.stdout
                 }
             else:
-                result = subprocess.run(['lpstat', '-p'], check=True, capture_output=True, text=True)
+                result = await self._run(['lpstat', '-p'], check=True)
                 return {
                     'success': True,
                     'printers': result.stdout
                 }
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr if e.stderr else str(e)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            error_msg = getattr(e, 'stderr', None) or str(e)
             return {
                 'success': False,
                 'message': f"Error listando impresoras: {error_msg}"
@@ -3,7 +3,7 @@ from fastapi import APIRouter
 from app.api.v1.endpoints import (
     agents, websocket, printers, drivers,
     tunnels, monitor_printers, printer_oids,
-    dashboard, auth, users, clients
+    dashboard, auth, users, clients, reports
 )
 
 # Main API router definition
@@ -81,4 +81,11 @@ api_router.include_router(
     printer_oids.router,
     prefix="/printer-oids",
     tags=["printer-oids"]
-)
\ No newline at end of file
+)
+
+# Report routes
+api_router.include_router(
+    reports.router,
+    prefix="/reports",
+    tags=["reports"]
+)
@@ -1,23 +1,62 @@
 # server/app/api/v1/endpoints/agents.py
-from typing import Dict
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.services.agent_service import AgentService
+from app.services.agent_rpc import AgentRPCError, agent_rpc
+from app.services.websocket_manager import AgentNotConnectedError
 from app.schemas.agent import AgentCreate, Agent, AgentUpdate, AgentsResponse
+from app.db.models import Agent as AgentModel
+from app.utils.pagination import (
+    PageParams, column_names, iter_keyset, ndjson_response, parse_fields, project, projected_response, row_to_dict
+)
 
 router = APIRouter()
 
+# Campos proyectables: los del esquema Agent que son columnas
+_AGENT_FIELDS = [name for name in Agent.model_fields if name in column_names(AgentModel)]
+
 @router.get("/", response_model=AgentsResponse)
-async def list_agents(db: Session = Depends(get_db)):
+async def list_agents(
+    response: Response,
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    format: Literal["json", "ndjson"] = "json",
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
     """
     Devuelve la lista de agentes y drivers en formato JSON.
+    Con `limit` o `cursor` se paginan por id (cursor en X-Next-Cursor); con `fields`
+    solo se leen esas columnas y con format=ndjson se exportan en streaming.
     Se realiza la conversión explícita de las instancias ORM a modelos Pydantic.
     """
     agent_service = AgentService(db)
-    agents = agent_service.get_all()  # Retorna una lista de instancias SQLAlchemy
+    selected = parse_fields(fields, _AGENT_FIELDS)
+
+    if format == "ndjson":
+        exported = selected or _AGENT_FIELDS
+        return ndjson_response(
+            iter_keyset(
+                lambda session: AgentService(session).list_query(project(AgentModel, exported)),
+                [AgentModel.id],
+                lambda row: (row.id,),
+                lambda row: row_to_dict(row, exported)
+            ),
+            filename="agents.ndjson"
+        )
+
+    columns = project(AgentModel, selected) if selected else None
+    agents = page.apply(agent_service.list_query(columns), AgentModel.id).all()
+    agents = page.finish(agents, response, key=lambda row: (row.id,))
     drivers = await agent_service.get_drivers()  # Actualmente retorna una lista vacía o la lógica que implementes
 
+    if selected:
+        return projected_response(
+            {"agents": [row_to_dict(row, selected) for row in agents], "drivers": drivers}, response
+        )
+
     # Convertir cada agente a un modelo Pydantic usando model_validate en lugar de from_orm
     agents_data = [Agent.model_validate(agent) for agent in agents]
     return AgentsResponse(agents=agents_data, drivers=drivers)
@@ -74,6 +113,32 @@ async def get_agent(agent_id: int, db: Session = Depends(get_db)):
     
     return Agent.model_validate(agent)
 
+@router.post("/{agent_id}/scan")
+async def scan_agent_network(
+    agent_id: int,
+    networks: List[Dict[str, Any]] = Body(default=[], embed=True),
+    timeout: float = Query(60, gt=0, le=600, description="Segundos máximos de espera"),
+    db: Session = Depends(get_db)
+):
+    """
+    Pide al agente un escaneo de impresoras y espera sus resultados.
+    Sin `networks` el agente escanea su red local.
+    """
+    agent = await AgentService(db).get_agent(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    try:
+        result = await agent_rpc.call(
+            agent.token, {"type": "scan_printers", "networks": networks}, timeout=timeout
+        )
+    except AgentNotConnectedError:
+        raise HTTPException(status_code=503, detail="Agent not connected")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"El agente no respondió en {timeout}s")
+    except AgentRPCError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"printers": result.get("printers", []), "timestamp": result.get("timestamp")}
+
 @router.post("/register", response_model=Agent)
 async def register_agent(data: AgentCreate, db: Session = Depends(get_db)):
     """
@@ -1,7 +1,7 @@
 # server/app/api/v1/endpoints/clients.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 from app.db.session import get_db
 from app.services.client_service import ClientService
 from app.schemas.client import (
@@ -11,31 +11,84 @@ from app.schemas.client import (
     ClientSearch,
     ClientDashboardStats
 )
-from app.db.models import ClientStatus
+from app.db.models import Client, ClientStatus
 from app.core.auth import get_current_active_user
+from app.core.config import settings
+from app.utils.pagination import (
+    NEXT_CURSOR_HEADER, PageParams, column_names, decode_cursor, encode_cursor, iter_keyset, ndjson_response,
+    parse_fields, project, projected_response, row_to_dict
+)
 
 router = APIRouter()
 
+# Campos proyectables: los de ClientResponse que son columnas
+_CLIENT_FIELDS = [name for name in ClientResponse.model_fields if name in column_names(Client)]
+
+
+def _search_page(
+    client_service: ClientService, term: str, limit: Optional[int], cursor: Optional[str], response: Response
+) -> List[Client]:
+    """
+    Página de resultados por relevancia; el cursor es (puntuación, id) del último.
+    Sin `limit` (ni cursor) se devuelven todas las coincidencias.
+    """
+    after = decode_cursor(cursor, 2) if cursor else None
+    if limit is None:
+        return [client for client, _ in client_service.search(term, after=after)]
+    results = client_service.search(term, limit=limit + 1, after=after)
+    if len(results) > limit:
+        results = results[:limit]
+        last_client, last_score = results[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor((last_score, last_client.id))
+    return [client for client, _ in results]
+
 @router.get("/", response_model=List[ClientResponse])
 async def get_all_clients(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_active_user),
     search: Optional[str] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    format: Literal["json", "ndjson"] = "json",
+    page: PageParams = Depends()
 ):
     """
-    Obtiene todos los clientes, con opción de filtrar por búsqueda o estado.
+    Obtiene los clientes, con opción de filtrar por búsqueda o estado.
+
+    Con `limit` o `cursor` se pagina por id (cursor en X-Next-Cursor); sin
+    ellos se devuelven todos. Con `fields` solo se leen y
+    devuelven esas columnas; con format=ndjson se exportan todos en streaming.
     Nota: No usamos 'await' porque los métodos del servicio son síncronos.
     """
     try:
         client_service = ClientService(db)
         if search:
-            clients = client_service.search_clients(search)
-        elif status:
-            clients = client_service.get_by_status(status)
-        else:
-            clients = client_service.get_all()
-        return clients
+            return _search_page(client_service, search, page.limit, page.cursor, response)
+
+        selected = parse_fields(fields, _CLIENT_FIELDS)
+
+        if format == "ndjson":
+            exported = selected or _CLIENT_FIELDS
+            return ndjson_response(
+                iter_keyset(
+                    lambda session: ClientService(session).list_query(status, project(Client, exported)),
+                    [Client.id],
+                    lambda row: (row.id,),
+                    lambda row: row_to_dict(row, exported)
+                ),
+                filename="clients.ndjson"
+            )
+
+        columns = project(Client, selected) if selected else None
+
+        rows = page.apply(client_service.list_query(status, columns), Client.id).all()
+        rows = page.finish(rows, response, key=lambda row: (row.id,))
+        if selected:
+            return projected_response([row_to_dict(row, selected) for row in rows], response)
+        return rows
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -135,14 +188,21 @@ async def delete_client(
 @router.get("/search/{search_term}", response_model=List[ClientResponse])
 async def search_clients(
     search_term: str,
+    response: Response,
+    limit: int = Query(settings.CLIENT_SEARCH_LIMIT, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_active_user)
 ):
-    """Busca clientes por término de búsqueda (síncrono)."""
+    """
+    Busca clientes por término (type-ahead), ordenados por relevancia y
+    tolerando errores de tipeo. Más resultados con el cursor de X-Next-Cursor.
+    """
     try:
         client_service = ClientService(db)
-        clients = client_service.search_clients(search_term)
-        return clients
+        return _search_page(client_service, search_term, limit, cursor, response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
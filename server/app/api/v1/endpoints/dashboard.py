@@ -7,13 +7,22 @@ from app.services.client_service import ClientService
 from app.services.agent_service import AgentService
 from app.services.tunnel_service import TunnelService
 from app.services.monitor_service import PrinterMonitorService
-from datetime import datetime, timedelta
+from datetime import datetime
+from app.core.cache import dashboard_cache
 import logging
 from typing import Dict, Any
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Valores de cada sección cuando su conteo falla
+_EMPTY_SECTIONS = {
+    "printers": {"total": 0, "online": 0, "offline": 0, "error": 0},
+    "clients": {"total": 0, "active": 0, "inactive": 0},
+    "agents": {"total": 0, "online": 0, "offline": 0},
+    "tunnels": {"total": 0, "active": 0}
+}
+
 @router.get("/stats")
 def get_dashboard_stats(
     request: Request,
@@ -21,101 +30,41 @@ def get_dashboard_stats(
 ) -> Dict[str, Any]:
     """
     Endpoint para obtener estadísticas del dashboard con manejo robusto de errores
-    
+
+    Los conteos salen de consultas agregadas (GROUP BY) y se sirven desde una
+    caché de pocos segundos que la ingesta invalida al cambiar un estado.
+
     Returns:
         Un diccionario con estadísticas de clientes, agentes, túneles e impresoras
     """
-    try:
-        # Servicios 
-        services = {
-            "client": ClientService(db),
-            "agent": AgentService(db),
-            "tunnel": TunnelService(db),
-            "printer": PrinterMonitorService(db)
-        }
+    cached = dashboard_cache.get("stats")
+    if cached is not None:
+        return cached
 
-        # Estructura de estadísticas predeterminada
-        stats = {
-            "printers": {
-                "total": 0,
-                "online": 0,
-                "offline": 0,
-                "error": 0,
-                "last_updated": datetime.now().isoformat()
-            },
-            "clients": {
-                "total": 0,
-                "active": 0,
-                "last_updated": datetime.now().isoformat()
-            },
-            "agents": {
-                "total": 0,
-                "online": 0,
-                "offline": 0,
-                "last_updated": datetime.now().isoformat()
-            },
-            "tunnels": {
-                "total": 0,
-                "active": 0,
-                "last_updated": datetime.now().isoformat()
-            }
+    try:
+        now = datetime.now().isoformat()
+        sections = {
+            "printers": PrinterMonitorService(db).count_by_status,
+            "clients": ClientService(db).count_by_status,
+            "agents": AgentService(db).count_by_status,
+            "tunnels": TunnelService(db).count_by_status
         }
 
-        # Obtener estadísticas de clientes
-        try:
-            clients = services["client"].get_all()
-            recent_threshold = datetime.now() - timedelta(days=30)
-            stats["clients"]["total"] = len(clients)
-            stats["clients"]["active"] = len([
-                c for c in clients 
-                if getattr(c, 'is_active', False) or 
-                   (getattr(c, 'created_at', datetime.min) > recent_threshold)
-            ])
-        except Exception as e:
-            logger.warning(f"Error en estadísticas de clientes: {str(e)}")
-
-        # Obtener estadísticas de agentes
-        try:
-            agents = services["agent"].get_all()
-            stats["agents"]["total"] = len(agents)
-            stats["agents"]["online"] = len([
-                a for a in agents 
-                if getattr(a, 'status', '').lower() == 'online'
-            ])
-            stats["agents"]["offline"] = stats["agents"]["total"] - stats["agents"]["online"]
-        except Exception as e:
-            logger.warning(f"Error en estadísticas de agentes: {str(e)}")
-
-        # Obtener estadísticas de túneles
-        try:
-            tunnels = services["tunnel"].get_all()
-            stats["tunnels"]["total"] = len(tunnels)
-            stats["tunnels"]["active"] = len([
-                t for t in tunnels 
-                if getattr(t, 'status', '').lower() == 'active'
-            ])
-        except Exception as e:
-            logger.warning(f"Error en estadísticas de túneles: {str(e)}")
-
-        # Obtener estadísticas de impresoras
-        try:
-            printers = services["printer"].get_all()
-            stats["printers"]["total"] = len(printers)
-            stats["printers"]["online"] = len([
-                p for p in printers 
-                if getattr(p, 'status', '').lower() == 'online'
-            ])
-            stats["printers"]["offline"] = len([
-                p for p in printers 
-                if getattr(p, 'status', '').lower() == 'offline'
-            ])
-            stats["printers"]["error"] = len([
-                p for p in printers 
-                if getattr(p, 'status', '').lower() == 'error'
-            ])
-        except Exception as e:
-            logger.warning(f"Error en estadísticas de impresoras: {str(e)}")
+        # Una sección que falla sale a ceros sin impedir las demás (el servicio
+        # ya hizo rollback), pero entonces el resultado no se cachea
+        stats = {}
+        failed = []
+        for name, count in sections.items():
+            try:
+                stats[name] = {**count(), "last_updated": now}
+            except SQLAlchemyError:
+                failed.append(name)
+                stats[name] = {**_EMPTY_SECTIONS[name], "last_updated": now}
 
+        if failed:
+            logger.warning(f"Estadísticas incompletas, no se cachean: {', '.join(failed)}")
+        else:
+            dashboard_cache.set("stats", stats)
         return stats
 
     except SQLAlchemyError as e:
@@ -129,4 +78,4 @@ def get_dashboard_stats(
         raise HTTPException(
             status_code=500, 
             detail="Error interno al procesar estadísticas"
-        )
\ No newline at end of file
+        )
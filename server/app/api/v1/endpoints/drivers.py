@@ -1,11 +1,11 @@
 # app/api/v1/endpoints/drivers.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.services.driver_service import DriverService
-from typing import List
+from typing import List, Optional, Tuple
 import os
-from fastapi.responses import FileResponse  # Agregar este import
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from app.core.config import settings
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
@@ -111,8 +111,41 @@ async def delete_driver(driver_id: int, db: Session = Depends(get_db)):
             content={"detail": f"Error al eliminar el driver: {str(e)}"},
             headers={"Content-Type": "application/json"}
         )
+def _parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Interpreta un encabezado `Range: bytes=inicio-[fin]` de un solo rango."""
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_str, _, end_str = range_header[len("bytes="):].partition("-")
+    try:
+        if not start_str:
+            # Sufijo: últimos N bytes
+            start, end = max(file_size - int(end_str), 0), file_size - 1
+        else:
+            start = int(start_str)
+            end = min(int(end_str), file_size - 1) if end_str else file_size - 1
+    except ValueError:
+        return None
+    if start > end or start >= file_size:
+        return None
+    return start, end
+
+def _iter_file_range(file_path: str, start: int, end: int, chunk_size: int = 1024 * 1024):
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
 @router.get("/agents/drivers/download/{driver_id}")  # Ruta exacta que coincide con la URL del agente
-async def download_driver_agent(driver_id: int, db: Session = Depends(get_db)):
+async def download_driver_agent(driver_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Descarga el archivo del driver. Soporta `Range` para que el agente
+    pueda reanudar descargas interrumpidas.
+    """
     try:
         driver_service = DriverService(db)
         driver = await driver_service.get_by_id(driver_id)
@@ -123,11 +156,35 @@ async def download_driver_agent(driver_id: int, db: Session = Depends(get_db)):
         file_path = os.path.join(settings.DRIVERS_STORAGE_PATH, driver.driver_filename)
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="Archivo del driver no encontrado")
+
+        file_size = os.path.getsize(file_path)
+        range_header = request.headers.get("range")
+        if range_header:
+            byte_range = _parse_byte_range(range_header, file_size)
+            if byte_range is None:
+                return Response(
+                    status_code=416,
+                    headers={"Content-Range": f"bytes */{file_size}"}
+                )
+            start, end = byte_range
+            return StreamingResponse(
+                _iter_file_range(file_path, start, end),
+                status_code=206,
+                media_type='application/zip',
+                headers={
+                    "Content-Range": f"bytes {start}-{end}/{file_size}",
+                    "Content-Length": str(end - start + 1),
+                    "Accept-Ranges": "bytes"
+                }
+            )
             
         return FileResponse(
             path=file_path,
             filename=driver.driver_filename,
-            media_type='application/zip'
+            media_type='application/zip',
+            headers={"Accept-Ranges": "bytes"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,67 +1,94 @@
 # server/app/api/v1/endpoints/monitor_printers.py
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 from app.db.models.printer import Printer
-from datetime import datetime
+from datetime import datetime, timedelta
+import math
 
 from app.db.session import get_db
 from app.services.monitor_service import PrinterMonitorService
+from app.services.ingestion_buffer import BufferFullError, ingestion_buffer
+from app.services.rollup_service import PrinterRollupService
 from app.core.logging import logger
+from app.utils.pagination import PageParams, column_names, iter_keyset, ndjson_response, parse_fields, project
+
+# Campos por defecto de GET /monitor/printers/ (los que consume el agente)
+_LIST_FIELDS = ["ip_address", "brand", "model", "name", "status", "client_id"]
+# Columnas pesadas que no se proyectan en listados
+_UNLISTED = {"printer_data", "critical_supplies"}
 
 router = APIRouter()
 
 # server/app/api/v1/endpoints/monitor_printers.py
 
-@router.post("/update", response_model=Dict[str, Any])
+@router.post("/update", response_model=Dict[str, Any], status_code=202)
 def update_printer_data(
     printer_data: Dict[str, Any],
-    agent_id: int,
-    db: Session = Depends(get_db)
-) -> Printer:
+    agent_id: int
+):
     """
-    Actualiza los datos de una impresora para un agente específico.
+    Acepta un reporte de monitoreo de un agente.
+
+    El reporte se escribe en segundo plano con el siguiente lote del buffer
+    de ingesta; si el buffer está lleno se responde 429 con Retry-After.
     """
     try:
-        logger.info(f"Iniciando creación/actualización de impresora con datos: {printer_data}")
-        
-        monitor_service = PrinterMonitorService(db)
-        printer = monitor_service.update_printer_data(
-            printer_data=printer_data,
-            agent_id=agent_id
-        )
-        
+        ingestion_buffer.submit(printer_data, agent_id)
         return {
-            "status": "success",
-            "printer_id": printer.id,
-            "message": "Impresora actualizada exitosamente"
+            "status": "accepted",
+            "message": "Reporte recibido"
         }
-        
+
     except ValueError as ve:
         logger.error(f"Error de validación: {str(ve)}")
         raise HTTPException(status_code=422, detail=str(ve))
-    except Exception as e:
-        logger.error(f"Error inesperado en update_printer_data: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    except BufferFullError as e:
+        logger.warning(f"Reporte rechazado: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(ingestion_buffer.flush_interval))}
+        )
+
+@router.get("/ingestion/metrics", response_model=Dict[str, Any])
+def get_ingestion_metrics():
+    """
+    Métricas del buffer de ingesta (reportes aceptados, combinados, rechazados y vaciados).
+    """
+    return ingestion_buffer.metrics()
 
 @router.get("/critical-supplies", response_model=List[Dict[str, Any]])
 def get_critical_supplies(
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Usar cursor"),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene impresoras con consumibles en estado crítico.
+    Obtiene impresoras con consumibles en estado crítico, ordenadas por el
+    consumible con menor porcentaje. Con `limit` o `cursor` se paginan por
+    (porcentaje, id), con el cursor siguiente en X-Next-Cursor.
     """
     try:
         monitor_service = PrinterMonitorService(db)
-        critical_printers = monitor_service.get_printers_with_critical_supplies()
+        critical_printers = monitor_service.get_printers_with_critical_supplies(
+            skip=skip, limit=page.fetch_limit, cursor=page.cursor
+        )
+        critical_printers = page.finish(
+            critical_printers, response, key=lambda row: (row.min_supply_percentage, row.id)
+        )
         return [
             {
                 "printer_id": printer.id,
                 "printer_name": printer.name,
-                "critical_supplies": printer.check_critical_supplies()
+                "min_supply_percentage": printer.min_supply_percentage,
+                "critical_supplies": printer.critical_supplies or []
             } 
             for printer in critical_printers
         ]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving critical supplies: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -81,6 +108,54 @@ def generate_printer_report(
         logger.error(f"Error generating printer report: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/counters/rollup", response_model=Dict[str, Any])
+def get_counter_rollup(
+    printer_ids: Optional[List[int]] = Query(None),
+    client_id: Optional[int] = None,
+    days: int = Query(30, ge=1, le=3660),
+    granularity: Optional[str] = Query(None, pattern="^(hour|day|month)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Páginas por periodo sumadas sobre varias impresoras (o las de un cliente).
+
+    - El nivel (hora, día, mes) se elige según `days` salvo que se indique `granularity`
+    """
+    try:
+        end = datetime.utcnow()
+        return PrinterRollupService(db).get_series(
+            start=end - timedelta(days=days),
+            end=end,
+            printer_ids=printer_ids,
+            client_id=client_id,
+            granularity=granularity
+        )
+    except Exception as e:
+        logger.error(f"Error obteniendo agregados de contadores: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{printer_id}/counters/history", response_model=Dict[str, Any])
+def get_printer_counter_history(
+    printer_id: int,
+    days: int = Query(30, ge=1, le=3660),
+    granularity: Optional[str] = Query(None, pattern="^(hour|day|month)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Histórico de páginas y toner de una impresora desde los agregados.
+    """
+    try:
+        end = datetime.utcnow()
+        return PrinterRollupService(db).get_series(
+            start=end - timedelta(days=days),
+            end=end,
+            printer_ids=[printer_id],
+            granularity=granularity
+        )
+    except Exception as e:
+        logger.error(f"Error obteniendo histórico de contadores de la impresora {printer_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/{printer_id}/history", response_model=Dict[str, List])
 def get_printer_history(
     printer_id: int, 
@@ -129,14 +204,14 @@ async def create_printer(
         logger.debug(f"Datos de impresora a crear: {printer_data}")
         
         try:
-            new_printer = monitor_service.update_printer_data(
+            new_printer_id = monitor_service.update_printer_data(
                 agent_id=form_data.get("agent_id", 1),
                 printer_data=printer_data
             )
             
             return {
                 "status": "success",
-                "printer_id": new_printer.id,
+                "printer_id": new_printer_id,
                 "message": "Impresora creada exitosamente"
             }
             
@@ -170,35 +245,51 @@ async def delete_printer(printer_id: int, db: Session = Depends(get_db)):
 
 @router.get("/", response_model=List[Dict[str, Any]])
 def get_printers(
+    response: Response,
     db: Session = Depends(get_db),
-    agent_id: Optional[int] = None
+    agent_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    format: Literal["json", "ndjson"] = "json",
+    page: PageParams = Depends()
 ):
     """
-    Obtiene todas las impresoras o las filtradas por agente.
+    Obtiene las impresoras, o las filtradas por agente.
+
+    Con `limit` o `cursor` se pagina por id y la página siguiente se pide con
+    el cursor de la cabecera X-Next-Cursor; con format=ndjson se exportan
+    todas en streaming, sin paginar.
     """
     try:
         logger.info(f"Obteniendo impresoras" + (f" para agente {agent_id}" if agent_id else ""))
-        
-        monitor_service = PrinterMonitorService(db)
-        query = db.query(Printer)
-        
-        if agent_id:
-            query = query.filter(Printer.agent_id == agent_id)
-            
-        printers = query.all()
-        
-        return [
-            {
-                "ip_address": printer.ip_address,
-                "brand": printer.brand or "",  # Asegurarse de que no sea None
-                "model": printer.model,
-                "name": printer.name,
-                "status": printer.status,
-                "client_id": printer.client_id
-            }
-            for printer in printers
-        ]
-        
+
+        selected = parse_fields(
+            fields, [name for name in column_names(Printer) if name not in _UNLISTED]
+        ) or _LIST_FIELDS
+
+        def build_query(session: Session):
+            query = session.query(Printer).with_entities(*project(Printer, selected))
+            if agent_id:
+                query = query.filter(Printer.agent_id == agent_id)
+            return query
+
+        def serialize(row) -> Dict[str, Any]:
+            item = {name: getattr(row, name) for name in selected}
+            if "brand" in item:
+                item["brand"] = item["brand"] or ""  # Asegurarse de que no sea None
+            return item
+
+        if format == "ndjson":
+            return ndjson_response(
+                iter_keyset(build_query, [Printer.id], lambda row: (row.id,), serialize),
+                filename="printers.ndjson"
+            )
+
+        rows = page.apply(build_query(db), Printer.id).all()
+        rows = page.finish(rows, response, key=lambda row: (row.id,))
+        return [serialize(row) for row in rows]
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo impresoras: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,11 @@
 #server\app\api\v1\endpoints\printer_oids.py
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.db.models.printer_oids import PrinterOIDs
 from app.services.printer_oids import PrinterOIDsService
+from app.utils.pagination import PageParams
 from app.schemas.printer_oids import (
     PrinterOIDsCreate,
     PrinterOIDsUpdate,
@@ -16,15 +17,18 @@ router = APIRouter()
 
 @router.get("/", response_model=List[PrinterOIDsResponse])
 def get_printer_oids(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    skip: int = Query(0, ge=0, deprecated=True, description="Usar cursor"),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db)
 ):
     """
-    Obtiene la lista de configuraciones de OIDs de impresoras.
+    Obtiene la lista de configuraciones de OIDs de impresoras. Con `limit` o
+    `cursor` se pagina por id (cursor de la página siguiente en X-Next-Cursor).
     """
     service = PrinterOIDsService(db)
-    return service.get_all(skip=skip, limit=limit)
+    rows = service.get_all(skip=skip, limit=page.fetch_limit, cursor=page.cursor)
+    return page.finish(rows, response, key=lambda row: (row.id,))
 
 @router.get("/{oid_id}", response_model=PrinterOIDsResponse)
 def get_printer_oids_by_id(
@@ -1,12 +1,19 @@
 # server/app/api/v1/endpoints/printers.py
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.services.driver_service import DriverService  # Actualizamos el import
-from app.api.v1.endpoints.websocket import manager
-from typing import List, Dict, Any
+from app.services.agent_rpc import AgentRPCError, agent_rpc
+from app.services.install_job_service import InstallJobService, build_install_payload, run_batch
+from typing import List, Dict, Any, Literal, Optional
+from app.db.models.client import Client
 from app.db.models.printer import Printer
-from pydantic import BaseModel
+from app.db.models.printer_driver import PrinterDriver
+from pydantic import BaseModel, Field
+from app.utils.pagination import PageParams, iter_keyset, ndjson_response, parse_fields
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,52 +22,132 @@ class PrinterInstallRequest(BaseModel):
     printer_ip: str
     driver_id: int
 
+class BulkInstallTarget(BaseModel):
+    agent_token: str
+    printer_ip: str
+
+class BulkInstallRequest(BaseModel):
+    driver_id: int
+    targets: List[BulkInstallTarget] = Field(..., min_length=1)
+    concurrency: int = Field(20, ge=1, le=200)
+    max_attempts: int = Field(3, ge=1, le=10)
+    timeout: int = Field(900, ge=30)  # segundos por intento
+
 router = APIRouter()
 
+@router.post("/install/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_install_printers(
+    install_data: BulkInstallRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Crea un lote de instalación y lo despliega en paralelo a todos los agentes.
+    El progreso se consulta en GET /install/bulk/{batch_id}.
+    """
+    try:
+        batch = await InstallJobService(db).create_batch(
+            install_data.driver_id,
+            [target.model_dump() for target in install_data.targets]
+        )
+        background_tasks.add_task(
+            run_batch,
+            batch["batch_id"],
+            batch["driver_info"],
+            concurrency=install_data.concurrency,
+            max_attempts=install_data.max_attempts,
+            timeout=install_data.timeout
+        )
+        logger.info(f"Lote {batch['batch_id']} creado con {len(batch['job_ids'])} instalaciones")
+        return {
+            "status": "accepted",
+            "batch_id": batch["batch_id"],
+            "jobs": len(batch["job_ids"])
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creando lote de instalación: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/install/bulk/{batch_id}")
+async def get_bulk_install_status(
+    batch_id: str,
+    db: Session = Depends(get_db)
+):
+    """Estado del lote con el detalle por agente."""
+    return InstallJobService(db).get_batch(batch_id)
+
+
 @router.post("/install/{agent_token}")
 async def install_printer(
     agent_token: str,
     install_data: PrinterInstallRequest,
-    db: Session = Depends(get_db)
+    wait: bool = Query(False, description="Esperar el resultado de la instalación"),
+    timeout: float = Query(120, gt=0, le=900, description="Segundos máximos de espera con wait"),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Envía una instalación a un agente. Con `wait` responde con el resultado
+    del agente (o 504 si no llega a tiempo); sin él, en cuanto se envía.
+    """
     try:
         logger.debug(f"Datos recibidos: printer_ip='{install_data.printer_ip}' driver_id={install_data.driver_id}")
         
-        driver_service = DriverService(db)
-        
-        # Obtener información del driver
-        driver_info = await driver_service.get_driver_for_installation(install_data.driver_id)
-        logger.debug(f"Información del driver obtenida: {driver_info}")
-        
-        if not driver_info:
+        driver = await db.get(PrinterDriver, install_data.driver_id)
+        if not driver:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Driver no encontrado"
             )
+
+        # Obtener información del driver
+        driver_info = await DriverService.installation_info(driver)
+        logger.debug(f"Información del driver obtenida: {driver_info}")
         
         # Preparar datos de la impresora para el comando
-        printer_data = {
-            "printer_ip": install_data.printer_ip,
-            "manufacturer": driver_info["manufacturer"],
-            "model": driver_info["model"],
-            "driver_url": driver_info["download_url"],
-            "driver_filename": driver_info["driver_filename"]
-        }
+        printer_data = build_install_payload(driver_info, install_data.printer_ip)
         
         try:
+            command = {"type": "install_printer", **printer_data}
+            details = {
+                "printer_ip": install_data.printer_ip,
+                "driver": f"{driver_info['manufacturer']} {driver_info['model']}"
+            }
+            if wait:
+                result = await agent_rpc.call(agent_token, command, timeout=timeout)
+                return {
+                    "status": "success" if result.get("success") else "error",
+                    "message": result.get("message"),
+                    "details": details
+                }
+
             # Enviar comando al agente
-            await manager.send_install_printer_command(agent_token, printer_data)
+            request_id = await agent_rpc.notify(agent_token, command)
             logger.info(f"Comando de instalación enviado exitosamente al agente {agent_token}")
             
             return {
                 "status": "success",
                 "message": "Comando de instalación enviado correctamente",
-                "details": {
-                    "printer_ip": install_data.printer_ip,
-                    "driver": f"{driver_info['manufacturer']} {driver_info['model']}"
-                }
+                "request_id": request_id,
+                "details": details
             }
             
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"El agente no respondió en {timeout}s"
+            )
+
+        except AgentRPCError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"El agente devolvió un error: {e}"
+            )
+            
         except ValueError as ve:
             logger.error(f"Error de validación: {str(ve)}")
             raise HTTPException(
@@ -84,19 +171,17 @@ async def install_printer(
         )
 @router.get("/monitored", response_model=List[Dict[str, Any]])
 async def get_monitored_printers(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtiene la lista de impresoras configuradas para monitoreo.
     """
     try:
-        query = db.query(Printer).filter(
-            Printer.is_active == True
-        ).with_entities(
-            Printer.ip_address,
-            Printer.brand,
-            Printer.oid_config_id
-        ).all()
+        result = await db.execute(
+            select(Printer.ip_address, Printer.brand, Printer.oid_config_id)
+            .where(Printer.is_active == True)
+        )
+        query = result.all()
         
         printers = []
         for printer in query:
@@ -258,60 +343,119 @@ def get_printer_supplies(
         )
 
 
+_MONITOR_FIELDS = [
+    'id', 'name', 'brand', 'model', 'ip_address', 'status',
+    'client', 'has_alerts', 'supplies', 'counters'
+]
+# Campos que salen directamente de una columna
+_MONITOR_COLUMNS = {
+    'name': Printer.name,
+    'brand': Printer.brand,
+    'model': Printer.model,
+    'ip_address': Printer.ip_address,
+    'status': Printer.status,
+    # Columna indexada que mantiene la ingesta (refresh_supply_summary)
+    'has_alerts': Printer.has_critical_supplies.label('has_alerts'),
+}
+# Campos derivados de printer_data: solo con ellos se lee el JSON
+_MONITOR_DATA_FIELDS = {'supplies', 'counters'}
+
+
+def _monitor_columns(fields: List[str]) -> List[Any]:
+    """Columnas a seleccionar para `fields`; el id siempre, por el cursor."""
+    columns = [Printer.id] + [_MONITOR_COLUMNS[name] for name in fields if name in _MONITOR_COLUMNS]
+    if 'client' in fields:
+        columns.append(Client.name.label('client_name'))
+    if _MONITOR_DATA_FIELDS.intersection(fields):
+        columns.append(Printer.printer_data)
+    return columns
+
+
+def _monitor_query(query, fields: List[str]):
+    """Añade el join con el cliente solo si se pide (Query o Select)."""
+    query = query.select_from(Printer)
+    if 'client' in fields:
+        query = query.outerjoin(Client, Client.id == Printer.client_id)
+    return query
+
+
+def _monitor_item(row: Any, fields: List[str]) -> Dict[str, Any]:
+    item = {}
+    for name in fields:
+        if name == 'client':
+            item['client'] = row.client_name or 'Sin cliente'
+        elif name == 'has_alerts':
+            item['has_alerts'] = bool(row.has_alerts)
+        elif name not in _MONITOR_DATA_FIELDS:
+            item[name] = getattr(row, name)
+
+    if _MONITOR_DATA_FIELDS.intersection(fields):
+        printer_data = row.printer_data or {}
+        toners = printer_data.get('supplies', {}).get('toners', {})
+        derived = {
+            'supplies': {
+                'black': {'level': toners.get('black', {}).get('percentage', 0)},
+                'cyan': {'level': toners.get('cyan', {}).get('percentage', 0)},
+                'magenta': {'level': toners.get('magenta', {}).get('percentage', 0)},
+                'yellow': {'level': toners.get('yellow', {}).get('percentage', 0)}
+            },
+            'counters': {
+                'total': printer_data.get('counters', {}).get('total', 0)
+            }
+        }
+        item.update({name: derived[name] for name in fields if name in derived})
+
+    return {name: item[name] for name in fields}
+
+
 @router.get("/monitor", response_model=List[Dict[str, Any]])
-async def get_monitored_printers(
-    db: Session = Depends(get_db)
+async def get_monitor_printers(
+    response: Response,
+    fields: Optional[str] = Query(None, description=f"Campos separados por comas: {', '.join(_MONITOR_FIELDS)}"),
+    format: Literal["json", "ndjson"] = "json",
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obtiene la lista de impresoras para monitoreo con detalles completos.
+    Con `limit` o `cursor` se pagina por id (cursor en X-Next-Cursor); con
+    format=ndjson se exportan todas en streaming.
+
+    Solo se leen las columnas de los campos pedidos: printer_data únicamente
+    para supplies/counters y el cliente solo si se pide `client`.
     """
     try:
-        # Cargar impresoras con sus clientes
-        printers = db.query(Printer).options(joinedload(Printer.client)).all()
-        
-        processed_printers = []
-        for printer in printers:
+        selected = parse_fields(fields, _MONITOR_FIELDS) or _MONITOR_FIELDS
+        columns = _monitor_columns(selected)
+
+        def serialize(row: Any) -> Optional[Dict[str, Any]]:
             try:
-                printer_data = printer.printer_data or {}
-                supplies = printer_data.get('supplies', {})
-                toners = supplies.get('toners', {})
-                
-                printer_info = {
-                    'id': printer.id,
-                    'name': printer.name,
-                    'brand': printer.brand,
-                    'model': printer.model,
-                    'ip_address': printer.ip_address,
-                    'status': printer.status,
-                    'client': printer.client.name if printer.client else 'Sin cliente',
-                    'has_alerts': False,
-                    'supplies': {
-                        'black': {'level': toners.get('black', {}).get('percentage', 0)},
-                        'cyan': {'level': toners.get('cyan', {}).get('percentage', 0)},
-                        'magenta': {'level': toners.get('magenta', {}).get('percentage', 0)},
-                        'yellow': {'level': toners.get('yellow', {}).get('percentage', 0)}
-                    },
-                    'counters': {
-                        'total': printer_data.get('counters', {}).get('total', 0)
-                    }
-                }
-                
-                try:
-                    printer_info['has_alerts'] = bool(printer.check_critical_supplies())
-                except Exception as e:
-                    logger.warning(f"Error verificando suministros críticos para impresora {printer.id}: {e}")
-
-                processed_printers.append(printer_info)
-                
+                return _monitor_item(row, selected)
             except Exception as e:
-                logger.error(f"Error procesando impresora {printer.id}: {str(e)}")
-                continue
+                logger.error(f"Error procesando impresora {row.id}: {str(e)}")
+                return None
 
-        return processed_printers
-        
+        if format == "ndjson":
+            items = iter_keyset(
+                lambda session: _monitor_query(session.query(*columns), selected),
+                [Printer.id], lambda row: (row.id,), serialize
+            )
+            return ndjson_response(
+                (item for item in items if item is not None),
+                filename="printers-monitor.ndjson"
+            )
+
+        result = await db.execute(page.apply(_monitor_query(select(*columns), selected), Printer.id))
+        rows = page.finish(result.all(), response, key=lambda row: (row.id,))
+
+        processed_printers = [serialize(row) for row in rows]
+        return [item for item in processed_printers if item is not None]
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo impresoras monitoreadas: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,87 @@
+# server/app/api/v1/endpoints/reports.py
+from datetime import datetime
+from typing import Any, Dict, Optional
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.db.session import SessionLocal
+from app.schemas.report import BillingReportRequest
+from app.services.report_service import (
+    BillingReportService, ReportStatus, create_billing_job, csv_chunks,
+    get_job, job_file, run_billing_job
+)
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+@router.post("/billing", status_code=status.HTTP_202_ACCEPTED)
+def create_billing_report(
+    request: BillingReportRequest,
+    background_tasks: BackgroundTasks
+) -> Dict[str, Any]:
+    """
+    Encola un informe de páginas por cliente e impresora para el periodo indicado.
+    El estado se consulta en /reports/billing/{job_id}.
+    """
+    job = create_billing_job(request.start, request.end, request.client_id, request.format)
+    background_tasks.add_task(run_billing_job, job['id'])
+    logger.info(f"Informe de facturación {job['id']} encolado ({request.start} - {request.end})")
+    return job
+
+
+@router.get("/billing/export")
+def export_billing_csv(
+    start: datetime,
+    end: datetime,
+    client_id: Optional[int] = None
+):
+    """
+    Informe de facturación en CSV generado en streaming, sin job intermedio.
+    """
+    if end <= start:
+        raise HTTPException(status_code=422, detail="end debe ser posterior a start")
+
+    def generate():
+        db = SessionLocal()
+        try:
+            yield from csv_chunks(BillingReportService(db).iter_rows(start, end, client_id))
+        finally:
+            db.close()
+
+    filename = f"facturacion_{start:%Y%m%d}_{end:%Y%m%d}.csv"
+    return StreamingResponse(
+        generate(),
+        media_type=_MEDIA_TYPES['csv'],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/billing/{job_id}")
+def get_billing_report(job_id: str) -> Dict[str, Any]:
+    """Estado de un informe de facturación."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    return job
+
+
+@router.get("/billing/{job_id}/download")
+def download_billing_report(job_id: str):
+    """Descarga el fichero de un informe terminado."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+    if job['status'] != ReportStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"El informe está en estado {job['status']}")
+
+    params = job['params']
+    filename = f"facturacion_{params['start'][:10]}_{params['end'][:10]}.{job['format']}"
+    return FileResponse(job_file(job), media_type=_MEDIA_TYPES[job['format']], filename=filename)
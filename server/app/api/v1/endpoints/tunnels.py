@@ -1,11 +1,15 @@
 # server/app/api/v1/endpoints/tunnels.py
-from fastapi import APIRouter, Depends, HTTPException, WebSocket
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket
 from typing import List
 from sqlalchemy.orm import Session
-from typing import Optional, Dict
+from typing import Literal, Optional, Dict
 from ....db.session import get_db
+from ....db.models.tunnel import Tunnel
 from ....services.tunnel_service import TunnelService
 from ....schemas.tunnel import TunnelCreate, TunnelResponse
+from ....utils.pagination import (
+    PageParams, column_names, iter_keyset, ndjson_response, parse_fields, project, projected_response, row_to_dict
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,11 +32,37 @@ async def close_tunnel(
 
 @router.get("/list")
 def list_tunnels(
+    response: Response,
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    format: Literal["json", "ndjson"] = "json",
+    page: PageParams = Depends(),
     db: Session = Depends(get_db)
 ):
-    """Lista todos los túneles activos."""
-    tunnel_service = TunnelService(db)
-    return tunnel_service.get_all()
+    """
+    Lista los túneles; con `limit` o `cursor`, paginados por id (cursor en
+    X-Next-Cursor). Con format=ndjson se exportan todos en streaming.
+    """
+    selected = parse_fields(fields, column_names(Tunnel))
+
+    if format == "ndjson":
+        exported = selected or column_names(Tunnel)
+        return ndjson_response(
+            iter_keyset(
+                lambda session: session.query(Tunnel).with_entities(*project(Tunnel, exported)),
+                [Tunnel.id],
+                lambda row: (row.id,),
+                lambda row: row_to_dict(row, exported)
+            ),
+            filename="tunnels.ndjson"
+        )
+
+    query = db.query(Tunnel)
+    if selected:
+        query = query.with_entities(*project(Tunnel, selected))
+    rows = page.finish(page.apply(query, Tunnel.id).all(), response, key=lambda row: (row.id,))
+    if selected:
+        return projected_response([row_to_dict(row, selected) for row in rows], response)
+    return rows
 @router.delete("/{tunnel_id}")
 async def close_tunnel(
     tunnel_id: str,
@@ -3,11 +3,15 @@ import sys
 import logging
 import traceback
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.services.agent_service import AgentService
 from app.db.models import Client
-from typing import Dict
+from app.services.websocket_manager import ws_manager
+from app.services.agent_rpc import agent_rpc
+from app.core.status_hub import TOPICS, agent_message_key, parse_filters, status_hub
+import json
 import base64
 
 # Configuración de logging
@@ -22,102 +26,6 @@ websocket_logger.addHandler(handler)
 
 router = APIRouter()
 
-class ConnectionManager:
-    def __init__(self):
-        self.agent_connections: Dict[str, WebSocket] = {}
-        self.status_connections: Dict[str, WebSocket] = {}
-        self.logger = logging.getLogger(__name__)
-
-    async def connect_agent(self, agent_token: str, websocket: WebSocket):
-        self.logger.info(f"Agent {agent_token} connecting...")
-        await websocket.accept()
-        self.agent_connections[agent_token] = websocket
-        self.logger.info(f"Agent {agent_token} connected successfully")
-
-    async def connect_status(self, websocket: WebSocket):
-        self.logger.info("Status connection attempt...")
-        await websocket.accept()
-        conn_id = id(websocket)
-        self.status_connections[conn_id] = websocket
-        self.logger.info(f"Status connection {conn_id} established")
-
-    def disconnect_agent(self, agent_token: str):
-        self.logger.info(f"Disconnecting agent {agent_token}")
-        if agent_token in self.agent_connections:
-            del self.agent_connections[agent_token]
-            self.logger.info(f"Agent {agent_token} disconnected")
-        else:
-            self.logger.warning(f"Agent {agent_token} not found in connections")
-
-    def disconnect_status(self, websocket: WebSocket):
-        conn_id = id(websocket)
-        self.logger.info(f"Disconnecting status connection {conn_id}")
-        if conn_id in self.status_connections:
-            del self.status_connections[conn_id]
-            self.logger.info(f"Status connection {conn_id} removed")
-        else:
-            self.logger.warning(f"Status connection {conn_id} not found")
-
-    async def broadcast_status(self, message: str):
-        self.logger.info(f"Broadcasting status: {message}")
-        for conn_id, connection in self.status_connections.items():
-            try:
-                await connection.send_text(message)
-                self.logger.debug(f"Message sent to connection {conn_id}")
-            except Exception as e:
-                self.logger.error(f"Error sending to connection {conn_id}: {e}")
-
-    async def send_install_printer_command(self, agent_token: str, printer_data: dict):
-        """
-        Envía comando de instalación de impresora a un agente específico.
-        
-        Args:
-            agent_token: Token del agente
-            printer_data: Diccionario con los datos de la impresora y el driver
-            
-        Raises:
-            ValueError: Si el agente no está conectado o los datos son inválidos
-            Exception: Para otros errores de comunicación
-        """
-        # Validar que el agente esté conectado
-        if agent_token not in self.agent_connections:
-            self.logger.error(f"Agent {agent_token} not connected")
-            raise ValueError(f"Agent {agent_token} not connected")
-            
-        websocket = self.agent_connections[agent_token]
-        
-        # Validar datos requeridos
-        required_fields = [
-            "printer_ip", "manufacturer", "model", 
-            "driver_url", "driver_filename"
-        ]
-        
-        missing_fields = [
-            field for field in required_fields 
-            if field not in printer_data
-        ]
-        
-        if missing_fields:
-            error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-            self.logger.error(error_msg)
-            raise ValueError(error_msg)
-            
-        # Crear el comando
-        command = {
-            "type": "install_printer",
-            **printer_data  # Incluir todos los datos de la impresora
-        }
-        
-        try:
-            self.logger.debug(f"Sending command to agent {agent_token}: {command}")
-            await websocket.send_json(command)
-            self.logger.info(f"Install printer command sent to agent {agent_token}")
-        except Exception as e:
-            error_msg = f"Error sending command to agent {agent_token}: {str(e)}"
-            self.logger.error(error_msg)
-            raise Exception(error_msg)
-
-manager = ConnectionManager()
 
 @router.websocket("/register")
 async def register_websocket(websocket: WebSocket, db: Session = Depends(get_db)):
@@ -213,12 +121,12 @@ async def register_websocket(websocket: WebSocket, db: Session = Depends(get_db)
             pass
 
 @router.websocket("/agent/{agent_token}")
-async def agent_websocket(websocket: WebSocket, agent_token: str, db: Session = Depends(get_db)):
+async def agent_websocket(websocket: WebSocket, agent_token: str, db: AsyncSession = Depends(get_async_db)):
     websocket_logger.info(f"Agent websocket connection request: {agent_token}")
     
     try:
         agent_service = AgentService(db)
-        agent = await agent_service.validate_agent(agent_token)
+        agent = await agent_service.validate_agent_async(agent_token)
         
         if not agent:
             websocket_logger.warning(f"Invalid agent token: {agent_token}")
@@ -226,19 +134,42 @@ async def agent_websocket(websocket: WebSocket, agent_token: str, db: Session =
             return
         
         websocket_logger.info(f"Agent validated: {agent_token}")
-        await manager.connect_agent(agent_token, websocket)
+        await websocket.accept()
+        connection = await ws_manager.connect(agent_token, websocket, agent_id=agent.id, client_id=agent.client_id)
         
         try:
             while True:
-                data = await websocket.receive_json()
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("bytes") is not None:
+                    # Frame de un túnel multiplexado
+                    await connection.mux.feed(message["bytes"])
+                    continue
+
+                data = json.loads(message["text"])
                 websocket_logger.info(f"Message from agent {agent_token}: {data}")
-                await manager.broadcast_status(f"Agent {agent_token}: {data}")
+                # Cualquier mensaje cuenta como latido (solo en memoria)
+                await agent_service.heartbeat(agent_token)
+                if data.get('type') == 'tunnel_stats':
+                    ws_manager.record_tunnel_report(agent_token, data.get('tunnels') or {})
+                if data.get('request_id'):
+                    # Respuesta o progreso de una petición (puede ser de otro nodo)
+                    await agent_rpc.handle_agent_message(data)
+                status_hub.publish(
+                    'agent_message',
+                    data,
+                    client_id=agent.client_id,
+                    agent_id=agent.id,
+                    printer_id=data.get('printer_id'),
+                    coalesce_key=agent_message_key(agent.id, data)
+                )
         except WebSocketDisconnect:
             websocket_logger.info(f"Agent {agent_token} disconnected")
-            manager.disconnect_agent(agent_token)
+            await ws_manager.disconnect(agent_token, websocket)
         except Exception as e:
             websocket_logger.error(f"Error in agent websocket {agent_token}: {e}")
-            manager.disconnect_agent(agent_token)
+            await ws_manager.disconnect(agent_token, websocket)
             await websocket.close(code=4002)
     except Exception as e:
         websocket_logger.error(f"Critical error in agent_websocket: {e}")
@@ -246,19 +177,41 @@ async def agent_websocket(websocket: WebSocket, agent_token: str, db: Session =
 
 @router.websocket("/status")
 async def status_websocket(websocket: WebSocket):
+    """
+    Eventos de estado de agentes e impresoras.
+
+    Filtros opcionales por query (?client_id=1&agent_id=2&printer_id=3, cada
+    uno repetible) o en caliente con {"action": "subscribe", "client_id": [...], ...}.
+    """
     websocket_logger.info("Status websocket connection request")
     try:
-        await manager.connect_status(websocket)
+        await websocket.accept()
+        subscriber = status_hub.subscribe(websocket, parse_filters({
+            topic: websocket.query_params.getlist(topic) for topic in TOPICS
+        }))
         try:
             while True:
                 data = await websocket.receive_text()
                 websocket_logger.debug(f"Status message received: {data}")
+                try:
+                    request = json.loads(data)
+                except ValueError:
+                    continue
+                if isinstance(request, dict) and request.get('action') == 'subscribe':
+                    subscriber.filters = parse_filters({
+                        topic: request.get(topic) if isinstance(request.get(topic), list) else [request.get(topic)]
+                        for topic in TOPICS
+                    })
+                    # Por la cola del suscriptor: solo su tarea escribe en el websocket
+                    subscriber.offer(('subscribed',), json.dumps({"status": "subscribed", "filters": {
+                        topic: sorted(ids) for topic, ids in subscriber.filters.items()
+                    }}))
         except WebSocketDisconnect:
             websocket_logger.info("Status connection disconnected")
-            manager.disconnect_status(websocket)
+            status_hub.unsubscribe(websocket)
         except Exception as e:
             websocket_logger.error(f"Error in status websocket: {e}")
-            manager.disconnect_status(websocket)
+            status_hub.unsubscribe(websocket)
             await websocket.close(code=4001)
     except Exception as e:
         websocket_logger.error(f"Critical error in status_websocket: {e}")
@@ -16,6 +16,7 @@ from io import BytesIO
 from app.core.config import settings
 from app.services.user_service import UserService
 from app.db.session import get_db, SessionLocal
+from app.core.cache import user_cache
 from sqlalchemy.orm import Session
 import logging
 
@@ -135,6 +136,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
                     detail="Token inválido"
                 )
                 
+            # Principal cacheado por (username, iat): evita la consulta en cada petición
+            cache_key = (username, payload.get("iat"))
+            user = user_cache.get(cache_key)
+            if user is not None:
+                return user
+
             # Obtener usuario de la base de datos
             db = SessionLocal()
             try:
@@ -145,6 +152,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
                         status_code=401,
                         detail="Usuario no encontrado"
                     )
+                # Se cachea desacoplado de la sesión, solo con sus columnas cargadas
+                db.expunge(user)
+                user_cache.set(cache_key, user)
                 return user
             finally:
                 db.close()
@@ -155,7 +165,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
                 status_code=401,
                 detail="Token expirado"
             )
-        except jwt.JWTError as e:
+        except jwt.InvalidTokenError as e:
             logger.error(f"Error decodificando JWT: {str(e)}")
             raise HTTPException(
                 status_code=401,
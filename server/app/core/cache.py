@@ -0,0 +1,91 @@
+# server/app/core/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from app.core.config import settings
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    Caché en memoria con expiración por tiempo y tamaño máximo (LRU).
+
+    Es local a cada worker: sirve para datos que pueden quedar obsoletos
+    durante unos segundos y que se invalidan explícitamente al modificarse.
+
+    Args:
+        maxsize: Número máximo de entradas; al superarlo se descarta la menos usada
+        ttl: Segundos de vida de cada entrada
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Elimina las entradas cuya clave cumple `predicate`; devuelve cuántas."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Principales autenticados, por (username, iat del token)
+user_cache: TTLCache = TTLCache(maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def invalidate_user(username: str) -> int:
+    """Descarta todos los principales cacheados de un usuario."""
+    return user_cache.invalidate(lambda key: key[0] == username)
+
+
+# Estadísticas agregadas del dashboard (una sola entrada)
+dashboard_cache: TTLCache = TTLCache(maxsize=1, ttl=settings.DASHBOARD_CACHE_TTL)
+
+
+def invalidate_dashboard():
+    """Fuerza el recálculo de las estadísticas en la próxima consulta."""
+    dashboard_cache.clear()
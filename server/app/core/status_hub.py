@@ -0,0 +1,201 @@
+# server/app/core/status_hub.py
+import asyncio
+import itertools
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Dimensiones por las que un suscriptor puede filtrar
+TOPICS = ('client_id', 'agent_id', 'printer_id')
+
+
+def parse_filters(values: Dict[str, Iterable[Any]]) -> Dict[str, Set[int]]:
+    """
+    Normaliza filtros {topic: ids}; ignora topics desconocidos e ids no numéricos.
+    Un topic sin ids no filtra.
+    """
+    filters = {}
+    for topic in TOPICS:
+        ids = set()
+        for value in values.get(topic) or ():
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                continue
+        if ids:
+            filters[topic] = ids
+    return filters
+
+
+# Campos que identifican de qué entidad trata un mensaje de agente
+ENTITY_FIELDS = ('job_id', 'request_id', 'tunnel_id', 'printer_id', 'printer_ip')
+
+
+def agent_message_key(agent_id: int, data: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    Clave de coalescencia de un mensaje de agente: solo se sustituyen
+    mensajes del mismo agente, tipo y entidad (job, túnel, impresora...).
+    Los resultados de instalación no se coalescen.
+    """
+    message_type = data.get('type')
+    if message_type == 'installation_result':
+        return None
+    return ('agent', agent_id, message_type, *(data.get(field) for field in ENTITY_FIELDS))
+
+
+class Subscriber:
+    """
+    Conexión de estado con su cola acotada.
+
+    Si la cola está llena se descarta el mensaje más antiguo. Los mensajes
+    con la misma clave de coalescencia se sustituyen en su posición: al
+    consumidor lento le llega solo el último estado de cada entidad.
+    """
+
+    def __init__(self, websocket: WebSocket, filters: Dict[str, Set[int]], max_queue: int):
+        self.websocket = websocket
+        self.filters = filters
+        self.max_queue = max_queue
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def matches(self, topics: Dict[str, Optional[int]]) -> bool:
+        return all(topics.get(topic) in ids for topic, ids in self.filters.items())
+
+    def offer(self, key: Hashable, text: str):
+        if key in self._queue:
+            self._queue[key] = text
+            self.coalesced += 1
+        else:
+            if len(self._queue) >= self.max_queue:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            self._queue[key] = text
+        self._ready.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def run(self, send_timeout: float):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                _, text = self._queue.popitem(last=False)
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=send_timeout)
+                self.sent += 1
+
+
+class StatusHub:
+    """
+    Difusión de eventos de estado a los websockets de /ws/status.
+
+    Cada mensaje se serializa una sola vez y el mismo texto se encola en los
+    suscriptores cuyo filtro coincide. Cada suscriptor tiene su propia tarea
+    de envío, así que uno lento no retrasa a los demás ni a quien publica.
+    Un suscriptor que no acepta un envío en `send_timeout` se desconecta.
+    """
+
+    def __init__(self, max_queue: Optional[int] = None, send_timeout: Optional[float] = None):
+        self.max_queue = max_queue or settings.STATUS_QUEUE_SIZE
+        self.send_timeout = send_timeout or settings.STATUS_SEND_TIMEOUT
+        self._subscribers: Dict[int, Subscriber] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sequence = itertools.count()
+
+    def subscribe(self, websocket: WebSocket, filters: Optional[Dict[str, Set[int]]] = None) -> Subscriber:
+        """Registra un websocket ya aceptado y arranca su tarea de envío."""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(websocket, filters or {}, self.max_queue)
+        subscriber.task = asyncio.create_task(self._deliver(subscriber))
+        self._subscribers[id(websocket)] = subscriber
+        logger.info(f"Status subscriber {id(websocket)} registered (filters: {subscriber.filters})")
+        return subscriber
+
+    def unsubscribe(self, websocket: WebSocket):
+        subscriber = self._subscribers.pop(id(websocket), None)
+        if subscriber is None:
+            return
+        if subscriber.task and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        logger.info(
+            f"Status subscriber {id(websocket)} removed "
+            f"(sent={subscriber.sent}, dropped={subscriber.dropped}, coalesced={subscriber.coalesced})"
+        )
+
+    def publish(
+        self,
+        event_type: str,
+        data: Any,
+        client_id: Optional[int] = None,
+        agent_id: Optional[int] = None,
+        printer_id: Optional[int] = None,
+        coalesce_key: Optional[Hashable] = None
+    ) -> int:
+        """
+        Encola un evento para los suscriptores interesados. No espera envíos.
+
+        :param coalesce_key: Eventos con la misma clave se sustituyen en la
+            cola de un suscriptor lento (p. ej. el estado de una impresora)
+        :return: Número de suscriptores a los que se encoló
+        """
+        topics = {'client_id': client_id, 'agent_id': agent_id, 'printer_id': printer_id}
+        targets = [s for s in self._subscribers.values() if s.matches(topics)]
+        if not targets:
+            return 0
+
+        text = json.dumps({
+            'type': event_type,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            **topics,
+            'data': data
+        }, default=str)
+        key = coalesce_key if coalesce_key is not None else next(self._sequence)
+        for subscriber in targets:
+            subscriber.offer(key, text)
+        return len(targets)
+
+    def publish_threadsafe(self, event_type: str, data: Any, **kwargs):
+        """`publish` desde un hilo (servicios síncronos, threadpool)."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(lambda: self.publish(event_type, data, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'subscribers': len(self._subscribers),
+            'pending': sum(s.pending for s in self._subscribers.values()),
+            'sent': sum(s.sent for s in self._subscribers.values()),
+            'dropped': sum(s.dropped for s in self._subscribers.values()),
+            'coalesced': sum(s.coalesced for s in self._subscribers.values())
+        }
+
+    async def _deliver(self, subscriber: Subscriber):
+        try:
+            await subscriber.run(self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Status subscriber {id(subscriber.websocket)} dropped: {e!r}")
+            self.unsubscribe(subscriber.websocket)
+            try:
+                await subscriber.websocket.close(code=1011)
+            except Exception:
+                pass
+
+
+status_hub = StatusHub()
@@ -0,0 +1,56 @@
+# server/app/core/tasks.py
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTasks:
+    """
+    Registro de tareas periódicas que viven durante el ciclo de vida de la app.
+
+    Se registran con `add` al importar los servicios y el lifespan las arranca
+    con `start` y las detiene con `stop`.
+    """
+
+    def __init__(self):
+        self._specs: List[Tuple[str, float, Callable[[], Any]]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, func: Callable[[], Any]):
+        """
+        Registra una función a ejecutar cada `interval` segundos. Las async
+        corren en el event loop; las síncronas, en un hilo (asyncio.to_thread).
+        """
+        self._specs.append((name, interval, func))
+
+    def start(self):
+        for name, interval, func in self._specs:
+            self._tasks.append(asyncio.create_task(self._run(name, interval, func), name=name))
+            logger.info(f"⏱️ Tarea periódica '{name}' iniciada (cada {interval}s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    @staticmethod
+    async def _run(name: str, interval: float, func: Callable[[], Any]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if inspect.iscoroutinefunction(func):
+                    await func()
+                else:
+                    # Las síncronas (consultas, DDL) en un hilo: no bloquean el event loop
+                    await asyncio.to_thread(func)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error en tarea periódica '{name}': {e}")
+
+
+periodic_tasks = PeriodicTasks()
@@ -7,6 +7,15 @@ from sqlalchemy import inspect as sa_inspect
 metadata = MetaData()
 Base = declarative_base(metadata=metadata)
 
+@event.listens_for(Base.metadata, 'before_create')
+def create_extensions(target, connection, **kw):
+    # pg_trgm: índices trigram para las búsquedas de texto (clientes)
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        print(f"Error creando la extensión pg_trgm: {e}")
+
 @event.listens_for(Base.metadata, 'after_create')
 def sync_columns(target, connection, **kw):
     inspector = sa_inspect(connection)
@@ -24,13 +33,26 @@ def sync_columns(target, connection, **kw):
         model_columns = {col.name for col in table.columns}
         
         # Agregar columnas que faltan
+        added_columns = set()
         for col in model_columns - existing_columns:
             sql = text(f"ALTER TABLE {table_name} ADD COLUMN {col} {table.columns[col].type}")
             try:
                 connection.execute(sql)
+                added_columns.add(col)
                 print(f"Columna '{col}' agregada a la tabla '{table_name}'")
             except Exception as e:
                 print(f"Error agregando columna '{col}' a '{table_name}': {e}")
+
+        # Relleno de columnas derivadas en filas existentes (info['after_add_columns'] del modelo)
+        backfill = table.info.get('after_add_columns')
+        if added_columns and backfill:
+            try:
+                with connection.begin_nested():
+                    updated = backfill(connection, table, added_columns)
+                if updated:
+                    print(f"Columnas nuevas de '{table_name}' rellenadas en {updated} filas")
+            except Exception as e:
+                print(f"Error rellenando columnas nuevas de '{table_name}': {e}")
         
         # Eliminar columnas que ya no están en el modelo
         for col in existing_columns - model_columns:
@@ -42,6 +64,19 @@ def sync_columns(target, connection, **kw):
                 except Exception as e:
                     print(f"Error eliminando columna '{col}' de '{table_name}': {e}")
 
+        # Crear índices definidos en el modelo que aún no existen
+        existing_indexes = {idx['name'] for idx in inspector.get_indexes(table_name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                # Savepoint: un índice que falla no aborta el resto del create_all
+                with connection.begin_nested():
+                    index.create(bind=connection)
+                print(f"Índice '{index.name}' creado en la tabla '{table_name}'")
+            except Exception as e:
+                print(f"Error creando índice '{index.name}' en '{table_name}': {e}")
+
 
 class BaseModel(Base):
     __abstract__ = True
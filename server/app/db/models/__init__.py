@@ -1,18 +1,24 @@
 from .agent import Agent
+from .agent_route import AgentRoute
 from .client import Client, ClientType, ClientStatus  # Agregamos los enums
 from .printer import Printer  # Si existe este modelo
 from .printer_oids import PrinterOIDs  # Si existe este modelo
+from .printer_sample import PrinterSample
+from .printer_rollup import PrinterRollup
 from .printer_driver import PrinterDriver
 from .printer_job import PrinterJob
 from .tunnel import Tunnel
 
 __all__ = [
     'Agent',
+    'AgentRoute',
     'Client',
     'ClientType',     # Agregamos el enum de tipo
     'ClientStatus',   # Agregamos el enum de estado
     'Printer',
     'PrinterOIDs',
+    'PrinterSample',
+    'PrinterRollup',
     'PrinterDriver',
     'PrinterJob',
     'Tunnel'
@@ -0,0 +1,23 @@
+# server/app/db/models/agent_route.py
+from sqlalchemy import Column, String, DateTime, Index, func
+from app.db.base import Base
+
+
+class AgentRoute(Base):
+    """
+    Nodo (proceso del servidor) que tiene abierto el websocket de cada agente.
+
+    Lo mantiene PostgresCommandBackend: se escribe al conectar el agente, se
+    borra al desconectar y el dueño renueva `heartbeat_at` periódicamente.
+    Una ruta sin renovar más allá de AGENT_ROUTE_TTL es de un nodo caído.
+    """
+    __tablename__ = 'agent_routes'
+    __table_args__ = (
+        Index('ix_agent_routes_node_id', 'node_id'),
+    )
+
+    agent_token = Column(String, primary_key=True)
+    node_id = Column(String(32), nullable=False)
+    hostname = Column(String)
+    connected_at = Column(DateTime, server_default=func.now(), nullable=False)
+    heartbeat_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -1,7 +1,7 @@
 # server/app/db/models/client.py
 
 from app.db.base import BaseModel
-from sqlalchemy import Column, String, Boolean, DateTime, Text, Enum, Integer, TIMESTAMP
+from sqlalchemy import Column, String, Boolean, DateTime, Text, Enum, Integer, TIMESTAMP, Index, func
 from sqlalchemy.orm import relationship
 import uuid
 from datetime import datetime
@@ -13,6 +13,9 @@ class ClientType(str, enum.Enum):
     GOBIERNO = "gobierno"
     EDUCACION = "educacion"
 
+# Columnas por las que se busca un cliente (ClientService.search_clients)
+SEARCH_COLUMNS = ['name', 'business_name', 'tax_id', 'client_code', 'contact_email']
+
 class ClientStatus(str, enum.Enum):
     ACTIVO = "activo"
     INACTIVO = "inactivo"
@@ -112,4 +115,31 @@ class Client(BaseModel):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "contract_number": self.contract_number,
             "service_level": self.service_level
-        }
\ No newline at end of file
+        }
+
+
+def _search_document():
+    """
+    Los campos de búsqueda concatenados en un solo texto. El índice y las
+    consultas usan esta misma expresión. Solo referencia columnas de la
+    tabla (los literales van como parámetros): una literal_column sin tabla
+    impediría que el Index se asociara a `clients`.
+    """
+    columns = Client.__table__.c
+    document = None
+    for name in SEARCH_COLUMNS:
+        part = func.coalesce(columns[name], '')
+        document = part if document is None else document + ' ' + part
+    return document
+
+
+client_search_document = _search_document()
+
+# Índice trigram (requiere pg_trgm): sirve a ILIKE '%término%' y al operador
+# de similitud por palabras <% sin recorrer la tabla
+ix_clients_search_trgm = Index(
+    'ix_clients_search_trgm',
+    client_search_document.label('search_document'),
+    postgresql_using='gin',
+    postgresql_ops={'search_document': 'gin_trgm_ops'}
+)
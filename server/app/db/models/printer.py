@@ -1,11 +1,86 @@
 # server/app/db/models/printer.py
 from app.db.base import BaseModel
-from sqlalchemy import Column, String, Boolean, ForeignKey, JSON, Integer, DateTime
+from sqlalchemy import Column, String, Boolean, ForeignKey, JSON, Integer, DateTime, Index, bindparam, select
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Umbrales (%) por debajo de los cuales un consumible se considera crítico
+TONER_CRITICAL_PERCENTAGE = 10
+SUPPLY_CRITICAL_PERCENTAGE = 15
+
+
+def _supply_entries(supplies: Dict[str, Any]):
+    """Recorre los consumibles como (tipo, datos, umbral), admitiendo grupos por color."""
+    for color, toner in (supplies.get('toners') or {}).items():
+        yield f'{color} toner', toner, TONER_CRITICAL_PERCENTAGE
+    for supply_type in ['drums', 'maintenance_kit', 'waste_toner_box']:
+        supply = supplies.get(supply_type)
+        if not isinstance(supply, dict):
+            continue
+        if 'percentage' in supply:
+            yield supply_type, supply, SUPPLY_CRITICAL_PERCENTAGE
+        else:
+            for color, item in supply.items():
+                yield f'{color} {supply_type}', item, SUPPLY_CRITICAL_PERCENTAGE
+
+
+def summarize_supplies(printer_data: Optional[Dict[str, Any]]) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """
+    Calcula el porcentaje mínimo de consumibles y la lista de críticos.
+
+    :param printer_data: Datos reportados por el agente
+    :return: (porcentaje mínimo o None si no hay datos, consumibles críticos)
+    """
+    supplies = (printer_data or {}).get('supplies') or {}
+    minimum = None
+    critical = []
+    for supply_type, item, threshold in _supply_entries(supplies):
+        if not isinstance(item, dict) or not isinstance(item.get('percentage'), (int, float)):
+            continue
+        percentage = item['percentage']
+        minimum = percentage if minimum is None else min(minimum, percentage)
+        if percentage < threshold:
+            critical.append({
+                'type': supply_type,
+                'current_level': item.get('current_level', item.get('level')),
+                'percentage': percentage
+            })
+    return (int(minimum) if minimum is not None else None), critical
+
+
+SUPPLY_SUMMARY_COLUMNS = {'min_supply_percentage', 'has_critical_supplies', 'critical_supplies'}
+
+
+def backfill_supply_summary(connection, table, added_columns):
+    """
+    Rellena las columnas de resumen de consumibles en las impresoras que ya
+    existían cuando sync_columns las añadió. Solo ocurre una vez, al migrar;
+    después las mantiene refresh_supply_summary.
+    """
+    if not added_columns & SUPPLY_SUMMARY_COLUMNS:
+        return 0
+    params = []
+    for row in connection.execute(select(table.c.id, table.c.printer_data)):
+        minimum, critical = summarize_supplies(row.printer_data)
+        params.append({
+            'printer_id': row.id,
+            'min_supply_percentage': minimum,
+            'has_critical_supplies': bool(critical),
+            'critical_supplies': critical
+        })
+    if params:
+        connection.execute(table.update().where(table.c.id == bindparam('printer_id')), params)
+    return len(params)
+
 
 class Printer(BaseModel):
     __tablename__ = 'printers'
+    __table_args__ = (
+        # Consulta de consumibles críticos: filtro y orden resueltos por el índice
+        Index('ix_printers_critical_supplies', 'has_critical_supplies', 'min_supply_percentage', 'id'),
+        {'info': {'after_add_columns': backfill_supply_summary}}
+    )
     
     # Relaciones básicas
     client_id = Column(Integer, ForeignKey('clients.id'))
@@ -25,6 +100,11 @@ class Printer(BaseModel):
     status = Column(String, default='offline')
     is_active = Column(Boolean, default=True)
     last_check = Column(DateTime, nullable=True)
+
+    # Resumen de consumibles calculado en la ingesta (ver refresh_supply_summary)
+    min_supply_percentage = Column(Integer, nullable=True)
+    has_critical_supplies = Column(Boolean, default=False)
+    critical_supplies = Column(JSON, default=list)
     
     # Datos detallados reportados por el agente
     printer_data = Column(JSON, default={
@@ -144,14 +224,6 @@ class Printer(BaseModel):
         'errors': []
     })
     
-    # Historial de datos (últimos 100 registros)
-    data_history = Column(JSON, default={
-        'counters': [],
-        'supplies': [],
-        'errors': [],
-        'status_changes': []
-    })
-    
     # Relaciones
     client = relationship("Client", back_populates="printers")
     agent = relationship("Agent", back_populates="printers")
@@ -160,24 +232,12 @@ class Printer(BaseModel):
     def update_printer_data(self, data):
         """
         Actualiza todos los datos de la impresora de una sola vez.
+        El histórico se guarda aparte, en printer_samples.
         
         :param data: Diccionario completo con los datos de la impresora
         """
-        # Actualizar datos actuales
         self.printer_data = data
-        
-        # Registrar en histórico
-        for key in ['counters', 'supplies', 'errors']:
-            if key in data:
-                log_entry = {
-                    'timestamp': datetime.utcnow(),
-                    'data': data[key]
-                }
-                
-                # Añadir nueva entrada y mantener solo los últimos 100 registros
-                self.data_history[key].append(log_entry)
-                if len(self.data_history[key]) > 100:
-                    self.data_history[key] = self.data_history[key][-100:]
+        self.refresh_supply_summary()
         
         # Actualizar última verificación y estado
         self.last_check = datetime.utcnow()
@@ -190,28 +250,17 @@ class Printer(BaseModel):
         
         :return: Lista de consumibles en estado crítico
         """
-        critical_supplies = []
-        
-        # Verificar toners
-        for color, toner in self.printer_data['supplies']['toners'].items():
-            if toner['percentage'] < 10:
-                critical_supplies.append({
-                    'type': f'{color} toner',
-                    'current_level': toner['current_level'],
-                    'percentage': toner['percentage']
-                })
-        
-        # Verificar otros consumibles
-        for supply_type in ['drums', 'maintenance_kit', 'waste_toner_box']:
-            supply = self.printer_data['supplies'].get(supply_type)
-            if supply and supply['percentage'] < 15:
-                critical_supplies.append({
-                    'type': supply_type,
-                    'current_level': supply['current_level'],
-                    'percentage': supply['percentage']
-                })
-        
-        return critical_supplies
+        return summarize_supplies(self.printer_data)[1]
+
+    def refresh_supply_summary(self):
+        """
+        Recalcula las columnas indexadas de consumibles a partir de printer_data.
+        Debe llamarse cada vez que cambia printer_data.
+        """
+        minimum, critical = summarize_supplies(self.printer_data)
+        self.min_supply_percentage = minimum
+        self.critical_supplies = critical
+        self.has_critical_supplies = bool(critical)
     
     def to_dict(self):
         """Convierte el objeto a diccionario para serialización."""
@@ -227,7 +276,7 @@ class Printer(BaseModel):
             "is_active": self.is_active,
             "last_check": self.last_check,
             "printer_data": self.printer_data,
-            "critical_supplies": self.check_critical_supplies(),
+            "critical_supplies": self.critical_supplies or [],
             "client": self.client.to_dict() if self.client else None,
             "agent": self.agent.to_dict() if self.agent else None
         }
\ No newline at end of file
@@ -13,6 +13,8 @@ class PrinterJob(BaseModel):
     ip_address = Column(String, nullable=False)
     error_message = Column(String)
     installation_details = Column(JSON)
+    batch_id = Column(String, index=True)  # Lote de instalación masiva
+    attempts = Column(Integer, default=0)
     
     agent = relationship("Agent", back_populates="printer_jobs")
     printer_driver = relationship("PrinterDriver")
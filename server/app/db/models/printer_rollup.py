@@ -0,0 +1,35 @@
+# server/app/db/models/printer_rollup.py
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Index
+from app.db.base import Base
+
+
+class PrinterRollup(Base):
+    """
+    Agregado de muestras de una impresora por hora, día o mes.
+
+    Se actualiza de forma incremental con cada muestra (PrinterRollupService)
+    y permite consultar rangos largos sin leer printer_samples.
+    """
+    __tablename__ = 'printer_rollups'
+    __table_args__ = (
+        # Consultas de flota: todas las impresoras de un nivel en un rango
+        Index('ix_printer_rollups_granularity_bucket', 'granularity', 'bucket'),
+    )
+
+    printer_id = Column(Integer, ForeignKey('printers.id', ondelete='CASCADE'), primary_key=True)
+    granularity = Column(String(8), primary_key=True)  # 'hour', 'day' o 'month'
+    bucket = Column(DateTime, primary_key=True)        # Inicio del periodo (UTC)
+
+    # Páginas impresas en el periodo (suma de incrementos entre muestras)
+    total_pages_delta = Column(BigInteger, default=0, nullable=False)
+    color_pages_delta = Column(BigInteger, default=0, nullable=False)
+    bw_pages_delta = Column(BigInteger, default=0, nullable=False)
+
+    # Último valor de los contadores visto en el periodo
+    last_total_pages = Column(BigInteger)
+    last_color_pages = Column(BigInteger)
+    last_bw_pages = Column(BigInteger)
+
+    min_toner_percentage = Column(Integer)
+    sample_count = Column(Integer, default=0, nullable=False)
+    last_ts = Column(DateTime)
@@ -0,0 +1,30 @@
+# server/app/db/models/printer_sample.py
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, JSON
+from app.db.base import Base
+
+
+class PrinterSample(Base):
+    """
+    Muestra de monitoreo de una impresora (solo inserción).
+
+    La tabla está particionada por rango mensual sobre `ts`; las particiones
+    las crea y elimina PrinterSampleService según la retención configurada.
+    La clave primaria (printer_id, ts) es también el índice de las consultas
+    de histórico.
+    """
+    __tablename__ = 'printer_samples'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (ts)'}
+
+    printer_id = Column(Integer, ForeignKey('printers.id', ondelete='CASCADE'), primary_key=True)
+    ts = Column(DateTime, primary_key=True)
+    status = Column(String)
+
+    # Contadores extraídos para agregaciones y facturación
+    total_pages = Column(BigInteger)
+    color_pages = Column(BigInteger)
+    bw_pages = Column(BigInteger)
+    min_supply_percentage = Column(Integer)
+
+    # Datos tal como los reportó el agente
+    counters = Column(JSON)
+    supplies = Column(JSON)
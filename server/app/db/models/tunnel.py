@@ -12,6 +12,7 @@ class Tunnel(Base):
     remote_host = Column(String)
     remote_port = Column(Integer)
     local_port = Column(Integer)
+    mode = Column(String, default='ssh')  # 'ssh' o 'ws' (multiplexado por websocket)
     status = Column(String)  # 'creating', 'active', 'error', 'closed'
     description = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
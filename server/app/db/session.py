@@ -1,5 +1,7 @@
 # server/app/db/session.py
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 import psycopg2
@@ -27,12 +29,47 @@ def create_database():
         conn.close()
 
 create_database()
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url():
+    """Convierte DATABASE_URL al driver asyncpg y traslada sslmode a connect_args."""
+    url = make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg")
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None) or settings.DATABASE_CONNECT_DICT.get("sslmode")
+    query["prepared_statement_cache_size"] = str(settings.DB_STATEMENT_CACHE_SIZE)
+    connect_args = {"ssl": sslmode} if sslmode and sslmode != "disable" else {}
+    return url.set(query=query), connect_args
+
+
+_async_url, _async_connect_args = _async_database_url()
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Sesión asíncrona para rutas async: no bloquea el event loop en cada consulta."""
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
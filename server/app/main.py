@@ -1,24 +1,29 @@
 # server/main.py
 
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
 
 os.environ["STARLETTE_ENV_FILE"] = ""
 
 from app.core.config import settings
-from app.middleware.auth_middleware import auth_middleware
-from app.middleware.first_login_middleware import first_login_middleware
+from app.middleware.auth_middleware import AuthMiddleware
 from app.services.initial_setup import InitialSetupService
 from app.api.v1.api import api_router
-from app.db.session import engine, SessionLocal
+from app.db.session import async_engine, engine, SessionLocal
 from app.db.base import Base
+from app.core.tasks import periodic_tasks
+from app.services.tunnel_service import run_tunnel_sweep
+from app.services.sample_service import PrinterSampleService, run_sample_maintenance
+from app.services.ingestion_buffer import ingestion_buffer
+from app.services.websocket_manager import ws_manager
+from app.services.agent_service import run_agent_status_sweep, run_liveness_flush
+from app.services.install_job_service import fail_stale_jobs
+from app.services.report_service import run_report_maintenance
 
 # Logging setup
 logging.basicConfig(
@@ -27,15 +32,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Middleware para redirigir http -> https
-class ForceHttpsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        forwarded_proto = request.headers.get('x-forwarded-proto')
-        if forwarded_proto == 'http':
-            url = request.url.replace(scheme="https")
-            return Response(status_code=307, headers={"Location": str(url)})
-        return await call_next(request)
-
 # Preparar carpeta de almacenamiento
 os.makedirs(settings.DRIVERS_STORAGE_PATH, exist_ok=True)
 
@@ -46,13 +42,36 @@ async def lifespan(app: FastAPI):
     try:
         Base.metadata.create_all(bind=engine)
         await InitialSetupService.run_initial_setup(db)
+        PrinterSampleService(db).ensure_partitions()
+        # Lotes de instalación que quedaron a medias en el arranque anterior
+        fail_stale_jobs()
+        run_report_maintenance()
         logger.info("✅ Setup inicial completo")
     except Exception as e:
         logger.error(f"❌ Error al iniciar: {e}")
         raise
     finally:
         db.close()
+
+    periodic_tasks.add("tunnel_sweep", settings.TUNNEL_SWEEP_INTERVAL, run_tunnel_sweep)
+    periodic_tasks.add("sample_maintenance", settings.SAMPLE_MAINTENANCE_INTERVAL, run_sample_maintenance)
+    periodic_tasks.add("agent_liveness", settings.AGENT_LIVENESS_FLUSH_INTERVAL, run_liveness_flush)
+    periodic_tasks.add("agent_status_sweep", settings.AGENT_STATUS_SWEEP_INTERVAL, run_agent_status_sweep)
+    periodic_tasks.add("install_job_recovery", settings.INSTALL_JOB_HEARTBEAT_INTERVAL, fail_stale_jobs)
+    periodic_tasks.add("report_maintenance", settings.REPORT_MAINTENANCE_INTERVAL, run_report_maintenance)
+    await ws_manager.start()
+    periodic_tasks.start()
+    ingestion_buffer.start()
     yield
+    await ingestion_buffer.stop()
+    await periodic_tasks.stop()
+    # Últimos latidos aún en memoria
+    try:
+        await asyncio.to_thread(run_liveness_flush)
+    except Exception as e:
+        logger.error(f"❌ Error volcando latidos de agentes: {e}")
+    await ws_manager.stop()
+    await async_engine.dispose()
     logger.info("🛑 Aplicación finalizada")
 
 app = FastAPI(
@@ -60,21 +79,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Forzar HTTPS
-app.add_middleware(ForceHttpsMiddleware)
-
 # CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # En producción, restringe esto
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"]  # Cursor de la página siguiente en los listados
 )
 
-# Middlewares personalizados
-app.add_middleware(BaseHTTPMiddleware, dispatch=auth_middleware)
-app.add_middleware(BaseHTTPMiddleware, dispatch=first_login_middleware)
+# Preflight, HTTPS y autenticación (ASGI puro, el más externo)
+app.add_middleware(AuthMiddleware)
 
 # Rutas API
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,78 +1,110 @@
 # server/app/middleware/auth_middleware.py
-from fastapi import Request
-from fastapi.responses import JSONResponse, Response
 import logging
-import jwt
-from jose import JWTError
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import URL
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
 from app.core.auth import get_current_user
-from app.core.config import settings
+from app.utils.prefix_trie import PrefixTrie
 
 logger = logging.getLogger(__name__)
 
-async def auth_middleware(request: Request, call_next):
-    logger.debug(f"[AUTH] Iniciando middleware para ruta: {request.url.path}")
-
-    if request.method == "OPTIONS":
-        logger.debug("[AUTH] Solicitud OPTIONS permitida con headers explícitos")
-        return Response(
-            status_code=200,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "*",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
-
-    public_paths = [
-        "/api/v1/auth/login",
-        "/api/v1/auth/token",
-        "/api/v1/ws/agent",
-        "/api/v1/monitor/printers",
-        "/api/v1/printer-oids",
-        "/api/v1/agents/register",
-        "/api/v1/monitor/printers/update",
-        "/api/v1/agents/drivers/download",
-        "/api/v1/drivers/download",
-        "/favicon.ico",
-        "/static"
-    ]
-
-    if any(request.url.path.startswith(path) for path in public_paths):
-        logger.debug(f"[AUTH] Ruta pública permitida: {request.url.path}")
-        return await call_next(request)
-
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logger.warning(f"[AUTH] Token no proporcionado o formato inválido: {request.url.path}")
-        return JSONResponse(
-            status_code=401,
-            content={"detail": "Token no proporcionado o inválido"}
-        )
-
-    token = auth_header.split(" ")[1]
-
-    try:
-        current_user = await get_current_user(token)
-        request.state.user = current_user
-        logger.debug(f"[AUTH] Usuario autenticado: {current_user.username}")
-
-        if current_user.must_change_password and not request.url.path.startswith("/api/v1/auth/change-password"):
-            logger.warning(f"[AUTH] Usuario debe cambiar contraseña: {current_user.username}")
-            return JSONResponse(
-                status_code=403,
-                content={"detail": "Debe cambiar contraseña antes de continuar"}
-            )
+PUBLIC_PATHS = [
+    "/api/v1/auth/login",
+    "/api/v1/auth/token",
+    "/api/v1/ws/agent",
+    "/api/v1/monitor/printers",
+    "/api/v1/printer-oids",
+    "/api/v1/agents/register",
+    "/api/v1/monitor/printers/update",
+    "/api/v1/agents/drivers/download",
+    "/api/v1/drivers/download",
+    "/favicon.ico",
+    "/static"
+]
+
+CHANGE_PASSWORD_PATH = "/api/v1/auth/change-password"
+
+_PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "*",
+    "Access-Control-Allow-Headers": "*"
+}
+
+
+class AuthMiddleware:
+    """
+    Middleware ASGI único para las peticiones HTTP, en este orden:
+
+    1. OPTIONS: responde el preflight directamente.
+    2. HTTPS: redirige si el proxy indica que la petición llegó por http.
+    3. Rutas públicas: pasan sin autenticación.
+    4. Autenticación Bearer: deja el usuario en `request.state.user` y exige
+       el cambio de contraseña pendiente antes de cualquier otra ruta.
+
+    Al no envolver la respuesta, las respuestas en streaming (FileResponse)
+    y los websockets pasan tal cual a la aplicación.
+    """
 
-        return await call_next(request)
+    def __init__(self, app: ASGIApp, public_paths: Optional[Iterable[str]] = None):
+        self.app = app
+        self.public = PrefixTrie(PUBLIC_PATHS if public_paths is None else public_paths)
 
-    except jwt.ExpiredSignatureError:
-        logger.warning("[AUTH] Token expirado")
-        return JSONResponse(status_code=401, content={"detail": "Token expirado"})
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    except (jwt.InvalidTokenError, JWTError):
-        logger.warning("[AUTH] Token inválido")
-        return JSONResponse(status_code=401, content={"detail": "Token inválido"})
+        if scope["method"] == "OPTIONS":
+            await Response(status_code=200, headers=_PREFLIGHT_HEADERS)(scope, receive, send)
+            return
+
+        authorization = None
+        forwarded_proto = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value
+            elif name == b"x-forwarded-proto":
+                forwarded_proto = value
+
+        if forwarded_proto == b"http":
+            url = URL(scope=scope).replace(scheme="https")
+            await Response(status_code=307, headers={"Location": str(url)})(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if self.public.match(path):
+            await self.app(scope, receive, send)
+            return
+
+        response = await self._authenticate(scope, path, authorization)
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    async def _authenticate(self, scope: Scope, path: str, authorization: Optional[bytes]) -> Optional[Response]:
+        """Devuelve la respuesta de error, o None si la petición puede continuar."""
+        if not authorization or not authorization.startswith(b"Bearer "):
+            logger.warning(f"[AUTH] Token no proporcionado o formato inválido: {path}")
+            return JSONResponse(status_code=401, content={"detail": "Token no proporcionado o inválido"})
+
+        try:
+            current_user = await get_current_user(authorization[7:].decode("latin-1"))
+        except HTTPException as e:
+            logger.warning(f"[AUTH] {e.detail}: {path}")
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+        except Exception as e:
+            logger.error(f"[AUTH] Error inesperado: {e}")
+            return JSONResponse(status_code=500, content={"detail": "Error interno del servidor"})
+
+        scope.setdefault("state", {})["user"] = current_user
+
+        if current_user.must_change_password and not path.startswith(CHANGE_PASSWORD_PATH):
+            logger.warning(f"[AUTH] Usuario debe cambiar contraseña: {current_user.username}")
+            return JSONResponse(status_code=403, content={"detail": "Debe cambiar contraseña antes de continuar"})
 
-    except Exception as e:
-        logger.error(f"[AUTH] Error inesperado: {e}")
-        return JSONResponse(status_code=500, content={"detail": "Error interno del servidor"})
+        return None
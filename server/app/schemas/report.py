@@ -0,0 +1,16 @@
+# server/app/schemas/report.py
+from pydantic import BaseModel, model_validator
+from typing import Literal, Optional
+from datetime import datetime
+
+class BillingReportRequest(BaseModel):
+    start: datetime
+    end: datetime
+    client_id: Optional[int] = None
+    format: Literal['csv', 'xlsx'] = 'csv'
+
+    @model_validator(mode='after')
+    def check_period(self):
+        if self.end <= self.start:
+            raise ValueError("end debe ser posterior a start")
+        return self
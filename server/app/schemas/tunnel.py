@@ -1,25 +1,35 @@
 # server/app/schemas/tunnel.py
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, model_validator
+from typing import Literal, Optional
 from datetime import datetime
 
 class TunnelCreate(BaseModel):
     agent_id: int
-    ssh_host: str
+    # 'ssh': reenvío remoto por un servidor SSH; 'ws': streams multiplexados
+    # sobre el websocket del agente con listener local en este servidor
+    mode: Literal['ssh', 'ws'] = 'ssh'
+    ssh_host: Optional[str] = None
     ssh_port: int = 22
-    username: str
-    password: str
+    username: Optional[str] = None
+    password: Optional[str] = None
     remote_host: str
     remote_port: int
     local_port: int
     description: Optional[str] = None
 
+    @model_validator(mode='after')
+    def check_ssh_fields(self):
+        if self.mode == 'ssh' and not all([self.ssh_host, self.username, self.password]):
+            raise ValueError("ssh_host, username y password son obligatorios en modo ssh")
+        return self
+
 class TunnelResponse(BaseModel):
     id: int
     tunnel_id: str
     remote_host: str
     remote_port: int
     local_port: int
+    mode: Optional[str] = 'ssh'
     status: str
     description: Optional[str]
     created_at: datetime
@@ -0,0 +1,210 @@
+# server/app/services/agent_routing.py
+"""
+Enrutado de comandos a agentes entre nodos con PostgreSQL.
+
+Cada proceso del servidor es un nodo con un id aleatorio. Al conectarse un
+agente su nodo se registra en `agent_routes`; para enviarle un comando desde
+otro nodo se busca la ruta y se publica con NOTIFY en el canal del dueño,
+que lo recibe con LISTEN y lo entrega por el websocket.
+
+Para probarlo en local basta con varios workers sobre la misma base:
+
+    COMMAND_BUS_BACKEND=postgres uvicorn app.main:app --workers 4
+"""
+import asyncio
+import json
+import logging
+import socket
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.db.models.agent_route import AgentRoute
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services.websocket_manager import CommandBackend, Deliver, Reply
+
+logger = logging.getLogger(__name__)
+
+# Límite de NOTIFY: 8000 bytes de payload
+_MAX_PAYLOAD = 7900
+
+
+def _channel(node_id: str) -> str:
+    return f"agent_commands_{node_id}"
+
+
+def _payload(message: Dict[str, Any]) -> str:
+    payload = json.dumps(message, default=str)
+    if len(payload.encode()) > _MAX_PAYLOAD:
+        raise ValueError(f"Mensaje demasiado grande para NOTIFY ({len(payload)} bytes)")
+    return payload
+
+
+class PostgresCommandBackend(CommandBackend):
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.hostname = socket.gethostname()
+        self._deliver: Optional[Deliver] = None
+        self._reply: Optional[Reply] = None
+        self._listener = None          # Conexión asyncpg dedicada a LISTEN
+        self._listener_handle = None   # Conexión de SQLAlchemy que la contiene
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._owned: Set[str] = set()  # Agentes con websocket en este nodo
+        self._ttl = timedelta(seconds=settings.AGENT_ROUTE_TTL)
+
+    async def start(self, deliver: Deliver, reply: Reply):
+        self._deliver = deliver
+        self._reply = reply
+        await self._listen()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="agent_routes_heartbeat")
+        logger.info(f"🔀 Enrutado de comandos por PostgreSQL (nodo {self.node_id} en {self.hostname})")
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(AgentRoute).where(AgentRoute.node_id == self.node_id))
+            await db.commit()
+        await self._close_listener()
+
+    async def register(self, agent_token: str):
+        self._owned.add(agent_token)
+        try:
+            await self._upsert_routes([agent_token], reconnected=True)
+        except Exception as e:
+            # El siguiente heartbeat vuelve a escribir la ruta
+            logger.error(f"❌ Error registrando la ruta de {agent_token}: {e}")
+
+    async def unregister(self, agent_token: str):
+        self._owned.discard(agent_token)
+        # Solo si la ruta sigue siendo nuestra: el agente pudo reconectar a otro nodo
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(AgentRoute).where(
+                    AgentRoute.agent_token == agent_token,
+                    AgentRoute.node_id == self.node_id
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Error eliminando la ruta de {agent_token}: {e}")
+
+    async def _upsert_routes(self, agent_tokens, reconnected: bool = False):
+        if not agent_tokens:
+            return
+        stmt = insert(AgentRoute).values([
+            {'agent_token': token, 'node_id': self.node_id, 'hostname': self.hostname}
+            for token in sorted(agent_tokens)
+        ])
+        set_ = {
+            'node_id': stmt.excluded.node_id,
+            'hostname': stmt.excluded.hostname,
+            'heartbeat_at': func.now()
+        }
+        if reconnected:
+            set_['connected_at'] = func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=[AgentRoute.agent_token], set_=set_)
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def publish(self, agent_token: str, command: Dict[str, Any]) -> bool:
+        payload = _payload({'agent_token': agent_token, 'command': command})
+
+        async with AsyncSessionLocal() as db:
+            node_id = (await db.execute(
+                select(AgentRoute.node_id).where(
+                    AgentRoute.agent_token == agent_token,
+                    AgentRoute.node_id != self.node_id,
+                    AgentRoute.heartbeat_at > func.now() - self._ttl
+                )
+            )).scalar_one_or_none()
+            if node_id is None:
+                return False
+            await db.execute(select(func.pg_notify(_channel(node_id), payload)))
+            await db.commit()
+        logger.debug(f"Comando {command.get('type')} para {agent_token} reenviado al nodo {node_id}")
+        return True
+
+    async def publish_reply(self, node_id: str, message: Dict[str, Any]) -> bool:
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(func.pg_notify(_channel(node_id), _payload({'reply': message}))))
+            await db.commit()
+        return True
+
+    async def is_connected(self, agent_token: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(AgentRoute.agent_token).where(
+                    AgentRoute.agent_token == agent_token,
+                    AgentRoute.heartbeat_at > func.now() - self._ttl
+                )
+            )).first() is not None
+
+    async def connected_tokens(self) -> Set[str]:
+        async with AsyncSessionLocal() as db:
+            return set((await db.execute(
+                select(AgentRoute.agent_token).where(
+                    AgentRoute.node_id != self.node_id,
+                    AgentRoute.heartbeat_at > func.now() - self._ttl
+                )
+            )).scalars())
+
+    async def _listen(self):
+        # Conexión fuera del pool mientras dure: LISTEN está ligado a la sesión
+        self._listener_handle = await async_engine.connect()
+        raw = await self._listener_handle.get_raw_connection()
+        self._listener = raw.driver_connection
+        await self._listener.add_listener(_channel(self.node_id), self._on_notify)
+
+    async def _close_listener(self):
+        if self._listener_handle is not None:
+            try:
+                await self._listener.remove_listener(_channel(self.node_id), self._on_notify)
+            except Exception:
+                pass
+            try:
+                await self._listener_handle.close()
+            except Exception as e:
+                logger.debug(f"Error cerrando la conexión LISTEN: {e}")
+        self._listener = self._listener_handle = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        asyncio.get_running_loop().create_task(self._handle(payload))
+
+    async def _handle(self, payload: str):
+        try:
+            message = json.loads(payload)
+            if 'reply' in message:
+                await self._reply(message['reply'])
+                return
+            agent_token = message['agent_token']
+            if not await self._deliver(agent_token, message['command']):
+                logger.warning(f"Comando recibido para {agent_token}, que ya no está conectado a este nodo")
+        except Exception as e:
+            logger.error(f"❌ Error entregando comando reenviado: {e}")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.AGENT_ROUTE_HEARTBEAT)
+            try:
+                if self._listener is None or self._listener.is_closed():
+                    logger.warning("Conexión LISTEN perdida, reconectando")
+                    await self._close_listener()
+                    await self._listen()
+                # Renueva (o reescribe, si se perdieron) las rutas propias
+                await self._upsert_routes(set(self._owned))
+                async with AsyncSessionLocal() as db:
+                    # Rutas de nodos caídos
+                    await db.execute(delete(AgentRoute).where(
+                        AgentRoute.heartbeat_at < func.now() - self._ttl * 10
+                    ))
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error renovando rutas de agentes: {e}")
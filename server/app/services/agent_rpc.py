@@ -0,0 +1,142 @@
+# server/app/services/agent_rpc.py
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.services.websocket_manager import WebSocketManager, ws_manager
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class AgentRPCError(Exception):
+    """El agente respondió con un mensaje de tipo `error`."""
+
+
+def is_final(message: Dict[str, Any]) -> bool:
+    """Si un mensaje del agente cierra la petición (el resto son progreso)."""
+    message_type = message.get('type')
+    if message_type == 'installation_progress':
+        return False
+    if message_type == 'tunnel_status':
+        return message.get('status') != 'starting'
+    return True
+
+
+class AgentRPC:
+    """
+    Peticiones a agentes con respuesta.
+
+    Cada comando lleva un `request_id` "<nodo>:<uuid>" que el agente repite en
+    sus mensajes de progreso y en el resultado. El futuro vive en el nodo que
+    hizo la petición; si la respuesta llega por el websocket de otro nodo, el
+    backend del bus se la reenvía.
+
+    Por agente se permiten AGENT_RPC_CONCURRENCY peticiones en curso; el
+    tiempo de espera por un hueco cuenta dentro del `timeout` de la petición.
+    El semáforo de un agente se descarta en cuanto no le quedan peticiones
+    en curso ni en espera (agente desconectado o inactivo).
+    """
+
+    def __init__(self, manager: WebSocketManager, max_concurrency: Optional[int] = None):
+        self.manager = manager
+        self.max_concurrency = max_concurrency or settings.AGENT_RPC_CONCURRENCY
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._progress: Dict[str, ProgressCallback] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._slot_users: Dict[str, int] = {}
+        manager.reply_handler = self._resolve
+
+    async def call(
+        self,
+        agent_token: str,
+        command: Dict[str, Any],
+        timeout: float,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Envía `command` y espera su mensaje final.
+
+        Raises:
+            AgentNotConnectedError: Si el agente no está conectado
+            AgentRPCError: Si el agente responde con un error
+            asyncio.TimeoutError: Si no hay respuesta en `timeout` segundos
+        """
+        request_id = f"{self.manager.bus.backend.node_id}:{uuid.uuid4().hex}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        if on_progress:
+            self._progress[request_id] = on_progress
+        try:
+            reply = await asyncio.wait_for(
+                self._call(agent_token, {**command, 'request_id': request_id}, future),
+                timeout=timeout
+            )
+        finally:
+            self._pending.pop(request_id, None)
+            self._progress.pop(request_id, None)
+
+        if reply.get('type') == 'error':
+            raise AgentRPCError(reply.get('message') or 'Error del agente')
+        return reply
+
+    async def notify(self, agent_token: str, command: Dict[str, Any]) -> str:
+        """
+        Envía un comando sin esperar respuesta.
+
+        :return: request_id con el que el agente etiquetará sus mensajes
+        """
+        request_id = f"{self.manager.bus.backend.node_id}:{uuid.uuid4().hex}"
+        await self.manager.send_command(agent_token, {**command, 'request_id': request_id})
+        return request_id
+
+    async def _call(self, agent_token: str, command: Dict[str, Any], future: asyncio.Future) -> Dict[str, Any]:
+        slots = self._slots.setdefault(agent_token, asyncio.Semaphore(self.max_concurrency))
+        self._slot_users[agent_token] = self._slot_users.get(agent_token, 0) + 1
+        try:
+            async with slots:
+                await self.manager.send_command(agent_token, command)
+                return await future
+        finally:
+            self._slot_users[agent_token] -= 1
+            if not self._slot_users[agent_token]:
+                del self._slot_users[agent_token]
+                del self._slots[agent_token]
+
+    async def handle_agent_message(self, message: Dict[str, Any]) -> bool:
+        """
+        Enruta un mensaje del agente con `request_id` hacia quien lo espera.
+
+        :return: False si el mensaje no pertenece a ninguna petición
+        """
+        request_id = message.get('request_id')
+        if not isinstance(request_id, str):
+            return False
+        node_id = request_id.split(':', 1)[0]
+        if node_id != self.manager.bus.backend.node_id:
+            return await self.manager.bus.backend.publish_reply(node_id, message)
+        return await self._resolve(message)
+
+    async def _resolve(self, message: Dict[str, Any]) -> bool:
+        request_id = message.get('request_id')
+        if not is_final(message):
+            callback = self._progress.get(request_id)
+            if callback:
+                try:
+                    await callback(message)
+                except Exception as e:
+                    logger.error(f"Error procesando progreso de la petición {request_id}: {e}")
+            return callback is not None
+
+        future = self._pending.get(request_id)
+        if future is None or future.done():
+            logger.debug(f"Respuesta sin petición pendiente: {request_id}")
+            return False
+        future.set_result(message)
+        return True
+
+
+agent_rpc = AgentRPC(ws_manager)
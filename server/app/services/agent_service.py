@@ -3,17 +3,95 @@ from fastapi import HTTPException
 from ..db.models import Agent, Client
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import DateTime, String, case, column, func, select, update, values
 import json
 import socket
 from app.core.logging import logger
+from app.core.cache import invalidate_dashboard
+from app.db.session import SessionLocal
 class AgentStatus:
     ONLINE = "online"
     OFFLINE = "offline"  # PC apagada normalmente
     CONNECTION_LOST = "connection_lost"  # PC encendida pero sin conexión
     ERROR = "error"
 
+
+class LivenessTracker:
+    """
+    Último latido de cada agente conectado a este worker, en memoria.
+
+    Cada mensaje del agente solo actualiza un diccionario; los latidos
+    pendientes se escriben cada AGENT_LIVENESS_FLUSH_INTERVAL segundos con
+    un único UPDATE ... FROM (VALUES ...) para todo el lote. Los latidos
+    llegan por el event loop y el volcado corre en un hilo (tarea periódica
+    síncrona), así que el intercambio de pendientes va con bloqueo.
+    """
+
+    def __init__(self):
+        self._seen: Dict[str, datetime] = {}
+        self._pending: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, agent_token: str, ts: Optional[datetime] = None):
+        ts = ts or datetime.utcnow()
+        self._seen[agent_token] = ts
+        with self._lock:
+            self._pending[agent_token] = ts
+
+    def last_seen(self, agent_token: str) -> Optional[datetime]:
+        return self._seen.get(agent_token)
+
+    def flush(self, db: Session) -> int:
+        """
+        Escribe last_heartbeat/updated_at de los agentes con latidos pendientes.
+
+        Como heartbeat(): connection_lost pasa a online (registrando la
+        reconexión) y offline se respeta, porque es un apagado normal.
+
+        :return: Número de agentes actualizados
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+
+        beats = values(
+            column("token", String), column("ts", DateTime), name="beats"
+        ).data(sorted(pending.items()))
+        stmt = update(Agent).where(
+            Agent.token == beats.c.token,
+            Agent.is_active == True
+        ).values(
+            last_heartbeat=beats.c.ts,
+            updated_at=beats.c.ts,
+            last_reconnection=case(
+                (Agent.status == AgentStatus.CONNECTION_LOST, beats.c.ts),
+                else_=Agent.last_reconnection
+            ),
+            status=case(
+                (Agent.status == AgentStatus.OFFLINE, AgentStatus.OFFLINE),
+                else_=AgentStatus.ONLINE
+            )
+        )
+        try:
+            updated = db.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Se reintentan en el siguiente ciclo salvo que ya haya uno más reciente
+            with self._lock:
+                for token, ts in pending.items():
+                    self._pending.setdefault(token, ts)
+            raise
+        logger.debug(f"💓 Latidos escritos: {updated} agentes")
+        return updated
+
+
+liveness_tracker = LivenessTracker()
+
+
 class AgentService:
     def __init__(self, db_session: Session):
         self.db = db_session
@@ -24,10 +102,12 @@ class AgentService:
         """
         Verifica el estado real del agente basado en su último heartbeat
         """
-        if not agent.updated_at:
+        # El latido en memoria puede ser más reciente que el último volcado a la BD
+        candidates = [ts for ts in (liveness_tracker.last_seen(agent.token), agent.last_heartbeat, agent.updated_at) if ts]
+        if not candidates:
             return AgentStatus.OFFLINE
                 
-        time_since_update = (datetime.utcnow() - agent.updated_at).total_seconds()
+        time_since_update = (datetime.utcnow() - max(candidates)).total_seconds()
         
         if time_since_update < self.HEARTBEAT_TIMEOUT:
             return AgentStatus.ONLINE
@@ -36,45 +116,54 @@ class AgentService:
         else:
             return AgentStatus.OFFLINE
 
-    async def update_agents_status(self):
+    def update_agents_status(self) -> Dict[str, int]:
         """
-        Actualiza el estado de todos los agentes basado en su último heartbeat
+        Actualiza el estado de todos los agentes basado en su último heartbeat,
+        con dos UPDATE masivos (connection_lost y offline).
+
+        Lo ejecuta periódicamente `run_agent_status_sweep`; las lecturas ya no
+        recalculan ni escriben el estado.
+
+        :return: Agentes movidos a cada estado
         """
         try:
             current_time = datetime.utcnow()
             heartbeat_threshold = current_time - timedelta(seconds=self.HEARTBEAT_TIMEOUT)
             offline_threshold = current_time - timedelta(seconds=self.OFFLINE_TIMEOUT)
+            last_seen = func.coalesce(Agent.last_heartbeat, Agent.updated_at)
 
-            # Primero actualizamos los que perdieron conexión
-            agents_connection_lost = self.db.query(Agent).filter(
-                and_(
+            # Primero los que perdieron conexión
+            connection_lost = self.db.execute(
+                update(Agent).where(
                     Agent.is_active == True,
                     Agent.status == AgentStatus.ONLINE,
-                    Agent.updated_at < heartbeat_threshold,
-                    Agent.updated_at >= offline_threshold
-                )
-            ).all()
-
-            for agent in agents_connection_lost:
-                agent.status = AgentStatus.CONNECTION_LOST
-                logger.info(f"Agente {agent.id} marcado como connection_lost")
+                    last_seen < heartbeat_threshold,
+                    last_seen >= offline_threshold
+                ).values(status=AgentStatus.CONNECTION_LOST),
+                execution_options={"synchronize_session": False}
+            ).rowcount
 
             # Luego los que están realmente offline
-            agents_offline = self.db.query(Agent).filter(
-                and_(
+            offline = self.db.execute(
+                update(Agent).where(
                     Agent.is_active == True,
                     Agent.status.in_([AgentStatus.ONLINE, AgentStatus.CONNECTION_LOST]),
-                    Agent.updated_at < offline_threshold
-                )
-            ).all()
-
-            for agent in agents_offline:
-                agent.status = AgentStatus.OFFLINE
-                logger.info(f"Agente {agent.id} marcado como offline")
+                    last_seen < offline_threshold
+                ).values(status=AgentStatus.OFFLINE),
+                execution_options={"synchronize_session": False}
+            ).rowcount
 
             self.db.commit()
         except Exception as e:
             logger.error(f"Error actualizando estados de agentes: {str(e)}")
+            self.db.rollback()
+            return {}
+
+        if connection_lost or offline:
+            invalidate_dashboard()
+            logger.info(f"🧹 Agentes marcados: {connection_lost} connection_lost, {offline} offline")
+        return {AgentStatus.CONNECTION_LOST: connection_lost, AgentStatus.OFFLINE: offline}
+
     async def register_shutdown(self, agent_token: str) -> bool:
         """Registra un apagado normal del agente"""
         try:
@@ -175,24 +264,45 @@ class AgentService:
             ).first()
             
             if agent:
-                current_time = datetime.utcnow()
-                prev_status = agent.status
-                
-                # Si el agente estaba offline o connection_lost, registrar reconexión
-                if prev_status in [AgentStatus.OFFLINE, AgentStatus.CONNECTION_LOST]:
-                    agent.last_reconnection = current_time
-                    logger.info(f"Agente {agent_token} reconectado después de estar {prev_status}")
-                
-                agent.last_heartbeat = current_time
-                agent.updated_at = current_time
-                agent.status = AgentStatus.ONLINE
-                
+                self._mark_connected(agent)
                 self.db.commit()
                     
             return agent
         except Exception as e:
             logger.error(f"Error validando agente: {str(e)}")
             return None
+
+    async def validate_agent_async(self, agent_token: str) -> Optional[Agent]:
+        """Igual que validate_agent, pero con una AsyncSession (rutas async)."""
+        try:
+            result = await self.db.execute(
+                select(Agent).where(Agent.token == agent_token, Agent.is_active == True)
+            )
+            agent = result.scalars().first()
+            if agent:
+                self._mark_connected(agent)
+                await self.db.commit()
+            return agent
+        except Exception as e:
+            logger.error(f"Error validando agente: {str(e)}")
+            await self.db.rollback()
+            return None
+
+    @staticmethod
+    def _mark_connected(agent: Agent):
+        """Marca al agente en línea y registra la reconexión si estaba caído."""
+        current_time = datetime.utcnow()
+        prev_status = agent.status
+
+        # Si el agente estaba offline o connection_lost, registrar reconexión
+        if prev_status in [AgentStatus.OFFLINE, AgentStatus.CONNECTION_LOST]:
+            agent.last_reconnection = current_time
+            logger.info(f"Agente {agent.token} reconectado después de estar {prev_status}")
+
+        agent.last_heartbeat = current_time
+        agent.updated_at = current_time
+        agent.status = AgentStatus.ONLINE
+
     async def get_agent_history(self, agent_id: int) -> Dict:
         """Obtiene el historial de estados del agente"""
         try:
@@ -253,17 +363,21 @@ class AgentService:
             logger.error(f"Error obteniendo todos los agentes: {str(e)}")
             return []
 
+    def list_query(self, columns: Optional[List] = None):
+        """Consulta base del listado de agentes activos, sin ordenar ni paginar."""
+        query = self.db.query(Agent)
+        if columns:
+            query = query.with_entities(*columns)
+        return query.filter(Agent.is_active == True)
+
     async def get_agent(self, agent_id: int) -> Optional[Agent]:
-        """Obtiene un agente específico por ID y actualiza su estado"""
-        agent = self.db.query(Agent)\
+        """
+        Obtiene un agente específico por ID. Sin escrituras: el estado lo
+        mantiene `run_agent_status_sweep`.
+        """
+        return self.db.query(Agent)\
                       .filter(Agent.id == agent_id, Agent.is_active == True)\
                       .first()
-        
-        if agent:
-            agent.status = await self.check_agent_status(agent)
-            self.db.commit()
-            
-        return agent
 
     async def update_agent(self, agent_id: int, data: Dict) -> Optional[Agent]:
         """Actualiza los datos de un agente y su heartbeat"""
@@ -304,67 +418,40 @@ class AgentService:
         return []
 
     async def get_agent_by_token(self, token: str) -> Optional[Agent]:
-        """Obtiene un agente usando su token y verifica su estado"""
-        agent = self.db.query(Agent)\
+        """Obtiene un agente usando su token (sin escrituras, como get_agent)"""
+        return self.db.query(Agent)\
                       .filter(Agent.token == token, Agent.is_active == True)\
                       .first()
-                      
-        if agent:
-            agent.status = await self.check_agent_status(agent)
-            self.db.commit()
-            
-        return agent
 
     async def heartbeat(self, agent_token: str) -> bool:
-        """Actualiza el heartbeat del agente y su estado"""
-        try:
-            agent = await self.get_agent_by_token(agent_token)
-            if not agent:
-                logger.warning(f"Heartbeat recibido de agente no registrado: {agent_token}")
-                return False
-
-            # Actualizar heartbeat y estado
-            current_time = datetime.utcnow()
-            agent.last_heartbeat = current_time
-            agent.updated_at = current_time
-            
-            # Solo actualizar a online si no estaba offline por apagado normal
-            if agent.status != AgentStatus.OFFLINE:
-                agent.status = AgentStatus.ONLINE
-            
-            self.db.commit()
-            logger.debug(f"Heartbeat actualizado para agente {agent_token}")
-            return True
-        except Exception as e:
-            logger.error(f"Error en heartbeat del agente: {str(e)}")
-            return False
+        """
+        Registra un latido del agente. Solo toca memoria: la escritura en la
+        BD (y el paso a online) la hace en lote `run_liveness_flush`.
+        """
+        liveness_tracker.touch(agent_token)
+        logger.debug(f"Heartbeat registrado para agente {agent_token}")
+        return True
 
     def count_by_status(self) -> Dict[str, int]:
-        """Obtiene conteo de agentes por estado"""
+        """Obtiene conteo de agentes activos por estado (una consulta agregada)"""
         try:
-            counts = {
-                "total": 0,
-                "online": 0,
-                "offline": 0
+            rows = self.db.query(func.lower(Agent.status), func.count(Agent.id))\
+                          .filter(Agent.is_active == True)\
+                          .group_by(func.lower(Agent.status))\
+                          .all()
+            by_status = dict(rows)
+            total = sum(by_status.values())
+            online = by_status.get(AgentStatus.ONLINE, 0)
+            return {
+                "total": total,
+                "online": online,
+                "offline": total - online
             }
-            
-            agents = self.get_all()
-            counts["total"] = len(agents)
-            
-            for agent in agents:
-                if agent.status == AgentStatus.ONLINE:
-                    counts["online"] += 1
-                elif agent.status == AgentStatus.OFFLINE:
-                    counts["offline"] += 1
-                    
-            return counts
         except Exception as e:
             logger.error(f"Error contando agentes por estado: {str(e)}")
-            return {
-                "total": 0,
-                "online": 0,
-                "offline": 0
-            }    
+            # La transacción abortada inutilizaría las siguientes consultas de la sesión
+            self.db.rollback()
+            raise    
 
     async def _update_agent_info(self):
         """Actualiza la información del sistema y el estado del agente"""
@@ -394,4 +481,22 @@ class AgentService:
                         logger.error(f"Error al actualizar agente: {data}")
 
         except Exception as e:
-            logger.error(f"Error en la actualización del agente: {e}")
\ No newline at end of file
+            logger.error(f"Error en la actualización del agente: {e}")
+
+
+def run_liveness_flush():
+    """Tarea periódica: vuelca los latidos de agentes acumulados en memoria."""
+    db = SessionLocal()
+    try:
+        liveness_tracker.flush(db)
+    finally:
+        db.close()
+
+
+def run_agent_status_sweep():
+    """Tarea periódica: pasa a connection_lost/offline los agentes sin latidos."""
+    db = SessionLocal()
+    try:
+        AgentService(db).update_agents_status()
+    finally:
+        db.close()
@@ -1,8 +1,10 @@
 # app/services/client_service.py
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import Float, and_, case, cast, func, literal, or_, select
 from ..db.models import Client, ClientType, ClientStatus
+from ..db.models.client import client_search_document
+from ..core.config import settings
 from datetime import datetime
 import logging
 
@@ -20,48 +22,95 @@ class ClientService:
             logger.error(f"Error obteniendo todos los clientes: {str(e)}")
             return []
 
+    def list_query(self, status: Optional[str] = None, columns: Optional[List[Any]] = None):
+        """
+        Consulta base del listado de clientes, sin ordenar ni paginar: activos,
+        o los de un estado. Con `columns` solo se seleccionan esas columnas.
+        """
+        query = self.db.query(Client)
+        if columns:
+            query = query.with_entities(*columns)
+        if status:
+            return query.filter(Client.status == status)
+        return query.filter(Client.is_active == True)
+
     def count_by_status(self) -> Dict[str, int]:
-        """Obtiene conteo de clientes por estado"""
+        """Obtiene conteo de clientes por estado (una consulta agregada)"""
         try:
-            counts = {
-                "total": 0,
-                "active": 0,
-                "inactive": 0
-            }
-            
-            clients = self.get_all()
-            counts["total"] = len(clients)
-            
-            for client in clients:
-                if client.is_active:
-                    counts["active"] += 1
-                else:
-                    counts["inactive"] += 1
-                    
+            rows = self.db.query(Client.is_active, func.count(Client.id))\
+                          .group_by(Client.is_active)\
+                          .all()
+            counts = {"total": 0, "active": 0, "inactive": 0}
+            for is_active, count in rows:
+                counts["total"] += count
+                counts["active" if is_active else "inactive"] += count
             return counts
         except Exception as e:
             logger.error(f"Error contando clientes por estado: {str(e)}")
-            return {
-                "total": 0,
-                "active": 0,
-                "inactive": 0
-            }
+            # La transacción abortada inutilizaría las siguientes consultas de la sesión
+            self.db.rollback()
+            raise
 
     def get_by_id(self, client_id: int) -> Optional[Client]:
         """Obtiene un cliente por su ID."""
         return self.db.query(Client).filter(Client.id == client_id).first()
 
-    def search_clients(self, search_term: str) -> List[Client]:
-        """Busca clientes por varios criterios."""
-        return self.db.query(Client).filter(
-            or_(
-                Client.name.ilike(f"%{search_term}%"),
-                Client.business_name.ilike(f"%{search_term}%"),
-                Client.tax_id.ilike(f"%{search_term}%"),
-                Client.client_code.ilike(f"%{search_term}%"),
-                Client.contact_email.ilike(f"%{search_term}%")
-            )
-        ).all()
+    def search_clients(self, search_term: str, limit: Optional[int] = None) -> List[Client]:
+        """Busca clientes por nombre, razón social, identificación fiscal, código o email (ver `search`)."""
+        return [client for client, _ in self.search(search_term, limit=limit)]
+
+    def search(
+        self,
+        search_term: str,
+        limit: Optional[int] = None,
+        after: Optional[Sequence[Any]] = None
+    ) -> List[Tuple[Client, float]]:
+        """
+        Búsqueda ordenada por relevancia sobre el índice trigram ix_clients_search_trgm.
+
+        Coincide si el término aparece tal cual (ILIKE) o si se parece a alguna
+        palabra de los campos (operador <% de pg_trgm, tolera errores de tipeo).
+        La puntuación es la similitud por palabras más un punto si el nombre o
+        el código empiezan por el término.
+
+        :param limit: Máximo de resultados; sin él se devuelven todos
+        :param after: (puntuación, id) del último resultado entregado, para
+            continuar la paginación
+        :return: Pares (cliente, puntuación), de mayor a menor puntuación
+        """
+        term = search_term.strip()
+        if not term:
+            return []
+        # La barra invertida es el escape por defecto de LIKE
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+        # Doble precisión: el valor ida y vuelta por el cursor compara exactamente
+        score = cast(
+            func.word_similarity(term, client_search_document) + case(
+                (or_(Client.name.ilike(f"{escaped}%"),
+                     Client.client_code.ilike(f"{escaped}%")), 1.0),
+                else_=0.0
+            ),
+            Float(precision=53)
+        )
+
+        # Umbral de <% solo para esta transacción
+        self.db.execute(select(func.set_config(
+            'pg_trgm.word_similarity_threshold', str(settings.CLIENT_SEARCH_THRESHOLD), True
+        )))
+
+        query = self.db.query(Client, score.label('score')).filter(or_(
+            client_search_document.ilike(f"%{escaped}%"),
+            literal(term).op('<%')(client_search_document)
+        ))
+        if after is not None:
+            last_score, last_id = after
+            query = query.filter(or_(score < last_score, and_(score == last_score, Client.id > last_id)))
+
+        query = query.order_by(score.desc(), Client.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return [tuple(row) for row in query.all()]
 
     def create(self, client_data: Dict[str, Any]) -> Client:
         """
@@ -126,6 +126,15 @@ class DriverService:
                 detail=f"Driver con ID {driver_id} no encontrado"
             )
 
+        return await self.installation_info(driver, self.storage)
+
+    @staticmethod
+    async def installation_info(driver: PrinterDriver, storage: Optional[DriverStorage] = None) -> Dict:
+        """
+        Datos que necesita el agente para instalar un driver ya cargado.
+        No consulta la base de datos, así que sirve con sesiones sync o async.
+        """
+        storage = storage or DriverStorage()
         driver_path = Path(settings.DRIVERS_STORAGE_PATH) / driver.driver_filename
         if not driver_path.exists():
             raise HTTPException(
@@ -134,11 +143,13 @@ class DriverService:
             )
 
         # Volver a usar la URL original que funcionaba
-        download_url = f"{settings.SERVER_URL}/drivers/{driver_id}/download"
+        download_url = f"{settings.SERVER_URL}/drivers/{driver.id}/download"
 
         return {
             "driver_name": f"{driver.manufacturer} {driver.model}",
             "download_url": download_url,
+            "driver_sha256": await storage.get_file_sha256_async(driver.driver_filename),
+            "driver_size": driver_path.stat().st_size,
             "manufacturer": driver.manufacturer,
             "model": driver.model,
             "driver_filename": driver.driver_filename,
@@ -1,9 +1,21 @@
 # server/app/services/driver_storage.py
 import os
+import asyncio
+import hashlib
 from pathlib import Path
 from fastapi import HTTPException
+from app.core.cache import TTLCache
 from app.core.config import settings
 
+# Hashes por (ruta, tamaño, mtime) para no releer archivos grandes. La clave
+# ya cambia con el archivo; el TTL y el tamaño solo acotan la memoria.
+_sha256_cache: TTLCache = TTLCache(maxsize=settings.DRIVER_HASH_CACHE_MAX_SIZE, ttl=24 * 3600)
+
+
+def _cache_key(file_path: str):
+    stat = os.stat(file_path)
+    return (file_path, stat.st_size, stat.st_mtime)
+
 class DriverStorage:
     def __init__(self):
         self.storage_path = settings.DRIVERS_STORAGE_PATH
@@ -26,6 +38,8 @@ class DriverStorage:
         try:
             with open(file_path, "wb") as f:
                 f.write(content)
+            # El contenido ya está en memoria: el hash no obliga a releerlo
+            _sha256_cache.set(_cache_key(str(file_path)), hashlib.sha256(content).hexdigest())
             return str(file_path)
         except Exception as e:
             raise RuntimeError(f"Error al guardar el archivo: {e}")
@@ -52,3 +66,26 @@ class DriverStorage:
             os.remove(file_path)
             return True
         return False
+
+    def get_file_sha256(self, filename: str) -> str:
+        """
+        Calcula el SHA-256 del archivo de driver leyéndolo por bloques.
+        El resultado se reutiliza mientras el archivo no cambie. Lee del disco:
+        desde código async usar `get_file_sha256_async`.
+        """
+        file_path = self.validate_driver_file(filename)
+        key = _cache_key(file_path)
+
+        digest = _sha256_cache.get(key)
+        if digest is None:
+            hasher = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            _sha256_cache.set(key, digest)
+        return digest
+
+    async def get_file_sha256_async(self, filename: str) -> str:
+        """`get_file_sha256` en un hilo, para no bloquear el event loop con archivos grandes."""
+        return await asyncio.to_thread(self.get_file_sha256, filename)
@@ -0,0 +1,230 @@
+# server/app/services/ingestion_buffer.py
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+from app.core.cache import invalidate_dashboard
+from app.core.config import settings
+from app.core.status_hub import status_hub
+from app.db.session import SessionLocal
+from app.services.monitor_service import PrinterMonitorService, _validate_report
+
+logger = logging.getLogger(__name__)
+
+Report = Tuple[Dict[str, Any], Optional[int]]
+
+
+class BufferFullError(Exception):
+    """El buffer alcanzó su capacidad; el cliente debe reintentar más tarde."""
+
+
+def _merge(older: Report, newer: Report) -> Report:
+    """
+    Combina dos reportes de la misma impresora.
+
+    Gana el más reciente, pero no pierde los campos opcionales que solo trae
+    el anterior (printer_data, serial, cliente, agente), igual que si ambos
+    se hubieran aplicado uno tras otro.
+    """
+    older_data, older_agent = older
+    newer_data, newer_agent = newer
+    merged = {**older_data, **newer_data}
+    for key in ("printer_data", "client_id", "serial_number"):
+        if not newer_data.get(key) and older_data.get(key):
+            merged[key] = older_data[key]
+    return merged, newer_agent if newer_agent is not None else older_agent
+
+
+class IngestionBuffer:
+    """
+    Buffer de escritura diferida para los reportes de monitoreo.
+
+    Los reportes se aceptan en memoria (uno por impresora: los repetidos
+    dentro de la ventana se combinan) y se escriben con upserts por lotes
+    cuando vence `flush_interval` o se acumulan `batch_size` impresoras.
+    Con `max_pending` impresoras pendientes se rechazan las nuevas.
+
+    `submit` se llama desde el threadpool de FastAPI; el vaciado corre en una
+    tarea asyncio que delega la escritura a un hilo.
+    """
+
+    def __init__(
+        self,
+        max_pending: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.max_pending = max_pending or settings.INGEST_BUFFER_MAX_PENDING
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.INGEST_FLUSH_INTERVAL
+        self._pending: Dict[str, Report] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._metrics = {
+            "accepted": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "flushed_reports": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+            "last_flush_at": None,
+            "last_flush_seconds": None,
+            "last_batch_size": 0
+        }
+
+    def submit(self, printer_data: Dict[str, Any], agent_id: Optional[int] = None):
+        """
+        Acepta un reporte para escribirlo en el próximo vaciado.
+
+        :raises ValueError: Si faltan campos requeridos
+        :raises BufferFullError: Si el buffer está lleno
+        """
+        _validate_report(printer_data)
+        ip_address = printer_data["ip_address"]
+        with self._lock:
+            previous = self._pending.get(ip_address)
+            if previous is None and len(self._pending) >= self.max_pending:
+                self._metrics["rejected"] += 1
+                raise BufferFullError("Buffer de ingesta lleno")
+            if previous is None:
+                self._pending[ip_address] = (printer_data, agent_id)
+            else:
+                self._pending[ip_address] = _merge(previous, (printer_data, agent_id))
+                self._metrics["coalesced"] += 1
+            self._metrics["accepted"] += 1
+            full = len(self._pending) >= self.batch_size
+
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._metrics,
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval
+            }
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="ingestion_buffer")
+        logger.info(
+            f"📥 Buffer de ingesta iniciado (cada {self.flush_interval}s o {self.batch_size} impresoras)"
+        )
+
+    async def stop(self):
+        """Detiene el vaciado periódico y escribe lo pendiente."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self._loop = None
+
+    async def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error vaciando el buffer de ingesta: {e}")
+
+    def _write(self, batch: Dict[str, Report]):
+        start = time.perf_counter()
+        reports = list(batch.items())
+        written = 0
+        status_changed = False
+        db = SessionLocal()
+        try:
+            service = PrinterMonitorService(db)
+            for offset in range(0, len(reports), self.batch_size):
+                chunk = reports[offset:offset + self.batch_size]
+                try:
+                    results = service.upsert_printers([report for _, report in chunk])
+                    db.commit()
+                except OperationalError as e:
+                    # Base de datos no disponible: se reintenta en el próximo vaciado
+                    db.rollback()
+                    logger.error(f"❌ Error de conexión escribiendo {len(chunk)} reportes: {e}")
+                    self._requeue(reports[offset:])
+                    with self._lock:
+                        self._metrics["failed_batches"] += 1
+                    break
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"❌ Error escribiendo lote de {len(chunk)} reportes, se reintenta uno a uno: {e}")
+                    with self._lock:
+                        self._metrics["failed_batches"] += 1
+                    results = self._write_one_by_one(db, service, chunk)
+                written += len(results)
+                changed = [result for result in results if result["status"] != result["previous_status"]]
+                status_changed = status_changed or bool(changed)
+                for result in changed:
+                    status_hub.publish_threadsafe(
+                        "printer_status",
+                        result,
+                        client_id=result["client_id"],
+                        agent_id=result["agent_id"],
+                        printer_id=result["id"],
+                        coalesce_key=("printer", result["id"])
+                    )
+        finally:
+            db.close()
+
+        if status_changed:
+            invalidate_dashboard()
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._metrics["flushes"] += 1
+            self._metrics["flushed_reports"] += written
+            self._metrics["last_flush_at"] = time.time()
+            self._metrics["last_flush_seconds"] = round(elapsed, 4)
+            self._metrics["last_batch_size"] = written
+        logger.debug(f"Buffer de ingesta: {written} impresoras escritas en {elapsed:.3f}s")
+
+    def _write_one_by_one(self, db, service: PrinterMonitorService, chunk: List[Tuple[str, Report]]) -> List[Dict[str, Any]]:
+        """Aísla el reporte que hizo fallar un lote; ese reporte se descarta."""
+        results = []
+        for ip_address, report in chunk:
+            try:
+                results.extend(service.upsert_printers([report]))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Reporte de {ip_address} descartado: {e}")
+                with self._lock:
+                    self._metrics["dropped"] += 1
+        return results
+
+    def _requeue(self, reports: List[Tuple[str, Report]]):
+        """Devuelve reportes al buffer; lo recibido mientras tanto es más reciente y tiene prioridad."""
+        with self._lock:
+            for ip_address, report in reports:
+                newer = self._pending.get(ip_address)
+                self._pending[ip_address] = report if newer is None else _merge(report, newer)
+
+
+ingestion_buffer = IngestionBuffer()
@@ -0,0 +1,269 @@
+# server/app/services/install_job_service.py
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Agent, Printer, PrinterJob
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.services.driver_service import DriverService
+from app.services.agent_rpc import agent_rpc
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus:
+    PENDING = "pending"
+    INSTALLING = "installing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    UNFINISHED = (PENDING, INSTALLING)
+
+
+def build_install_payload(driver_info: Dict[str, Any], printer_ip: str) -> Dict[str, Any]:
+    """Arma el comando `install_printer` que entiende el agente."""
+    return {
+        "printer_ip": printer_ip,
+        "manufacturer": driver_info["manufacturer"],
+        "model": driver_info["model"],
+        "driver_url": driver_info["download_url"],
+        "driver_filename": driver_info["driver_filename"],
+        "driver_sha256": driver_info["driver_sha256"]
+    }
+
+
+class InstallJobService:
+    """
+    Despliegue masivo de impresoras: un lote de PrinterJob por agente,
+    enviados en paralelo con concurrencia acotada y reintentos.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def create_batch(self, driver_id: int, targets: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        Crea los PrinterJob de un lote en estado pendiente.
+
+        Args:
+            driver_id (int): Driver a instalar
+            targets (List[Dict[str, str]]): Pares {agent_token, printer_ip}
+
+        Returns:
+            Dict[str, Any]: batch_id, datos del driver y jobs creados
+        """
+        driver_info = await DriverService(self.db).get_driver_for_installation(driver_id)
+
+        tokens = {t["agent_token"] for t in targets}
+        agents = {
+            a.token: a for a in self.db.query(Agent).filter(Agent.token.in_(tokens)).all()
+        }
+        unknown = tokens - agents.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Agentes no encontrados: {', '.join(sorted(unknown))}"
+            )
+
+        ips = {t["printer_ip"] for t in targets}
+        printers = {
+            p.ip_address: p.id
+            for p in self.db.query(Printer.ip_address, Printer.id).filter(Printer.ip_address.in_(ips)).all()
+        }
+
+        batch_id = uuid.uuid4().hex
+        jobs = []
+        for target in targets:
+            job = PrinterJob(
+                batch_id=batch_id,
+                agent_id=agents[target["agent_token"]].id,
+                printer_id=printers.get(target["printer_ip"]),
+                printer_driver_id=driver_id,
+                ip_address=target["printer_ip"],
+                status=JobStatus.PENDING,
+                attempts=0,
+                installation_details={"agent_token": target["agent_token"]}
+            )
+            self.db.add(job)
+            jobs.append(job)
+        self.db.commit()
+
+        return {
+            "batch_id": batch_id,
+            "driver_info": driver_info,
+            "job_ids": [job.id for job in jobs]
+        }
+
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Resumen del lote: conteo por estado y detalle de cada job."""
+        jobs = self.db.query(PrinterJob).filter(PrinterJob.batch_id == batch_id).order_by(PrinterJob.id).all()
+        if not jobs:
+            raise HTTPException(status_code=404, detail="Lote de instalación no encontrado")
+
+        counts = dict(
+            self.db.query(PrinterJob.status, func.count(PrinterJob.id))
+            .filter(PrinterJob.batch_id == batch_id)
+            .group_by(PrinterJob.status)
+            .all()
+        )
+        return {
+            "batch_id": batch_id,
+            "total": len(jobs),
+            "summary": counts,
+            "finished": counts.get(JobStatus.PENDING, 0) + counts.get(JobStatus.INSTALLING, 0) == 0,
+            "jobs": [
+                {
+                    "id": job.id,
+                    "agent_token": (job.installation_details or {}).get("agent_token"),
+                    "printer_ip": job.ip_address,
+                    "status": job.status,
+                    "attempts": job.attempts,
+                    "error_message": job.error_message,
+                    "step": (job.installation_details or {}).get("step"),
+                    "updated_at": job.updated_at
+                }
+                for job in jobs
+            ]
+        }
+
+
+async def _update_job(db: AsyncSession, job: PrinterJob, **fields):
+    details = fields.pop("details", None)
+    for key, value in fields.items():
+        setattr(job, key, value)
+    if details:
+        job.installation_details = {**(job.installation_details or {}), **details}
+    await db.commit()
+
+
+async def _run_job(job_id: int, payload: Dict[str, Any], max_attempts: int, timeout: float):
+    """Ejecuta un job con reintentos; usa su propia sesión asíncrona."""
+    async with AsyncSessionLocal() as db:
+        try:
+            job = await db.get(PrinterJob, job_id)
+            agent_token = job.installation_details["agent_token"]
+
+            async def on_progress(message: Dict[str, Any]):
+                await _update_job(db, job, details={"step": message.get("step"), "message": message.get("message")})
+
+            for attempt in range(job.attempts + 1, max_attempts + 1):
+                await _update_job(db, job, status=JobStatus.INSTALLING, attempts=attempt, error_message=None)
+                try:
+                    result = await agent_rpc.call(
+                        agent_token,
+                        {"type": "install_printer", **payload, "job_id": job_id},
+                        timeout=timeout,
+                        on_progress=on_progress
+                    )
+                    if result.get("success"):
+                        await _update_job(
+                            db, job,
+                            status=JobStatus.COMPLETED,
+                            details={"step": "done", "message": result.get("message"),
+                                     "completed_at": datetime.utcnow().isoformat()}
+                        )
+                        return
+                    error = result.get("message") or "Instalación fallida"
+                except asyncio.TimeoutError:
+                    error = f"Sin respuesta del agente en {timeout}s"
+                except Exception as e:
+                    error = str(e)
+
+                logger.warning(f"Job {job_id} intento {attempt}/{max_attempts} falló: {error}")
+                if attempt == max_attempts:
+                    await _update_job(db, job, status=JobStatus.FAILED, error_message=error)
+                    return
+                await _update_job(db, job, error_message=error)
+                await asyncio.sleep(min(2 ** attempt, 60))
+        except Exception as e:
+            logger.error(f"Error inesperado en job {job_id}: {e}")
+
+
+async def _keep_batch_alive(batch_id: str):
+    """Renueva updated_at de los jobs sin terminar del lote mientras este worker lo ejecuta."""
+    while True:
+        await asyncio.sleep(settings.INSTALL_JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(PrinterJob)
+                    .where(PrinterJob.batch_id == batch_id, PrinterJob.status.in_(JobStatus.UNFINISHED))
+                    .values(updated_at=func.now())
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error renovando los jobs del lote {batch_id}: {e}")
+
+
+async def run_batch(batch_id: str, driver_info: Dict[str, Any], concurrency: int = 20,
+                    max_attempts: int = 3, timeout: float = 900):
+    """
+    Despacha todos los jobs pendientes de un lote en paralelo.
+
+    Args:
+        batch_id (str): Identificador del lote
+        driver_info (Dict[str, Any]): Datos del driver (de DriverService)
+        concurrency (int): Instalaciones simultáneas como máximo
+        max_attempts (int): Intentos por job antes de marcarlo como fallido
+        timeout (float): Segundos de espera por el resultado de cada intento
+    """
+    async with AsyncSessionLocal() as db:
+        jobs = (await db.execute(
+            select(PrinterJob.id, PrinterJob.ip_address).where(
+                PrinterJob.batch_id == batch_id,
+                PrinterJob.status == JobStatus.PENDING
+            )
+        )).all()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job_id: int, printer_ip: str):
+        async with semaphore:
+            await _run_job(job_id, build_install_payload(driver_info, printer_ip), max_attempts, timeout)
+
+    logger.info(f"🚀 Lote {batch_id}: {len(jobs)} instalaciones (concurrencia {concurrency})")
+    keep_alive = asyncio.create_task(_keep_batch_alive(batch_id))
+    try:
+        await asyncio.gather(*(bounded(job_id, ip) for job_id, ip in jobs))
+    finally:
+        keep_alive.cancel()
+    logger.info(f"✅ Lote {batch_id} finalizado")
+
+
+def fail_stale_jobs() -> int:
+    """
+    Tarea periódica (y al arrancar): marca como fallidos los jobs pendientes o
+    en curso que llevan INSTALL_JOB_STALE_AFTER segundos sin renovarse. Su lote
+    corría en un BackgroundTask de un worker que se reinició o cayó; los lotes
+    vivos los renueva `_keep_batch_alive` en cualquier worker.
+
+    :return: Jobs marcados como fallidos
+    """
+    db = SessionLocal()
+    try:
+        failed = db.execute(
+            update(PrinterJob)
+            .where(
+                PrinterJob.status.in_(JobStatus.UNFINISHED),
+                PrinterJob.updated_at < func.now() - timedelta(seconds=settings.INSTALL_JOB_STALE_AFTER)
+            )
+            .values(status=JobStatus.FAILED, error_message="Interrumpido: el servidor se reinició durante el lote"),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if failed:
+        logger.warning(f"⚠️ {failed} instalaciones huérfanas marcadas como fallidas")
+    return failed
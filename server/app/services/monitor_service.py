@@ -1,101 +1,198 @@
 # server/app/services/monitor_service.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from app.db.models.printer import Printer
+from app.db.models.printer import Printer, summarize_supplies
 from app.db.models.agent import Agent
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.core.logging import logger
+from app.core.cache import invalidate_dashboard
+from app.services.sample_service import PrinterSampleService, extract_counters
+from app.utils.pagination import keyset
+
+_REQUIRED_FIELDS = ["name", "brand", "model", "ip_address"]
+# Orden (y clave del cursor) de las impresoras con consumibles críticos
+_CRITICAL_KEYS = [Printer.min_supply_percentage, Printer.id]
+
+
+def _validate_report(printer_data: Dict[str, Any]):
+    if not printer_data:
+        logger.error("No se proporcionaron datos de la impresora")
+        raise ValueError("No se proporcionaron datos de la impresora")
+    for field in _REQUIRED_FIELDS:
+        if not printer_data.get(field):
+            logger.error(f"Campo requerido faltante: {field}")
+            raise ValueError(f"El campo {field} es requerido")
+
 
 class PrinterMonitorService:
     def __init__(self, db: Session):
         self.db = db
 
-    def update_printer_data(self, printer_data: Dict[str, Any], agent_id: int = None) -> Printer:
+    def update_printer_data(self, printer_data: Dict[str, Any], agent_id: int = None) -> int:
         """
-        Actualiza los datos de una impresora.
+        Crea o actualiza una impresora a partir de un reporte, en una única
+        sentencia INSERT ... ON CONFLICT (ip_address) DO UPDATE.
         
         Args:
             printer_data (Dict[str, Any]): Datos de la impresora
             agent_id (int, optional): ID del agente que envía los datos
             
         Returns:
-            Printer: Objeto impresora actualizado o creado
+            int: ID de la impresora actualizada o creada
             
         Raises:
             ValueError: Si faltan datos requeridos
             Exception: Para otros errores durante el proceso
         """
         try:
-            logger.info(f"Iniciando creación/actualización de impresora con datos: {printer_data}")
-
-            if not printer_data:
-                logger.error("No se proporcionaron datos de la impresora")
-                raise ValueError("No se proporcionaron datos de la impresora")
-
-            # Validar campos requeridos
-            required_fields = ["name", "brand", "model", "ip_address"]
-            for field in required_fields:
-                if not printer_data.get(field):
-                    logger.error(f"Campo requerido faltante: {field}")
-                    raise ValueError(f"El campo {field} es requerido")
-
-            # Buscar la impresora existente por IP
-            printer = self.db.query(Printer).filter(
-                Printer.ip_address == printer_data["ip_address"]
-            ).first()
-
-            if not printer:
-                logger.info("Creando nueva impresora")
-                printer = Printer(
-                    name=printer_data["name"],
-                    brand=printer_data["brand"],
-                    model=printer_data["model"],
-                    ip_address=printer_data["ip_address"],
-                    agent_id=agent_id,
-                    status=printer_data.get("status", "offline"),
-                    last_check=datetime.utcnow(),
-                    oid_config_id=1  # ID por defecto para PrinterOIDs
-                )
-
-                # Asignar cliente si se proporciona
-                if printer_data.get("client_id"):
-                    printer.client_id = int(printer_data["client_id"])
-                    logger.info(f"Cliente asignado a la nueva impresora: {printer_data['client_id']}")
-
-                self.db.add(printer)
-
-            else:
-                # Actualizar datos básicos de impresora existente
-                printer.name = printer_data["name"]
-                printer.brand = printer_data["brand"]
-                printer.model = printer_data["model"]
-                printer.status = printer_data.get("status", "offline")
-                printer.last_check = datetime.utcnow()
-
-                # Actualizar agent_id si se proporciona
-                if agent_id is not None:
-                    printer.agent_id = agent_id
-                # Actualizar número de serie si está presente en los datos
-                if "serial_number" in printer_data:
-                    printer.serial_number = printer_data["serial_number"]
-                # Actualizar cliente si se proporciona
-                if printer_data.get("client_id"):
-                    printer.client_id = int(printer_data["client_id"])
-
-                # Actualizar datos de monitoreo si están presentes
-                if printer_data.get("printer_data"):
-                    printer.printer_data = printer_data["printer_data"]
-
+            logger.debug(f"Iniciando creación/actualización de impresora con datos: {printer_data}")
+            result = self.upsert_printers([(printer_data, agent_id)])[0]
             self.db.commit()
-            self.db.refresh(printer)
 
-            logger.info(f"Impresora actualizada exitosamente. ID: {printer.id}, IP: {printer.ip_address}")
-            return printer
+            if result["status"] != result["previous_status"]:
+                invalidate_dashboard()
+
+            logger.info(f"Impresora actualizada exitosamente. ID: {result['id']}, IP: {result['ip_address']}")
+            return result["id"]
 
         except Exception as e:
             logger.error(f"Error en update_printer_data: {str(e)}")
             self.db.rollback()
             raise
+
+    def upsert_printers(self, reports: List[Tuple[Dict[str, Any], Optional[int]]]) -> List[Dict[str, Any]]:
+        """
+        Aplica un lote de reportes (datos, agent_id) sin hacer commit.
+
+        Por impresora:
+        - name, brand, model, status y last_check se sobrescriben siempre.
+        - serial_number, client_id y agent_id solo si el reporte los trae.
+        - printer_data y el resumen de consumibles solo si vienen datos de
+          monitoreo; en ese caso se registra además una muestra de histórico.
+
+        Como mucho dos sentencias de upsert (reportes con y sin printer_data),
+        cada una precedida del SELECT ... FOR UPDATE que lee el estado
+        anterior, más la muestra y los agregados. Si una IP aparece varias veces gana el
+        último reporte.
+
+        :return: Por impresora: id, ip_address, status, client_id, agent_id y
+            previous_status (None si se acaba de crear)
+        :raises ValueError: Si a un reporte le faltan campos requeridos
+        """
+        latest: Dict[str, Tuple[Dict[str, Any], Optional[int]]] = {}
+        for printer_data, agent_id in reports:
+            _validate_report(printer_data)
+            latest[printer_data["ip_address"]] = (printer_data, agent_id)
+
+        now = datetime.utcnow()
+        with_data, without_data = [], []
+        # Orden estable por IP: dos lotes concurrentes bloquean las filas en el mismo orden
+        for ip_address in sorted(latest):
+            printer_data, agent_id = latest[ip_address]
+            values = {
+                "name": printer_data["name"],
+                "brand": printer_data["brand"],
+                "model": printer_data["model"],
+                "ip_address": ip_address,
+                "serial_number": printer_data.get("serial_number"),
+                "client_id": int(printer_data["client_id"]) if printer_data.get("client_id") else None,
+                "agent_id": agent_id,
+                "status": printer_data.get("status", "offline"),
+                "last_check": now,
+                "oid_config_id": 1  # ID por defecto para PrinterOIDs
+            }
+            data = printer_data.get("printer_data")
+            if data:
+                minimum, critical = summarize_supplies(data)
+                values.update(
+                    printer_data=data,
+                    min_supply_percentage=minimum,
+                    critical_supplies=critical,
+                    has_critical_supplies=bool(critical)
+                )
+                with_data.append(values)
+            else:
+                without_data.append(values)
+
+        results = self._upsert(without_data, with_data=False) + self._upsert(with_data, with_data=True)
+
+        # Histórico: una fila nueva por reporte de monitoreo
+        data_by_ip = {values["ip_address"]: values for values in with_data}
+        samples = []
+        for result in results:
+            previous_counters = result.pop("previous_counters")
+            values = data_by_ip.get(result["ip_address"])
+            if values is None:
+                continue
+            samples.append({
+                "printer_id": result["id"],
+                "status": result["status"],
+                "printer_data": values["printer_data"],
+                "min_supply_percentage": values["min_supply_percentage"],
+                "previous_counters": extract_counters(previous_counters)
+            })
+        PrinterSampleService(self.db).record(samples, ts=now)
+        return results
+
+    def _upsert(self, rows: List[Dict[str, Any]], with_data: bool) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        ips = [row["ip_address"] for row in rows]
+        # Estado y contadores anteriores, bloqueando las filas existentes hasta el commit
+        # (en orden de IP, igual que el upsert)
+        previous = {
+            ip_address: (status, counters)
+            for ip_address, status, counters in self.db.execute(
+                select(
+                    Printer.ip_address,
+                    Printer.status,
+                    Printer.printer_data["counters"]
+                ).where(Printer.ip_address.in_(ips)).order_by(Printer.ip_address).with_for_update()
+            )
+        }
+
+        stmt = insert(Printer).values(rows)
+        excluded = stmt.excluded
+        set_ = {
+            "name": excluded.name,
+            "brand": excluded.brand,
+            "model": excluded.model,
+            "status": excluded.status,
+            "last_check": excluded.last_check,
+            "serial_number": func.coalesce(excluded.serial_number, Printer.serial_number),
+            "client_id": func.coalesce(excluded.client_id, Printer.client_id),
+            "agent_id": func.coalesce(excluded.agent_id, Printer.agent_id),
+            "updated_at": func.now()
+        }
+        if with_data:
+            set_.update(
+                printer_data=excluded.printer_data,
+                min_supply_percentage=excluded.min_supply_percentage,
+                critical_supplies=excluded.critical_supplies,
+                has_critical_supplies=excluded.has_critical_supplies
+            )
+
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Printer.ip_address],
+            set_=set_
+        ).returning(
+            Printer.id,
+            Printer.ip_address,
+            Printer.status,
+            Printer.client_id,
+            Printer.agent_id
+        )
+
+        results = []
+        for row in self.db.execute(stmt).mappings():
+            result = dict(row)
+            # Las impresoras nuevas no tienen estado ni contadores anteriores
+            result["previous_status"], result["previous_counters"] = previous.get(result["ip_address"], (None, None))
+            results.append(result)
+        return results
+
     def get_printers_by_agent(self, agent_id: int) -> List[Printer]:
         """
         Obtiene todas las impresoras asociadas a un agente.
@@ -105,18 +202,26 @@ class PrinterMonitorService:
         """
         return self.db.query(Printer).filter(Printer.agent_id == agent_id).all()
 
-    def get_printers_with_critical_supplies(self) -> List[Printer]:
+    def get_printers_with_critical_supplies(self, skip: int = 0, limit: Optional[int] = None,
+                                            cursor: Optional[str] = None) -> List[Any]:
         """
         Obtiene impresoras con consumibles en estado crítico.
-        
-        :return: Lista de impresoras con consumibles críticos
+
+        Usa las columnas calculadas en la ingesta (índice ix_printers_critical_supplies),
+        ordenadas de menor a mayor porcentaje, y solo lee las columnas del listado.
+
+        :param skip: Registros a omitir (OFFSET, por compatibilidad; mejor `cursor`)
+        :param limit: Máximo de registros a devolver
+        :param cursor: Continúa tras (min_supply_percentage, id) del último entregado
+        :return: Filas con id, name, min_supply_percentage y critical_supplies
         """
-        # Filtrar impresoras con consumibles críticos
-        printers = self.db.query(Printer).all()
-        return [
-            printer for printer in printers 
-            if printer.check_critical_supplies()
-        ]
+        query = self.db.query(
+            Printer.id, Printer.name, Printer.min_supply_percentage, Printer.critical_supplies
+        ).filter(Printer.has_critical_supplies == True)
+        query = keyset(query, _CRITICAL_KEYS, cursor)
+        if skip:
+            query = query.offset(skip)
+        return query.limit(limit).all()
 
     def get_printer_history(self, printer_id: int, days: int = 7) -> Dict[str, List]:
         """
@@ -126,22 +231,10 @@ class PrinterMonitorService:
         :param days: Número de días de histórico a recuperar
         :return: Diccionario con históricos de la impresora
         """
-        printer = self.db.query(Printer).get(printer_id)
-        if not printer:
+        if not self.db.query(Printer.id).filter(Printer.id == printer_id).first():
             return {}
 
-        # Filtrar históricos por fecha
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        filtered_history = {
-            key: [
-                entry for entry in printer.data_history.get(key, [])
-                if datetime.fromisoformat(entry['timestamp']) >= cutoff_date
-            ]
-            for key in printer.data_history.keys()
-        }
-
-        return filtered_history
+        return PrinterSampleService(self.db).get_history(printer_id, days)
 
     def generate_printer_report(self, agent_id: int = None) -> Dict[str, Any]:
         """
@@ -191,20 +284,9 @@ class PrinterMonitorService:
         
         :return: Lista de impresoras críticas
         """
-        printers = self.db.query(Printer).all()
-        critical_printers = []
-        
-        for printer in printers:
-            # Incluir impresoras con error
-            if printer.status == 'error':
-                critical_printers.append(printer)
-                continue
-                
-            # Incluir impresoras con consumibles críticos
-            if printer.check_critical_supplies():
-                critical_printers.append(printer)
-                
-        return critical_printers
+        return self.db.query(Printer)\
+                      .filter(or_(Printer.status == 'error', Printer.has_critical_supplies == True))\
+                      .all()
     
 
     def get_count(self) -> int:
@@ -245,26 +327,21 @@ class PrinterMonitorService:
 
     def count_by_status(self) -> Dict[str, int]:
         """
-        Obtiene un conteo de impresoras por estado.
+        Obtiene un conteo de impresoras por estado con una consulta agregada.
         """
         try:
-            statuses = ['online', 'offline', 'error']
-            counts = {status: 0 for status in statuses}
-            counts['total'] = 0
-            
-            printers = self.get_all()
-            counts['total'] = len(printers)
-            
-            for printer in printers:
-                if printer.status in statuses:
-                    counts[printer.status] += 1
-            
+            rows = self.db.query(Printer.status, func.count(Printer.id))\
+                          .group_by(Printer.status)\
+                          .all()
+            counts = {"total": 0, "online": 0, "offline": 0, "error": 0}
+            for status, count in rows:
+                counts["total"] += count
+                key = (status or "").lower()
+                if key in counts and key != "total":
+                    counts[key] += count
             return counts
         except Exception as e:
             logger.error(f"Error contando impresoras por estado: {str(e)}")
-            return {
-                "total": 0,
-                "online": 0,
-                "offline": 0,
-                "error": 0
-            }
\ No newline at end of file
+            # La transacción abortada inutilizaría las siguientes consultas de la sesión
+            self.db.rollback()
+            raise
@@ -4,15 +4,23 @@ from sqlalchemy.orm import Session
 from app.db.models.printer_oids import PrinterOIDs
 from app.schemas.printer_oids import PrinterOIDsCreate, PrinterOIDsUpdate
 from app.core.logging import logger
+from app.utils.pagination import keyset
 
 class PrinterOIDsService:
    def __init__(self, db: Session):
        self.db = db
 
-   def get_all(self, skip: int = 0, limit: int = 100) -> List[PrinterOIDs]:
-       """Obtiene todos los registros de OIDs de impresoras."""
-       logger.info(f"Recuperando registros de OIDs (skip: {skip}, limit: {limit})")
-       return self.db.query(PrinterOIDs).offset(skip).limit(limit).all()
+   def get_all(self, skip: int = 0, limit: Optional[int] = 100, cursor: Optional[str] = None) -> List[PrinterOIDs]:
+       """
+       Obtiene los registros de OIDs de impresoras ordenados por id.
+       Con `cursor` continúa tras el último id entregado (keyset); `skip`
+       (OFFSET) se mantiene por compatibilidad. `limit=None` los devuelve todos.
+       """
+       logger.info(f"Recuperando registros de OIDs (skip: {skip}, limit: {limit}, cursor: {cursor})")
+       query = keyset(self.db.query(PrinterOIDs), [PrinterOIDs.id], cursor)
+       if skip:
+           query = query.offset(skip)
+       return query.limit(limit).all()
 
    def get_by_id(self, oid_id: int) -> Optional[PrinterOIDs]:
        """Obtiene un registro de OIDs por su ID."""
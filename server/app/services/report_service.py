@@ -0,0 +1,385 @@
+# server/app/services/report_service.py
+import csv
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.client import Client
+from app.db.models.printer import Printer
+from app.db.models.printer_sample import PrinterSample
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+BILLING_COLUMNS = [
+    'client_id', 'client_code', 'client_name',
+    'printer_id', 'printer_name', 'serial_number', 'ip_address',
+    'first_reading_at', 'last_reading_at', 'start_counter', 'end_counter',
+    'total_pages', 'color_pages', 'bw_pages', 'counter_resets', 'samples'
+]
+
+_SUMMARY_COLUMNS = ['client_id', 'client_name', 'printers', 'total_pages', 'color_pages', 'bw_pages']
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ReportStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def _delta(current, previous):
+    """Incremento entre lecturas; si el contador bajó se toma el valor actual (reinicio)."""
+    return case(
+        (previous.is_(None), 0),
+        (current.is_(None), 0),
+        (current >= previous, current - previous),
+        else_=current
+    )
+
+
+class BillingReportService:
+    """Volumen de páginas por cliente e impresora en un periodo de facturación."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def billing_query(self, start: datetime, end: datetime, client_id: Optional[int] = None):
+        """
+        Consulta única sobre printer_samples.
+
+        `lag()` empareja cada lectura con la anterior de la misma impresora;
+        se incluyen BILLING_BASELINE_DAYS previos para que la primera lectura
+        del periodo tenga su referencia. Solo suman los incrementos de lecturas
+        dentro de [start, end).
+
+        Los contadores inicial y final son los de la primera y la última
+        lectura del periodo (numeradas por impresora dentro y fuera de él),
+        no el mínimo y el máximo: con un reinicio de contador no coinciden.
+        """
+        s = PrinterSample
+        window = {'partition_by': s.printer_id, 'order_by': s.ts}
+        period_window = {'partition_by': [s.printer_id, s.ts >= start]}
+        readings = select(
+            s.printer_id,
+            s.ts,
+            s.total_pages,
+            s.color_pages,
+            s.bw_pages,
+            func.lag(s.total_pages).over(**window).label('prev_total'),
+            func.lag(s.color_pages).over(**window).label('prev_color'),
+            func.lag(s.bw_pages).over(**window).label('prev_bw'),
+            func.row_number().over(**period_window, order_by=s.ts).label('first_rank'),
+            func.row_number().over(**period_window, order_by=s.ts.desc()).label('last_rank')
+        ).where(
+            s.ts >= start - timedelta(days=settings.BILLING_BASELINE_DAYS),
+            s.ts < end,
+            s.total_pages.isnot(None)
+        )
+        if client_id is not None:
+            readings = readings.where(s.printer_id.in_(
+                select(Printer.id).where(Printer.client_id == client_id)
+            ))
+        r = readings.cte('readings').c
+        in_period = r.ts >= start
+
+        per_printer = select(
+            r.printer_id,
+            func.min(r.ts).filter(in_period).label('first_reading_at'),
+            func.max(r.ts).filter(in_period).label('last_reading_at'),
+            func.max(func.coalesce(r.prev_total, r.total_pages))
+                .filter(and_(in_period, r.first_rank == 1)).label('start_counter'),
+            func.max(r.total_pages).filter(and_(in_period, r.last_rank == 1)).label('end_counter'),
+            func.sum(_delta(r.total_pages, r.prev_total)).filter(in_period).label('total_pages'),
+            func.sum(_delta(r.color_pages, r.prev_color)).filter(in_period).label('color_pages'),
+            func.sum(_delta(r.bw_pages, r.prev_bw)).filter(in_period).label('bw_pages'),
+            func.count().filter(and_(in_period, r.total_pages < r.prev_total)).label('counter_resets'),
+            func.count().filter(in_period).label('samples')
+        ).group_by(r.printer_id).having(func.count().filter(in_period) > 0).subquery()
+        p = per_printer.c
+
+        return select(
+            Client.id.label('client_id'),
+            Client.client_code,
+            Client.name.label('client_name'),
+            Printer.id.label('printer_id'),
+            Printer.name.label('printer_name'),
+            Printer.serial_number,
+            Printer.ip_address,
+            p.first_reading_at,
+            p.last_reading_at,
+            p.start_counter,
+            p.end_counter,
+            p.total_pages,
+            p.color_pages,
+            p.bw_pages,
+            p.counter_resets,
+            p.samples
+        ).select_from(per_printer).join(
+            Printer, Printer.id == p.printer_id
+        ).outerjoin(
+            Client, Client.id == Printer.client_id
+        ).order_by(Client.name, Printer.name, Printer.id)
+
+    def iter_rows(self, start: datetime, end: datetime, client_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Filas del informe leídas por lotes con cursor de servidor."""
+        result = self.db.execute(
+            self.billing_query(start, end, client_id),
+            execution_options={"yield_per": 1000}
+        )
+        for row in result.mappings():
+            yield dict(row)
+
+
+def _cell(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_csv(rows: Iterable[Dict[str, Any]], handle) -> int:
+    writer = csv.writer(handle)
+    writer.writerow(BILLING_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(row[column]) for column in BILLING_COLUMNS])
+        count += 1
+    return count
+
+
+def csv_chunks(rows: Iterable[Dict[str, Any]], chunk_rows: int = 500) -> Iterator[str]:
+    """CSV en trozos de `chunk_rows` filas, para respuestas en streaming."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BILLING_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow([_cell(row[column]) for column in BILLING_COLUMNS])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue()
+
+
+def write_xlsx(rows: Iterable[Dict[str, Any]], path: str, totals: Optional['_Totals'] = None) -> int:
+    """
+    Escribe el informe en modo write_only (memoria constante). openpyxl es opcional.
+    Si se pasan `totals`, añade una hoja con el resumen por cliente.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("La exportación XLSX requiere el paquete openpyxl")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Impresoras")
+    sheet.append(BILLING_COLUMNS)
+    count = 0
+    for row in rows:
+        sheet.append([row[column] for column in BILLING_COLUMNS])
+        count += 1
+
+    if totals is not None:
+        summary = workbook.create_sheet("Clientes")
+        summary.append(_SUMMARY_COLUMNS)
+        for client in totals.clients.values():
+            summary.append([client[column] for column in _SUMMARY_COLUMNS])
+    workbook.save(path)
+    return count
+
+
+class _Totals:
+    """Acumula totales por cliente mientras se escriben las filas."""
+
+    def __init__(self):
+        self.clients: Dict[Any, Dict[str, Any]] = {}
+
+    def track(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for row in rows:
+            totals = self.clients.setdefault(row['client_id'], {
+                'client_id': row['client_id'],
+                'client_name': row['client_name'],
+                'printers': 0, 'total_pages': 0, 'color_pages': 0, 'bw_pages': 0
+            })
+            totals['printers'] += 1
+            for key in ('total_pages', 'color_pages', 'bw_pages'):
+                totals[key] += row[key] or 0
+            yield row
+
+
+# --- Jobs en segundo plano (estado en un JSON junto al fichero) ---
+
+def _job_path(job_id: str, extension: str) -> str:
+    return os.path.join(settings.REPORTS_STORAGE_PATH, f"{job_id}.{extension}")
+
+
+def _write_job(job: Dict[str, Any]):
+    path = _job_path(job['id'], 'json')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(job, handle, default=str)
+    os.replace(tmp_path, path)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if not _JOB_ID.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id, 'json'), encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def job_file(job: Dict[str, Any]) -> str:
+    return _job_path(job['id'], job['format'])
+
+
+def create_billing_job(start: datetime, end: datetime, client_id: Optional[int], format: str) -> Dict[str, Any]:
+    job = {
+        'id': uuid.uuid4().hex,
+        'type': 'billing',
+        'status': ReportStatus.PENDING,
+        'format': format,
+        'params': {'start': start.isoformat(), 'end': end.isoformat(), 'client_id': client_id},
+        'created_at': datetime.utcnow().isoformat(),
+        'finished_at': None,
+        'rows': None,
+        'summary': None,
+        'error': None
+    }
+    _write_job(job)
+    return job
+
+
+def _keep_alive(job_id: str, done: threading.Event):
+    """Renueva el mtime del JSON de un job en curso (ver fail_stale_jobs)."""
+    path = _job_path(job_id, 'json')
+    while not done.wait(settings.REPORT_JOB_HEARTBEAT_INTERVAL):
+        try:
+            os.utime(path)
+        except OSError as e:
+            logger.warning(f"No se pudo renovar el job de informe {job_id}: {e}")
+
+
+def run_billing_job(job_id: str):
+    """
+    Genera el fichero de un job de facturación (se ejecuta en el threadpool).
+    """
+    job = get_job(job_id)
+    if job is None:
+        return
+    job['status'] = ReportStatus.RUNNING
+    _write_job(job)
+
+    done = threading.Event()
+    threading.Thread(target=_keep_alive, args=(job_id, done), daemon=True).start()
+    params = job['params']
+    db = SessionLocal()
+    try:
+        totals = _Totals()
+        rows = totals.track(BillingReportService(db).iter_rows(
+            datetime.fromisoformat(params['start']),
+            datetime.fromisoformat(params['end']),
+            params['client_id']
+        ))
+        path = job_file(job)
+        if job['format'] == 'xlsx':
+            count = write_xlsx(rows, path, totals)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as handle:
+                count = write_csv(rows, handle)
+
+        job.update(
+            status=ReportStatus.COMPLETED,
+            rows=count,
+            summary=list(totals.clients.values())
+        )
+        logger.info(f"Informe de facturación {job_id} generado: {count} impresoras")
+    except Exception as e:
+        logger.error(f"Error generando informe de facturación {job_id}: {str(e)}")
+        job.update(status=ReportStatus.FAILED, error=str(e))
+    finally:
+        done.set()
+        db.close()
+        job['finished_at'] = datetime.utcnow().isoformat()
+        _write_job(job)
+
+
+def _job_files():
+    try:
+        with os.scandir(settings.REPORTS_STORAGE_PATH) as entries:
+            return [entry for entry in entries if entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def fail_stale_jobs(now: Optional[float] = None) -> int:
+    """
+    Marca como fallidos los jobs pendientes o en curso cuyo JSON lleva
+    REPORT_JOB_STALE_AFTER segundos sin renovarse. Corrían en un
+    BackgroundTask de un worker que se reinició; los vivos los renueva
+    `_keep_alive` en cualquier worker.
+
+    :return: Jobs marcados como fallidos
+    """
+    cutoff = (now or time.time()) - settings.REPORT_JOB_STALE_AFTER
+    failed = 0
+    for entry in _job_files():
+        job_id, extension = os.path.splitext(entry.name)
+        if extension != '.json' or entry.stat().st_mtime >= cutoff:
+            continue
+        job = get_job(job_id)
+        if job is None or job['status'] not in (ReportStatus.PENDING, ReportStatus.RUNNING):
+            continue
+        job.update(
+            status=ReportStatus.FAILED,
+            error="Interrumpido: el servidor se reinició durante la generación",
+            finished_at=datetime.utcnow().isoformat()
+        )
+        _write_job(job)
+        failed += 1
+    if failed:
+        logger.warning(f"⚠️ {failed} informes huérfanos marcados como fallidos")
+    return failed
+
+
+def purge_old_reports(now: Optional[float] = None) -> int:
+    """
+    Borra los JSON de estado y los ficheros de informes con más de
+    REPORT_RETENTION_DAYS días sin modificarse.
+
+    :return: Ficheros eliminados
+    """
+    cutoff = (now or time.time()) - settings.REPORT_RETENTION_DAYS * 86400
+    removed = 0
+    for entry in _job_files():
+        if entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        logger.info(f"Informes eliminados por retención: {removed} ficheros")
+    return removed
+
+
+def run_report_maintenance():
+    """Tarea periódica (y al arrancar): jobs huérfanos y retención de ficheros."""
+    fail_stale_jobs()
+    purge_old_reports()
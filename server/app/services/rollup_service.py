@@ -0,0 +1,176 @@
+# server/app/services/rollup_service.py
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.db.models.printer import Printer
+from app.db.models.printer_rollup import PrinterRollup
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('hour', 'day', 'month')
+
+# Nivel más fino cuyo número de puntos sigue siendo manejable para un rango
+_TIER_MAX_SPAN = {
+    'hour': timedelta(days=3),
+    'day': timedelta(days=120)
+}
+
+_COUNTERS = ('total_pages', 'color_pages', 'bw_pages')
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    """Inicio del periodo de `granularity` que contiene `ts`."""
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'hour':
+        return ts
+    ts = ts.replace(hour=0)
+    if granularity == 'day':
+        return ts
+    return ts.replace(day=1)
+
+
+def pick_granularity(start: datetime, end: datetime) -> str:
+    """Elige el nivel de agregación según la duración del rango."""
+    span = end - start
+    for granularity, max_span in _TIER_MAX_SPAN.items():
+        if span <= max_span:
+            return granularity
+    return 'month'
+
+
+def counter_delta(previous: Optional[int], current: Optional[int]) -> int:
+    """
+    Páginas entre dos lecturas de un contador.
+
+    Si el contador bajó (reinicio o cambio de placa) se cuentan las páginas
+    desde el reinicio, es decir, el valor actual.
+    """
+    if previous is None or current is None:
+        return 0
+    return current - previous if current >= previous else current
+
+
+def min_toner_percentage(supplies: Optional[Dict[str, Any]]) -> Optional[int]:
+    percentages = [
+        toner.get('percentage')
+        for toner in ((supplies or {}).get('toners') or {}).values()
+        if isinstance(toner, dict) and isinstance(toner.get('percentage'), (int, float))
+    ]
+    return int(min(percentages)) if percentages else None
+
+
+class PrinterRollupService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def apply(self, samples: List[Dict[str, Any]]):
+        """
+        Suma muestras a sus periodos de hora, día y mes con un único upsert.
+
+        Cada muestra es un dict con las columnas de PrinterSample más
+        `previous_counters` (lectura anterior de la impresora). No puede haber
+        dos muestras de la misma impresora en la misma llamada.
+        """
+        if not samples:
+            return
+        rows = []
+        for sample in samples:
+            previous = sample.get('previous_counters') or {}
+            deltas = {
+                f'{name}_delta': counter_delta(previous.get(name), sample.get(name))
+                for name in _COUNTERS
+            }
+            for granularity in GRANULARITIES:
+                rows.append({
+                    'printer_id': sample['printer_id'],
+                    'granularity': granularity,
+                    'bucket': truncate(sample['ts'], granularity),
+                    'last_total_pages': sample.get('total_pages'),
+                    'last_color_pages': sample.get('color_pages'),
+                    'last_bw_pages': sample.get('bw_pages'),
+                    'min_toner_percentage': min_toner_percentage(sample.get('supplies')),
+                    'sample_count': 1,
+                    'last_ts': sample['ts'],
+                    **deltas
+                })
+
+        stmt = insert(PrinterRollup).values(rows)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PrinterRollup.printer_id, PrinterRollup.granularity, PrinterRollup.bucket],
+            set_={
+                **{
+                    f'{name}_delta': getattr(PrinterRollup, f'{name}_delta') + getattr(excluded, f'{name}_delta')
+                    for name in _COUNTERS
+                },
+                **{
+                    f'last_{name}': func.coalesce(getattr(excluded, f'last_{name}'), getattr(PrinterRollup, f'last_{name}'))
+                    for name in _COUNTERS
+                },
+                # LEAST ignora NULL en PostgreSQL
+                'min_toner_percentage': func.least(PrinterRollup.min_toner_percentage, excluded.min_toner_percentage),
+                'sample_count': PrinterRollup.sample_count + 1,
+                'last_ts': excluded.last_ts
+            }
+        )
+        self.db.execute(stmt)
+
+    def get_series(
+        self,
+        start: datetime,
+        end: datetime,
+        printer_ids: Optional[List[int]] = None,
+        client_id: Optional[int] = None,
+        granularity: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Serie de páginas y toner mínimo, sumada sobre las impresoras seleccionadas.
+
+        :param start: Inicio del rango (UTC)
+        :param end: Fin del rango (UTC, exclusivo)
+        :param printer_ids: Impresoras a incluir
+        :param client_id: Alternativa a printer_ids: todas las impresoras del cliente
+        :param granularity: Nivel forzado; por defecto se elige según el rango
+        """
+        granularity = granularity or pick_granularity(start, end)
+        query = self.db.query(
+            PrinterRollup.bucket,
+            func.sum(PrinterRollup.total_pages_delta),
+            func.sum(PrinterRollup.color_pages_delta),
+            func.sum(PrinterRollup.bw_pages_delta),
+            func.min(PrinterRollup.min_toner_percentage),
+            func.count(PrinterRollup.printer_id.distinct())
+        ).filter(
+            PrinterRollup.granularity == granularity,
+            PrinterRollup.bucket >= truncate(start, granularity),
+            PrinterRollup.bucket < end
+        )
+        if printer_ids:
+            query = query.filter(PrinterRollup.printer_id.in_(printer_ids))
+        if client_id is not None:
+            query = query.filter(PrinterRollup.printer_id.in_(
+                self.db.query(Printer.id).filter(Printer.client_id == client_id)
+            ))
+
+        rows = query.group_by(PrinterRollup.bucket).order_by(PrinterRollup.bucket).all()
+        return {
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': [
+                {
+                    'bucket': bucket.isoformat(),
+                    'total_pages': int(total or 0),
+                    'color_pages': int(color or 0),
+                    'bw_pages': int(bw or 0),
+                    'min_toner_percentage': min_toner,
+                    'printers': printers
+                }
+                for bucket, total, color, bw, min_toner, printers in rows
+            ]
+        }
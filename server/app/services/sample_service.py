@@ -0,0 +1,222 @@
+# server/app/services/sample_service.py
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.printer_sample import PrinterSample
+from app.db.session import SessionLocal
+from app.services.rollup_service import PrinterRollupService
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r'^printer_samples_y(\d{4})m(\d{2})$')
+_DEFAULT_PARTITION = f"{PrinterSample.__tablename__}_default"
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def _partition_name(month: datetime) -> str:
+    return f"{PrinterSample.__tablename__}_y{month.year}m{month.month:02d}"
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_counters(counters: Optional[Dict[str, Any]]) -> Dict[str, Optional[int]]:
+    """
+    Normaliza los contadores de páginas.
+
+    Acepta el formato del agente (total_pages, color_pages, bw_pages) y el
+    formato por defecto del modelo (total, color.total, black_white).
+    """
+    counters = counters or {}
+    color = counters.get('color')
+    if isinstance(color, dict):
+        color = color.get('total')
+    return {
+        'total_pages': _as_int(counters.get('total_pages', counters.get('total'))),
+        'color_pages': _as_int(counters.get('color_pages', color)),
+        'bw_pages': _as_int(counters.get('bw_pages', counters.get('black_white')))
+    }
+
+
+class PrinterSampleService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(self, entries: List[Dict[str, Any]], ts: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Inserta una muestra por impresora y la suma a los agregados por hora,
+        día y mes (dos sentencias para todo el lote, sin commit).
+
+        :param entries: Dicts con printer_id, status, printer_data,
+            min_supply_percentage y previous_counters (extract_counters)
+        :param ts: Momento de las muestras; por defecto ahora (UTC)
+        :return: Las muestras insertadas
+        """
+        if not entries:
+            return []
+        ts = ts or datetime.utcnow()
+        samples = []
+        for entry in entries:
+            data = entry.get('printer_data') or {}
+            counters = data.get('counters') or {}
+            samples.append({
+                'printer_id': entry['printer_id'],
+                'ts': ts,
+                'status': entry.get('status'),
+                'min_supply_percentage': entry.get('min_supply_percentage'),
+                'counters': counters,
+                'supplies': data.get('supplies') or {},
+                **extract_counters(counters)
+            })
+
+        self.db.execute(insert(PrinterSample), samples)
+        PrinterRollupService(self.db).apply([
+            {**sample, 'previous_counters': entry.get('previous_counters')}
+            for sample, entry in zip(samples, entries)
+        ])
+        return samples
+
+    def get_samples(self, printer_id: int, since: datetime, until: Optional[datetime] = None) -> List[PrinterSample]:
+        """Muestras de una impresora en [since, until), por rango sobre (printer_id, ts)."""
+        query = self.db.query(PrinterSample).filter(
+            PrinterSample.printer_id == printer_id,
+            PrinterSample.ts >= since
+        )
+        if until is not None:
+            query = query.filter(PrinterSample.ts < until)
+        return query.order_by(PrinterSample.ts).all()
+
+    def get_history(self, printer_id: int, days: int = 7) -> Dict[str, List]:
+        """
+        Histórico de los últimos `days` días con el formato de la API:
+        entradas {timestamp, data} para contadores y consumibles, y los cambios de estado.
+        """
+        samples = self.get_samples(printer_id, datetime.utcnow() - timedelta(days=days))
+        history = {'counters': [], 'supplies': [], 'errors': [], 'status_changes': []}
+        previous_status = None
+        for sample in samples:
+            timestamp = sample.ts.isoformat()
+            history['counters'].append({'timestamp': timestamp, 'data': sample.counters})
+            history['supplies'].append({'timestamp': timestamp, 'data': sample.supplies})
+            if sample.status != previous_status:
+                history['status_changes'].append({
+                    'timestamp': timestamp,
+                    'status': sample.status,
+                    'previous_status': previous_status
+                })
+                previous_status = sample.status
+        return history
+
+    def ensure_partitions(self, months_ahead: Optional[int] = None, now: Optional[datetime] = None) -> List[str]:
+        """
+        Crea la partición DEFAULT y las mensuales del mes actual y los siguientes.
+
+        La DEFAULT recoge las muestras fuera de toda partición mensual (reloj
+        del agente desfasado, mantenimiento atrasado) para que el insert del
+        lote no falle. Si ya guarda filas del mes de una partición nueva, se
+        mueven a esta antes de adjuntarla.
+
+        :return: Nombres de las particiones comprobadas
+        """
+        months_ahead = settings.SAMPLE_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+        first = _month_start(now or datetime.utcnow())
+        table = PrinterSample.__tablename__
+        # Varios workers arrancan a la vez: uno crea, los demás ya las ven
+        self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": table})
+        self.db.execute(text(f"CREATE TABLE IF NOT EXISTS {_DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"))
+        names = []
+        for offset in range(months_ahead + 1):
+            start = _add_months(first, offset)
+            end = _add_months(start, 1)
+            name = _partition_name(start)
+            if self.db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+                self._create_partition(name, start, end)
+            names.append(name)
+        self.db.commit()
+        return names
+
+    def _create_partition(self, name: str, start: datetime, end: datetime):
+        """
+        Crea la partición [start, end) fuera de la tabla, le pasa las filas de
+        ese rango que hubiera en la DEFAULT y la adjunta (ATTACH falla si la
+        DEFAULT conserva filas del rango).
+        """
+        table = PrinterSample.__tablename__
+        self.db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+        moved = self.db.execute(text(
+            f"WITH moved AS (DELETE FROM {_DEFAULT_PARTITION} WHERE ts >= :start AND ts < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), {"start": start, "end": end}).rowcount
+        self.db.execute(text(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        if moved:
+            logger.info(f"{moved} muestras movidas de {_DEFAULT_PARTITION} a {name}")
+
+    def apply_retention(self, retention_days: Optional[int] = None, now: Optional[datetime] = None) -> List[str]:
+        """
+        Elimina las particiones cuyo mes completo queda fuera de la retención
+        y las filas de esos meses que hubiera en la partición DEFAULT.
+
+        :return: Nombres de las particiones eliminadas
+        """
+        retention_days = settings.SAMPLE_RETENTION_DAYS if retention_days is None else retention_days
+        cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+        partitions = self.db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :parent"
+        ), {"parent": PrinterSample.__tablename__}).scalars().all()
+
+        dropped = []
+        for name in partitions:
+            match = _PARTITION_NAME.match(name)
+            if not match:
+                continue
+            month = datetime(int(match.group(1)), int(match.group(2)), 1)
+            if _add_months(month, 1) <= cutoff:
+                self.db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+        # Lo que cayó en la DEFAULT caduca con el mismo corte mensual
+        self.db.execute(
+            text(f"DELETE FROM {_DEFAULT_PARTITION} WHERE ts < :cutoff"),
+            {"cutoff": _month_start(cutoff)}
+        )
+        self.db.commit()
+        if dropped:
+            logger.info(f"Particiones de muestras eliminadas por retención: {dropped}")
+        return dropped
+
+
+def run_sample_maintenance():
+    """Tarea periódica: crea particiones futuras y aplica la retención."""
+    db = SessionLocal()
+    try:
+        service = PrinterSampleService(db)
+        service.ensure_partitions()
+        service.apply_retention()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
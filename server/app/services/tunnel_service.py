@@ -1,16 +1,60 @@
 # server/app/services/tunnel_service.py
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from ..db.models.tunnel import Tunnel
 from ..db.models.agent import Agent
 from ..schemas.tunnel import TunnelCreate
-from ..api.v1.endpoints.websocket import manager
+from ..services.websocket_manager import ws_manager
+from ..services.agent_rpc import AgentRPCError, agent_rpc
+from ..core.config import settings
+from ..db.session import SessionLocal
+from datetime import datetime, timedelta, timezone
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Listeners locales de túneles multiplexados (modo 'ws'), por tunnel_id
+_ws_listeners: Dict[str, asyncio.AbstractServer] = {}
+
+
+async def _start_ws_listener(tunnel_id: str, agent_token: str, port: int):
+    """Abre un puerto local cuyas conexiones viajan como streams por el websocket del agente."""
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = ws_manager.mux_session(agent_token)
+        if not session:
+            logger.warning(f"Conexión al túnel {tunnel_id} rechazada: agente desconectado")
+            writer.close()
+            return
+        try:
+            stream = await session.open_stream(tunnel_id)
+        except Exception as e:
+            logger.warning(f"El agente no pudo abrir un stream en {tunnel_id}: {e}")
+            writer.close()
+            return
+        await session.bridge(stream, reader, writer)
+
+    await _stop_ws_listener(tunnel_id)
+    _ws_listeners[tunnel_id] = await asyncio.start_server(
+        handle_client, settings.TUNNEL_BIND_HOST, port
+    )
+    logger.info(f"Listener del túnel {tunnel_id} en {settings.TUNNEL_BIND_HOST}:{port}")
+
+
+async def _stop_ws_listener(tunnel_id: str):
+    server = _ws_listeners.pop(tunnel_id, None)
+    if server:
+        server.close()
+        # Cerrar los streams antes de esperar: wait_closed espera a las conexiones activas
+        await asyncio.gather(
+            *(session.close_tag(tunnel_id, 'túnel cerrado') for session in ws_manager.mux_sessions()),
+            return_exceptions=True
+        )
+        await server.wait_closed()
+
 class TunnelService:
    def __init__(self, db: Session):
        self.db = db
@@ -41,6 +85,7 @@ class TunnelService:
                     logger.info(f"Actualizando túnel cerrado: {tunnel_id}")
                     existing_tunnel.status = 'creating'
                     existing_tunnel.agent_id = tunnel_data.agent_id
+                    existing_tunnel.mode = tunnel_data.mode
                     self.db.commit()
                     tunnel = existing_tunnel
             else:
@@ -52,6 +97,7 @@ class TunnelService:
                     remote_host=tunnel_data.remote_host,
                     remote_port=tunnel_data.remote_port,
                     local_port=tunnel_data.local_port,
+                    mode=tunnel_data.mode,
                     status='creating',
                     description=tunnel_data.description
                 )
@@ -71,17 +117,37 @@ class TunnelService:
                 )
 
             logger.debug(f"Verificando conexión WebSocket para agente: {agent.token}")
-            websocket = manager.agent_connections.get(agent.token)
-            if not websocket:
+            if not await ws_manager.is_connected(agent.token):
                 logger.error(f"Agente {agent.token} no está conectado")
                 return JSONResponse(
                     status_code=503,
                     content={"detail": "Agente no está conectado"}
                 )
 
+            if tunnel_data.mode == 'ws' and not ws_manager.get_connection(agent.token):
+                # Los frames del túnel viajan por el websocket: el listener debe estar en su worker
+                logger.error(f"Agente {agent.token} conectado a otro worker; túnel 'ws' no disponible aquí")
+                return JSONResponse(
+                    status_code=503,
+                    content={"detail": "Agente conectado a otro worker del servidor"}
+                )
+
+            if tunnel_data.mode == 'ws':
+                try:
+                    await _start_ws_listener(tunnel_id, agent.token, tunnel_data.local_port)
+                except OSError as e:
+                    logger.error(f"No se pudo abrir el puerto local {tunnel_data.local_port}: {e}")
+                    tunnel.status = 'error'
+                    self.db.commit()
+                    return JSONResponse(
+                        status_code=409,
+                        content={"detail": f"Puerto local {tunnel_data.local_port} no disponible: {e}"}
+                    )
+
             # Preparar comando para el agente
             command = {
                 'type': 'create_tunnel',
+                'mode': tunnel_data.mode,
                 'tunnel_id': tunnel_id,
                 'ssh_host': tunnel_data.ssh_host,
                 'ssh_port': tunnel_data.ssh_port,
@@ -92,13 +158,27 @@ class TunnelService:
                 'local_port': tunnel_data.local_port
             }
 
-            # Enviar comando al agente
+            # Enviar comando al agente y esperar su respuesta
             logger.debug(f"Enviando comando al agente: {command}")
             try:
-                await websocket.send_json(command)
-                logger.info(f"Comando enviado exitosamente al agente {agent.token}")
+                reply = await agent_rpc.call(agent.token, command, timeout=settings.TUNNEL_RPC_TIMEOUT)
+                logger.info(f"Agente {agent.token} respondió: {reply.get('status')} - {reply.get('message')}")
+            except asyncio.TimeoutError:
+                # Puede que el agente aún lo establezca: la conciliación periódica decide
+                logger.warning(f"Sin respuesta del agente {agent.token} para el túnel {tunnel_id}; queda en 'creating'")
+                return tunnel
+            except AgentRPCError as e:
+                logger.error(f"El agente no pudo crear el túnel {tunnel_id}: {e}")
+                await _stop_ws_listener(tunnel_id)
+                tunnel.status = 'error'
+                self.db.commit()
+                return JSONResponse(
+                    status_code=502,
+                    content={"detail": f"El agente no pudo crear el túnel: {e}"}
+                )
             except Exception as e:
                 logger.error(f"Error enviando comando al agente: {str(e)}")
+                await _stop_ws_listener(tunnel_id)
                 tunnel.status = 'error'
                 self.db.commit()
                 raise HTTPException(
@@ -106,6 +186,11 @@ class TunnelService:
                     detail=f"Error enviando comando al agente: {str(e)}"
                 )
 
+            if reply.get('status') != 'active':
+                await _stop_ws_listener(tunnel_id)
+            tunnel.status = 'active' if reply.get('status') == 'active' else 'error'
+            self.db.commit()
+
             return tunnel
 
         except Exception as e:
@@ -130,6 +215,8 @@ class TunnelService:
                    content={"detail": "Túnel no encontrado"}
                )
 
+           await _stop_ws_listener(tunnel_id)
+
            # Verificar agente
            agent = self.db.query(Agent).filter(Agent.id == tunnel.agent_id).first()
            if not agent:
@@ -141,9 +228,7 @@ class TunnelService:
 
            # Verificar conexión WebSocket
            logger.debug(f"Verificando conexión WebSocket para agente: {agent.token}")
-           websocket = manager.agent_connections.get(agent.token)
-           
-           if not websocket:
+           if not await ws_manager.is_connected(agent.token):
                logger.warning(f"Agente {agent.token} no está conectado, marcando túnel como cerrado")
                tunnel.status = 'closed'
                self.db.commit()
@@ -159,8 +244,8 @@ class TunnelService:
                    'tunnel_id': tunnel_id
                }
                logger.debug(f"Enviando comando de cierre: {command}")
-               await websocket.send_json(command)
-               logger.info(f"Comando de cierre enviado al agente {agent.token}")
+               reply = await agent_rpc.call(agent.token, command, timeout=settings.TUNNEL_RPC_TIMEOUT)
+               logger.info(f"Agente {agent.token} respondió al cierre: {reply.get('message')}")
            except Exception as e:
                logger.error(f"Error enviando comando de cierre: {str(e)}")
                # Aún así marcamos el túnel como cerrado
@@ -252,22 +337,114 @@ class TunnelService:
             logger.error(f"Error al obtener túneles: {str(e)}")
             return []
 
+   async def reconcile_statuses(self) -> Dict[str, int]:
+        """
+        Concilia Tunnel.status con el estado real en pocas consultas masivas.
+
+        - Agente desconectado de todos los workers -> 'closed'
+
+        El resto de reglas usan estado de este proceso (listeners 'ws' y
+        reportes tunnel_stats), así que solo se aplican a los túneles cuyo
+        agente tiene aquí su websocket; los demás los concilia su worker:
+        - Listener 'ws' inexistente -> 'closed'
+        - Reportado por el agente en su último tunnel_stats -> 'active'
+        - Activo pero ausente del último reporte del agente -> 'closed'
+        - En 'creating' más allá de TUNNEL_CREATING_TIMEOUT -> 'error'
+
+        El estado en memoria se toma en el event loop; las consultas, con la
+        sesión síncrona, corren en un hilo.
+        """
+        connected = await ws_manager.connected_tokens()
+        reports = {
+            token: ws_manager.tunnel_report(token)
+            for token in connected
+            if ws_manager.get_connection(token) is not None
+        }
+        changes = await asyncio.to_thread(self._apply_statuses, connected, reports, set(_ws_listeners))
+
+        for row in changes['closed'] + changes['error']:
+            if row.tunnel_id in _ws_listeners:
+                await _stop_ws_listener(row.tunnel_id)
+
+        summary = {status: len(changed) for status, changed in changes.items() if changed}
+        if summary:
+            logger.info(f"🧹 Túneles conciliados: {summary}")
+        return summary
+
+   def _apply_statuses(self, connected: Set[str], reports: Dict[str, Tuple], listeners: Set[str]) -> Dict[str, List]:
+        """
+        Parte síncrona de `reconcile_statuses`.
+
+        :param connected: Agentes conectados en cualquier worker
+        :param reports: Último tunnel_stats de los agentes conectados a este worker
+        :param listeners: tunnel_id con listener 'ws' en este worker
+        :return: Filas pasadas a cada estado
+        """
+        now = datetime.now(timezone.utc)
+        creating_deadline = now - timedelta(seconds=settings.TUNNEL_CREATING_TIMEOUT)
+
+        rows = self.db.query(
+            Tunnel.id, Tunnel.tunnel_id, Tunnel.status, Tunnel.mode, Tunnel.updated_at, Agent.token
+        ).outerjoin(Agent, Agent.id == Tunnel.agent_id).filter(
+            Tunnel.status.in_(['creating', 'active'])
+        ).all()
+
+        changes: Dict[str, List] = {'closed': [], 'active': [], 'error': []}
+        for row in rows:
+            updated_at = row.updated_at
+            if updated_at is not None and updated_at.tzinfo is None:
+                updated_at = updated_at.replace(tzinfo=timezone.utc)
+            if row.token not in connected:
+                changes['closed'].append(row)
+                continue
+            if row.token not in reports:
+                # Websocket en otro worker: su sweep tiene el listener y los reportes
+                continue
+
+            report_at, reported = reports[row.token]
+            if row.mode == 'ws' and row.tunnel_id not in listeners:
+                changes['closed'].append(row)
+            elif report_at and row.tunnel_id in reported:
+                if row.status == 'creating':
+                    changes['active'].append(row)
+            elif report_at and updated_at and updated_at < report_at and row.status == 'active':
+                changes['closed'].append(row)
+            elif row.status == 'creating' and updated_at and updated_at < creating_deadline:
+                changes['error'].append(row)
+
+        for status, changed in changes.items():
+            if changed:
+                self.db.query(Tunnel).filter(
+                    Tunnel.id.in_([row.id for row in changed])
+                ).update({Tunnel.status: status}, synchronize_session=False)
+        self.db.commit()
+        return changes
+
    def count_by_status(self) -> Dict[str, int]:
-        """Obtiene conteo de túneles por estado"""
+        """Obtiene conteo de túneles por estado (una consulta agregada)"""
         try:
-            counts = {
-                "total": 0,
-                "active": 0
+            rows = self.db.query(Tunnel.status, func.count(Tunnel.id))\
+                          .group_by(Tunnel.status)\
+                          .all()
+            by_status = {status: count for status, count in rows}
+            return {
+                "total": sum(by_status.values()),
+                "active": by_status.get('active', 0)
             }
-            
-            tunnels = self.get_all()
-            counts["total"] = len(tunnels)
-            counts["active"] = len([t for t in tunnels if t.status == 'active'])
-            
-            return counts
         except Exception as e:
             logger.error(f"Error contando túneles por estado: {str(e)}")
-            return {
-                "total": 0,
-                "active": 0
-            }
+            # La transacción abortada inutilizaría las siguientes consultas de la sesión
+            self.db.rollback()
+            raise
+
+async def run_tunnel_sweep():
+    """
+    Tarea periódica: concilia el estado de los túneles con su propia sesión.
+    Es async porque lee el estado de los websockets y cierra listeners en el
+    event loop; las consultas van en un hilo (ver reconcile_statuses).
+    """
+    db = SessionLocal()
+    try:
+        await TunnelService(db).reconcile_statuses()
+    finally:
+        db.close()
@@ -2,6 +2,7 @@
 from sqlalchemy.orm import Session
 from app.db.models.user import User, Permission, UserStatus
 from app.schemas.user import UserCreate, UserUpdate, UserInDB
+from app.core.cache import invalidate_user
 from fastapi import HTTPException
 import logging
 from typing import Optional, List
@@ -81,6 +82,8 @@ class UserService:
             if not user:
                 return None
 
+            previous_username = user.username
+
             # Actualizar campos
             for field, value in user_data.dict(exclude_unset=True).items():
                 setattr(user, field, value)
@@ -90,6 +93,7 @@ class UserService:
 
             self.db.commit()
             self.db.refresh(user)
+            invalidate_user(previous_username)
             
             logger.info(f"Usuario actualizado exitosamente: {user.username}")
             return user
@@ -117,6 +121,7 @@ class UserService:
             user.updated_at = datetime.utcnow()
             
             self.db.commit()
+            invalidate_user(user.username)
             logger.info(f"Contraseña cambiada exitosamente para usuario: {user.username}")
             return True
             
@@ -137,6 +142,7 @@ class UserService:
             user.updated_at = datetime.utcnow()
             
             self.db.commit()
+            invalidate_user(user.username)
             logger.info(f"Usuario desactivado: {user.username}")
             return True
             
@@ -175,6 +181,7 @@ class UserService:
                     logger.warning(f"Usuario bloqueado por múltiples intentos fallidos: {username}")
                 
                 self.db.commit()
+                invalidate_user(username)
                 return None
             
             # Login exitoso: resetear contadores
@@ -1,29 +1,204 @@
 # server/app/services/websocket_manager.py
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
 from fastapi import WebSocket
-from typing import Dict
+
 from app.core.config import settings
+from app.core.tunnel_mux import MuxSession
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[bool]]
+Reply = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+
+class AgentNotConnectedError(ValueError):
+    """El agente no tiene un websocket abierto en ningún worker."""
+
+
+class AgentConnection:
+    """Websocket de un agente y el estado que vive con él en este worker."""
+
+    def __init__(self, agent_token: str, websocket: WebSocket,
+                 agent_id: Optional[int] = None, client_id: Optional[int] = None):
+        self.agent_token = agent_token
+        self.websocket = websocket
+        self.agent_id = agent_id
+        self.client_id = client_id
+        self.connected_at = datetime.now(timezone.utc)
+        # Sesión de túneles multiplexados (frames binarios del websocket)
+        self.mux = MuxSession(websocket.send_bytes)
+        # Último reporte de túneles activos: (fecha, {tunnel_id})
+        self.tunnel_report: Optional[Tuple[datetime, Set[str]]] = None
+
+
+class CommandBackend:
+    """
+    Transporte de comandos entre workers.
+
+    Esta implementación no cruza procesos: un agente conectado a otro worker
+    se considera desconectado. Otras implementaciones registran qué worker
+    es dueño de cada agente y le reenvían los comandos, que ese worker
+    entrega con `deliver`; las respuestas a peticiones de otro nodo se
+    reenvían a `node_id` y allí se entregan con `reply`.
+    """
+    node_id = "local"
+
+    async def start(self, deliver: Deliver, reply: Reply):
+        self._deliver = deliver
+        self._reply = reply
+
+    async def stop(self):
+        pass
+
+    async def register(self, agent_token: str):
+        """Este worker pasa a ser el dueño del websocket del agente."""
+
+    async def unregister(self, agent_token: str):
+        """Este worker deja de ser el dueño del websocket del agente."""
+
+    async def publish(self, agent_token: str, command: Dict[str, Any]) -> bool:
+        """Reenvía un comando al worker dueño; False si ninguno lo tiene."""
+        return False
+
+    async def publish_reply(self, node_id: str, message: Dict[str, Any]) -> bool:
+        """Reenvía la respuesta de un agente al nodo que hizo la petición."""
+        return False
+
+    async def is_connected(self, agent_token: str) -> bool:
+        """Si el agente está conectado en otro worker."""
+        return False
+
+    async def connected_tokens(self) -> Set[str]:
+        """Agentes conectados en otros workers."""
+        return set()
+
+
+def _build_backend(name: str) -> CommandBackend:
+    if name == "local":
+        return CommandBackend()
+    if name == "postgres":
+        from app.services.agent_routing import PostgresCommandBackend
+        return PostgresCommandBackend()
+    raise ValueError(f"Backend de comandos desconocido: {name}")
+
+
+class CommandBus:
+    """
+    Entrega comandos al websocket de un agente, esté en este worker o en otro.
+
+    El agente local se resuelve con una búsqueda en el registro; el resto
+    se delega al backend.
+    """
+
+    def __init__(self, connections: Dict[str, AgentConnection], backend: CommandBackend):
+        self._connections = connections
+        self.backend = backend
+
+    async def send(self, agent_token: str, command: Dict[str, Any]):
+        """
+        :raises AgentNotConnectedError: Si ningún worker tiene el websocket del agente
+        """
+        if await self.deliver_local(agent_token, command):
+            return
+        if not await self.backend.publish(agent_token, command):
+            raise AgentNotConnectedError(f"Agent {agent_token} not connected")
+
+    async def deliver_local(self, agent_token: str, command: Dict[str, Any]) -> bool:
+        connection = self._connections.get(agent_token)
+        if connection is None:
+            return False
+        await connection.websocket.send_json(command)
+        return True
+
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, agent_token: str, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[agent_token] = websocket
-    
-    def disconnect(self, agent_token: str):
-        if agent_token in self.active_connections:
-            del self.active_connections[agent_token]
-    
-    async def send_message(self, agent_token: str, message: dict):
-        if agent_token in self.active_connections:
-            try:
-                await self.active_connections[agent_token].send_json(message)
-            except Exception as e:
-                print(f"Error sending message to {agent_token}: {e}")
-                self.disconnect(agent_token)
-
-    def get_connection(self, agent_token: str) -> WebSocket:
-        return self.active_connections.get(agent_token)
-
-ws_manager = WebSocketManager()
\ No newline at end of file
+    """
+    Registro único de websockets de agentes de este worker.
+
+    Los servicios envían comandos con `send_command` (vía CommandBus) y no
+    acceden nunca al websocket directamente.
+    """
+
+    def __init__(self, backend: Optional[CommandBackend] = None):
+        self.connections: Dict[str, AgentConnection] = {}
+        self.bus = CommandBus(self.connections, backend or _build_backend(settings.COMMAND_BUS_BACKEND))
+        # Destino de las respuestas reenviadas desde otros nodos (AgentRPC)
+        self.reply_handler: Optional[Reply] = None
+
+    async def start(self):
+        await self.bus.backend.start(self.bus.deliver_local, self._on_reply)
+
+    async def _on_reply(self, message: Dict[str, Any]) -> bool:
+        if self.reply_handler is None:
+            return False
+        return await self.reply_handler(message)
+
+    async def stop(self):
+        await self.bus.backend.stop()
+
+    async def connect(self, agent_token: str, websocket: WebSocket,
+                      agent_id: Optional[int] = None, client_id: Optional[int] = None) -> AgentConnection:
+        """Registra un websocket ya aceptado; sustituye la conexión anterior del agente."""
+        previous = self.connections.get(agent_token)
+        if previous is not None:
+            previous.mux.close_all('agente reconectado')
+        connection = AgentConnection(agent_token, websocket, agent_id, client_id)
+        self.connections[agent_token] = connection
+        await self.bus.backend.register(agent_token)
+        logger.info(f"Agent {agent_token} connected successfully")
+        return connection
+
+    async def disconnect(self, agent_token: str, websocket: Optional[WebSocket] = None):
+        """
+        Elimina la conexión del agente. Con `websocket`, solo si sigue siendo
+        la registrada (una reconexión ya pudo sustituirla).
+        """
+        connection = self.connections.get(agent_token)
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            logger.warning(f"Agent {agent_token} not found in connections")
+            return
+        del self.connections[agent_token]
+        connection.mux.close_all('agente desconectado')
+        await self.bus.backend.unregister(agent_token)
+        logger.info(f"Agent {agent_token} disconnected")
+
+    def get_connection(self, agent_token: str) -> Optional[AgentConnection]:
+        return self.connections.get(agent_token)
+
+    def mux_session(self, agent_token: str) -> Optional[MuxSession]:
+        connection = self.connections.get(agent_token)
+        return connection.mux if connection else None
+
+    def mux_sessions(self) -> Iterable[MuxSession]:
+        return [connection.mux for connection in self.connections.values()]
+
+    def record_tunnel_report(self, agent_token: str, tunnels: Iterable[str]):
+        connection = self.connections.get(agent_token)
+        if connection:
+            connection.tunnel_report = (datetime.now(timezone.utc), set(tunnels))
+
+    def tunnel_report(self, agent_token: str) -> Tuple[Optional[datetime], Set[str]]:
+        connection = self.connections.get(agent_token)
+        if connection is None or connection.tunnel_report is None:
+            return None, set()
+        return connection.tunnel_report
+
+    async def is_connected(self, agent_token: str) -> bool:
+        return agent_token in self.connections or await self.bus.backend.is_connected(agent_token)
+
+    async def connected_tokens(self) -> Set[str]:
+        """Agentes conectados en cualquier worker."""
+        return set(self.connections) | await self.bus.backend.connected_tokens()
+
+    async def send_command(self, agent_token: str, command: Dict[str, Any]):
+        """
+        :raises AgentNotConnectedError: Si el agente no está conectado
+        """
+        logger.debug(f"Sending command to agent {agent_token}: {command.get('type')}")
+        await self.bus.send(agent_token, command)
+
+
+ws_manager = WebSocketManager()
@@ -0,0 +1,199 @@
+# server/app/utils/pagination.py
+"""
+Paginación por cursor (keyset), proyección de campos y exportación NDJSON
+para los endpoints de listados.
+
+Un listado paginado ordena por una clave única (normalmente el id) y pide
+`limit + 1` filas: si sobra una, el cursor de la siguiente página va en la
+cabecera X-Next-Cursor y el cuerpo sigue siendo la lista de siempre. El
+cliente repite la petición con ?cursor=<valor> hasta que la cabecera falta.
+A diferencia de OFFSET, el coste de cada página no crece con la profundidad.
+
+Solo se pagina si la petición trae ?limit= o ?cursor=: sin ellos el listado
+sale completo, como antes, para no recortar a los clientes que no siguen
+el cursor.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import tuple_
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Codifica los valores de la clave de la última fila en un cursor opaco."""
+    raw = json.dumps(jsonable_encoder(list(values)), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    :raises HTTPException: 400 si el cursor no es válido para esta clave
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+
+class PageParams:
+    """
+    Dependencia con los parámetros ?cursor= y ?limit= de un listado.
+
+        page: PageParams = Depends()
+        rows = page.apply(db.query(Model), Model.id).all()
+        return page.finish(rows, response, key=lambda row: (row.id,))
+
+    Sin ninguno de los dos, `limit` es None y el listado no se pagina.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+        limit: Optional[int] = Query(
+            None, ge=1, le=settings.PAGE_MAX_LIMIT,
+            description=f"Filas por página (con cursor, {settings.PAGE_DEFAULT_LIMIT} si se omite)"
+        )
+    ):
+        self.cursor = cursor
+        if limit is None and cursor is not None:
+            limit = settings.PAGE_DEFAULT_LIMIT
+        self.limit = limit
+
+    @property
+    def fetch_limit(self) -> Optional[int]:
+        """Filas a leer: una de más para saber si hay otra página, o None sin paginar."""
+        return self.limit + 1 if self.limit is not None else None
+
+    def apply(self, query, *keys):
+        """Filtra tras el cursor, ordena por `keys` y pide una fila de más (Query o Select)."""
+        return keyset(query, keys, self.cursor).limit(self.fetch_limit)
+
+    def finish(self, rows: List[Any], response: Response, key: Callable[[Any], Sequence[Any]]) -> List[Any]:
+        """Recorta la fila de más y, si la había, publica el cursor siguiente."""
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key(rows[-1]))
+        return rows
+
+
+def keyset(query, keys: Sequence[Any], cursor: Optional[str] = None):
+    """Ordena por `keys` y, con cursor, continúa tras la última fila que entregó."""
+    values = decode_cursor(cursor, len(keys)) if cursor else None
+    return _after(query, keys, values)
+
+
+def _after(query, keys: Sequence[Any], values: Optional[Sequence[Any]]):
+    if values is not None:
+        if len(keys) == 1:
+            query = query.filter(keys[0] > values[0])
+        else:
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+    return query.order_by(*keys)
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Interpreta ?fields=a,b,c.
+
+    :return: Campos pedidos en orden y sin repetir, o None si no se pidió proyección
+    :raises HTTPException: 400 si se pide un campo que no existe
+    """
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    allowed = list(allowed)
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(allowed)}"
+        )
+    return requested or None
+
+
+def column_names(model) -> List[str]:
+    """Columnas de un modelo, para usarlas como campos proyectables."""
+    return list(model.__table__.columns.keys())
+
+
+def project(model, fields: Sequence[str], keys: Sequence[str] = ("id",)) -> List[Any]:
+    """
+    Columnas a seleccionar con `with_entities` para `fields`. Siempre incluye
+    las de la clave, que hacen falta para el cursor.
+    """
+    names = list(dict.fromkeys([*fields, *keys]))
+    return [getattr(model, name) for name in names]
+
+
+def row_to_dict(row, fields: Sequence[str]) -> Dict[str, Any]:
+    """Fila de una proyección (o instancia ORM) restringida a `fields`."""
+    return {name: getattr(row, name) for name in fields}
+
+
+def projected_response(items: Any, response: Response) -> JSONResponse:
+    """
+    Devuelve filas proyectadas sin pasar por el response_model del endpoint.
+    Una respuesta devuelta directamente no hereda las cabeceras de `response`,
+    así que se copia el cursor.
+    """
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else None
+    return JSONResponse(jsonable_encoder(items), headers=headers)
+
+
+def iter_keyset(
+    build_query: Callable[[Any], Any],
+    keys: Sequence[Any],
+    key: Callable[[Any], Sequence[Any]],
+    serialize: Callable[[Any], Dict[str, Any]],
+    batch_size: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre un listado completo por lotes keyset con su propia sesión.
+
+    :param build_query: Recibe la sesión y devuelve la Query sin ordenar
+    :param keys: Columnas de la clave (únicas en conjunto)
+    :param key: Valores de la clave de una fila
+    :param serialize: Convierte una fila en el dict a emitir
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        last = None
+        while True:
+            rows = _after(build_query(db), keys, last).limit(batch_size).all()
+            for row in rows:
+                yield serialize(row)
+            if len(rows) < batch_size:
+                return
+            last = key(rows[-1])
+            # Las instancias del lote ya emitido no se vuelven a usar
+            db.expunge_all()
+    finally:
+        db.close()
+
+
+def ndjson_response(items: Iterable[Dict[str, Any]], filename: Optional[str] = None) -> StreamingResponse:
+    """Respuesta NDJSON (un objeto JSON por línea) que se genera mientras se envía."""
+
+    def lines():
+        for item in items:
+            yield json.dumps(jsonable_encoder(item), ensure_ascii=False) + "\n"
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else None
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,38 @@
+# server/app/utils/prefix_trie.py
+from typing import Dict, Iterable
+
+_TERMINAL = ""  # Los segmentos nunca son vacíos: sirve de marca de fin de prefijo
+
+
+class PrefixTrie:
+    """
+    Trie por segmentos de ruta, precompilado una sola vez al arrancar.
+
+    `match("/api/v1/printer-oids/5")` es cierto si algún prefijo registrado
+    coincide con los primeros segmentos de la ruta; el coste depende de la
+    profundidad de la ruta y no del número de prefijos.
+    """
+
+    def __init__(self, prefixes: Iterable[str]):
+        self._root: Dict[str, dict] = {}
+        for prefix in prefixes:
+            node = self._root
+            for segment in self._segments(prefix):
+                node = node.setdefault(segment, {})
+            node[_TERMINAL] = {}
+
+    @staticmethod
+    def _segments(path: str):
+        return [segment for segment in path.split("/") if segment]
+
+    def match(self, path: str) -> bool:
+        node = self._root
+        for segment in path.split("/"):
+            if not segment:
+                continue
+            node = node.get(segment)
+            if node is None:
+                return False
+            if _TERMINAL in node:
+                return True
+        return _TERMINAL in node
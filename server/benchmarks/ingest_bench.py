@@ -0,0 +1,97 @@
+# server/benchmarks/ingest_bench.py
+"""
+Mide la ingesta de reportes de impresoras (reportes por segundo) contra la
+base de datos configurada en DATABASE_URL, que debe ser un PostgreSQL local
+con el esquema creado (basta con haber arrancado el servidor una vez).
+
+Uso (desde server/):
+
+    python -m benchmarks.ingest_bench [--printers 500] [--cycles 5] [--batch 200]
+
+Simula `--cycles` ciclos de monitoreo de `--printers` impresoras:
+- "por reporte": un update_printer_data (un commit) por reporte.
+- "por lote": upsert_printers de `--batch` reportes por commit.
+
+Las impresoras se crean en 10.254.0.0/16 con nombre "bench-*" y se borran
+al terminar (sus muestras y agregados se eliminan en cascada).
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import delete
+
+from app.db.models.printer import Printer
+from app.db.session import SessionLocal
+from app.services.monitor_service import PrinterMonitorService
+
+_NAME_PREFIX = "bench-"
+
+
+def _report(index: int, cycle: int) -> dict:
+    pages = 10000 + cycle * 50 + index
+    return {
+        "name": f"{_NAME_PREFIX}{index}",
+        "brand": "Bench",
+        "model": "B-1000",
+        "ip_address": f"10.254.{index // 256}.{index % 256}",
+        "serial_number": f"BENCH{index:06d}",
+        "status": random.choice(["online", "online", "online", "error"]),
+        "printer_data": {
+            "counters": {"total_pages": pages, "color_pages": pages // 3, "bw_pages": pages - pages // 3},
+            "supplies": {
+                "toners": {
+                    color: {"level": level, "max": 100, "percentage": level}
+                    for color, level in (("black", random.randint(0, 100)), ("cyan", random.randint(0, 100)))
+                }
+            }
+        }
+    }
+
+
+def _cleanup(db):
+    db.execute(delete(Printer).where(Printer.name.like(f"{_NAME_PREFIX}%")))
+    db.commit()
+
+
+def run_single(db, printers: int, cycles: int) -> float:
+    service = PrinterMonitorService(db)
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        for index in range(printers):
+            service.update_printer_data(_report(index, cycle))
+    return printers * cycles / (time.perf_counter() - start)
+
+
+def run_batched(db, printers: int, cycles: int, batch: int) -> float:
+    service = PrinterMonitorService(db)
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        reports = [(_report(index, cycle), None) for index in range(printers)]
+        for offset in range(0, len(reports), batch):
+            service.upsert_printers(reports[offset:offset + batch])
+            db.commit()
+    return printers * cycles / (time.perf_counter() - start)
+
+
+def main(printers: int, cycles: int, batch: int):
+    db = SessionLocal()
+    try:
+        _cleanup(db)
+        print(f"{'modo':<14} {'reportes/s':>12}")
+        print(f"{'por reporte':<14} {run_single(db, printers, cycles):>12.0f}")
+        _cleanup(db)
+        print(f"{'por lote':<14} {run_batched(db, printers, cycles, batch):>12.0f}")
+    finally:
+        db.rollback()
+        _cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--printers", type=int, default=500)
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+    main(args.printers, args.cycles, args.batch)
@@ -0,0 +1,151 @@
+# server/benchmarks/middleware_bench.py
+"""
+Compara la latencia (p50/p99) de la pila anterior de middlewares
+(ForceHttps + auth + first_login sobre BaseHTTPMiddleware) con AuthMiddleware.
+
+Uso (desde server/):
+
+    python -m benchmarks.middleware_bench [--requests 20000]
+
+Las peticiones se envían directamente a la aplicación ASGI, sin red. El
+usuario del token se precarga en `user_cache` para no depender de la base
+de datos: se mide solo el coste de los middlewares.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+import jwt
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from app.core.auth import create_access_token, get_current_user
+from app.core.cache import user_cache
+from app.core.config import settings
+from app.middleware.auth_middleware import PUBLIC_PATHS, AuthMiddleware
+
+
+async def _endpoint(request: Request):
+    return JSONResponse({"ok": True})
+
+
+def _build_inner_app() -> Starlette:
+    return Starlette(routes=[
+        Route("/api/v1/printers/", _endpoint),
+        Route("/api/v1/monitor/printers/", _endpoint),
+    ])
+
+
+# --- Pila anterior, reproducida tal como estaba en main.py ---
+
+async def _legacy_force_https(request: Request, call_next):
+    if request.headers.get('x-forwarded-proto') == 'http':
+        url = request.url.replace(scheme="https")
+        return Response(status_code=307, headers={"Location": str(url)})
+    return await call_next(request)
+
+
+async def _legacy_auth(request: Request, call_next):
+    if request.method == "OPTIONS":
+        return Response(status_code=200)
+    if any(request.url.path.startswith(path) for path in PUBLIC_PATHS):
+        return await call_next(request)
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return JSONResponse(status_code=401, content={"detail": "Token no proporcionado o inválido"})
+    current_user = await get_current_user(auth_header.split(" ")[1])
+    request.state.user = current_user
+    return await call_next(request)
+
+
+async def _legacy_first_login(request: Request, call_next):
+    if request.method == "OPTIONS":
+        return Response(status_code=200)
+    user = getattr(request.state, "user", None)
+    if user and user.must_change_password:
+        return Response(status_code=303)
+    return await call_next(request)
+
+
+def build_legacy_app():
+    app = BaseHTTPMiddleware(_build_inner_app(), dispatch=_legacy_force_https)
+    app = BaseHTTPMiddleware(app, dispatch=_legacy_auth)
+    return BaseHTTPMiddleware(app, dispatch=_legacy_first_login)
+
+
+def build_new_app():
+    return AuthMiddleware(_build_inner_app())
+
+
+# --- Cliente ASGI mínimo ---
+
+async def _request(app, path: str, headers: list) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": headers,
+        "server": ("testserver", 80), "client": ("127.0.0.1", 50000),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _measure(app, path: str, headers: list, requests: int):
+    for _ in range(min(500, requests)):
+        await _request(app, path, headers)
+
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        status = await _request(app, path, headers)
+        samples.append(time.perf_counter() - start)
+    assert status == 200, f"{path} devolvió {status}"
+
+    samples.sort()
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    return p50, p99
+
+
+def _prime_user() -> list:
+    token = create_access_token({"sub": "bench"})
+    iat = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])["iat"]
+    user_cache.set(("bench", iat), SimpleNamespace(username="bench", must_change_password=False), ttl=3600)
+    return [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())]
+
+
+async def main(requests: int):
+    auth_headers = _prime_user()
+    cases = [
+        ("pública", "/api/v1/monitor/printers/", [(b"host", b"testserver")]),
+        ("autenticada", "/api/v1/printers/", auth_headers),
+    ]
+    apps = [("BaseHTTPMiddleware", build_legacy_app()), ("AuthMiddleware", build_new_app())]
+
+    print(f"{'ruta':<12} {'pila':<20} {'p50 (µs)':>10} {'p99 (µs)':>10}")
+    for label, path, headers in cases:
+        for name, app in apps:
+            p50, p99 = await _measure(app, path, headers, requests)
+            print(f"{label:<12} {name:<20} {p50:>10.1f} {p99:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
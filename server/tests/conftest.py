@@ -0,0 +1,33 @@
+# server/tests/conftest.py
+"""
+Pruebas contra el PostgreSQL de DATABASE_URL (el mismo que usa el servidor,
+con el esquema ya creado). Cada prueba corre en una transacción que se
+descarta al terminar; sin base de datos accesible se omiten.
+
+app.db.session se conecta al importarse (create_database), así que los
+módulos de prueba no deben importar nada que dependa de él a nivel de
+módulo: se importa dentro de la prueba, después de pedir el fixture `db`.
+"""
+import pytest
+
+
+@pytest.fixture
+def db():
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        from app.db.session import SessionLocal
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL no disponible: {e}")
+
+    session = SessionLocal()
+    try:
+        session.execute(sqlalchemy.text("SELECT 1"))
+    except sqlalchemy.exc.OperationalError as e:
+        session.close()
+        pytest.skip(f"PostgreSQL no disponible: {e}")
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
@@ -0,0 +1,55 @@
+# server/tests/test_agent_rpc.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pydantic_settings")
+
+from app.services.agent_rpc import AgentRPC  # noqa: E402
+
+
+class FakeManager:
+    def __init__(self):
+        self.bus = SimpleNamespace(backend=SimpleNamespace(node_id="node"))
+        self.reply_handler = None
+        self.sent = []
+
+    async def send_command(self, agent_token, command):
+        self.sent.append((agent_token, command))
+
+
+def test_slots_are_dropped_once_an_agent_has_no_calls():
+    async def main():
+        manager = FakeManager()
+        rpc = AgentRPC(manager, max_concurrency=1)
+
+        first = asyncio.create_task(rpc.call("agent", {"type": "ping"}, timeout=1))
+        second = asyncio.create_task(rpc.call("agent", {"type": "ping"}, timeout=1))
+        await asyncio.sleep(0)
+        # Una en curso y otra esperando hueco comparten el semáforo
+        assert list(rpc._slots) == ["agent"]
+        assert len(manager.sent) == 1
+
+        await rpc._resolve({"type": "pong", "request_id": manager.sent[0][1]["request_id"]})
+        await first
+        await asyncio.sleep(0)
+        assert list(rpc._slots) == ["agent"]
+
+        await rpc._resolve({"type": "pong", "request_id": manager.sent[1][1]["request_id"]})
+        await second
+        assert rpc._slots == {}
+
+    asyncio.run(main())
+
+
+def test_slots_are_dropped_when_a_call_times_out():
+    async def main():
+        rpc = AgentRPC(FakeManager(), max_concurrency=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await rpc.call("agent", {"type": "ping"}, timeout=0.01)
+        assert rpc._slots == {}
+        assert rpc._pending == {}
+
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+# server/tests/test_client_search.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.db.models.client import Client, ix_clients_search_trgm  # noqa: E402
+
+
+def test_search_index_is_attached_to_clients():
+    # Sin asociar, ni create_all ni sync_columns llegan a crearlo
+    assert ix_clients_search_trgm in Client.__table__.indexes
+
+
+def _clients(db, *names):
+    import uuid
+
+    clients = [Client(name=name, token=uuid.uuid4().hex) for name in names]
+    db.add_all(clients)
+    db.flush()
+    return clients
+
+
+def test_search_ranks_prefix_matches_first_and_tolerates_typos(db):
+    from app.services.client_service import ClientService
+
+    prefixed, contained, other = _clients(db, "Zorbaquil Impresiones", "Grupo Zorbaquil", "Imprenta Norte")
+    service = ClientService(db)
+
+    ranked = [client.id for client, _ in service.search("zorbaquil")]
+    assert ranked[:2] == [prefixed.id, contained.id]
+    assert other.id not in ranked
+
+    assert prefixed.id in [client.id for client, _ in service.search("zorbakil")]
+
+
+def test_search_cursor_walks_every_match_once(db):
+    from app.services.client_service import ClientService
+
+    clients = _clients(db, *(f"Zorbaquil Sede {n}" for n in range(5)), "Grupo Zorbaquil")
+    service = ClientService(db)
+
+    everything = service.search("zorbaquil")
+    assert len(everything) >= len(clients)  # sin límite: todas las coincidencias
+
+    walked, after = [], None
+    while True:
+        page = service.search("zorbaquil", limit=2, after=after)
+        if not page:
+            break
+        walked.extend(client.id for client, _ in page)
+        last_client, last_score = page[-1]
+        after = (last_score, last_client.id)
+
+    assert walked == [client.id for client, _ in everything]
+    # Empates de puntuación en orden de id
+    assert walked[:5] == [client.id for client in clients[:5]]
@@ -0,0 +1,80 @@
+# server/tests/test_ingestion_buffer.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+
+@pytest.fixture
+def ingestion(db):
+    # ingestion_buffer importa app.db.session (ver conftest)
+    from app.services import ingestion_buffer
+    return ingestion_buffer
+
+
+def _report(ip_address, **fields):
+    return {"name": f"test-{ip_address}", "brand": "Test", "model": "T-1", "ip_address": ip_address, **fields}
+
+
+def test_merge_keeps_optional_fields_only_the_older_report_has(ingestion):
+    older = (_report("10.0.0.1", status="online", serial_number="SN1", printer_data={"counters": {"total": 10}}), 3)
+    newer = (_report("10.0.0.1", status="offline", client_id=7), None)
+
+    data, agent_id = ingestion._merge(older, newer)
+
+    assert data["status"] == "offline"
+    assert data["serial_number"] == "SN1"
+    assert data["printer_data"] == {"counters": {"total": 10}}
+    assert data["client_id"] == 7
+    assert agent_id == 3
+
+
+def test_merge_prefers_the_newer_report_fields(ingestion):
+    older = (_report("10.0.0.1", printer_data={"counters": {"total": 10}}, client_id=1), 3)
+    newer = (_report("10.0.0.1", printer_data={"counters": {"total": 20}}, client_id=2), 4)
+
+    data, agent_id = ingestion._merge(older, newer)
+
+    assert data["printer_data"] == {"counters": {"total": 20}}
+    assert data["client_id"] == 2
+    assert agent_id == 4
+
+
+def test_two_reports_for_one_ip_are_coalesced(ingestion):
+    buffer = ingestion.IngestionBuffer(max_pending=10, batch_size=10, flush_interval=60)
+    buffer.submit(_report("10.0.0.1", status="online", serial_number="SN1"), agent_id=3)
+    buffer.submit(_report("10.0.0.1", status="offline"), agent_id=None)
+
+    assert list(buffer._pending) == ["10.0.0.1"]
+    data, agent_id = buffer._pending["10.0.0.1"]
+    assert (data["status"], data["serial_number"], agent_id) == ("offline", "SN1", 3)
+    metrics = buffer.metrics()
+    assert (metrics["accepted"], metrics["coalesced"], metrics["pending"]) == (2, 1, 1)
+
+
+def test_full_buffer_rejects_new_printers_but_accepts_pending_ones(ingestion):
+    buffer = ingestion.IngestionBuffer(max_pending=2, batch_size=10, flush_interval=60)
+    buffer.submit(_report("10.0.0.1"))
+    buffer.submit(_report("10.0.0.2"))
+
+    with pytest.raises(ingestion.BufferFullError):
+        buffer.submit(_report("10.0.0.3"))
+    # Una impresora ya pendiente se combina: no ocupa sitio nuevo
+    buffer.submit(_report("10.0.0.2", status="online"))
+
+    metrics = buffer.metrics()
+    assert (metrics["pending"], metrics["rejected"], metrics["coalesced"]) == (2, 1, 1)
+
+
+def test_requeue_gives_priority_to_reports_received_meanwhile(ingestion):
+    buffer = ingestion.IngestionBuffer(max_pending=10, batch_size=10, flush_interval=60)
+    failed = [
+        ("10.0.0.1", (_report("10.0.0.1", status="online", serial_number="SN1"), 3)),
+        ("10.0.0.2", (_report("10.0.0.2", status="online"), 3)),
+    ]
+    buffer.submit(_report("10.0.0.1", status="offline"))
+
+    buffer._requeue(failed)
+
+    assert buffer._pending["10.0.0.1"][0]["status"] == "offline"
+    assert buffer._pending["10.0.0.1"][0]["serial_number"] == "SN1"
+    assert buffer._pending["10.0.0.2"][0]["status"] == "online"
@@ -0,0 +1,40 @@
+# server/tests/test_monitor_service.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+
+def _report(ip_address: str, status: str, total_pages: int) -> dict:
+    return {
+        "name": f"test-{ip_address}",
+        "brand": "Test",
+        "model": "T-1",
+        "ip_address": ip_address,
+        "status": status,
+        "printer_data": {"counters": {"total_pages": total_pages}},
+    }
+
+
+def test_upsert_mixed_batch_returns_previous_state_per_printer(db):
+    from app.services.monitor_service import PrinterMonitorService
+
+    service = PrinterMonitorService(db)
+    existing = ["10.253.0.1", "10.253.0.2"]
+    new = ["10.253.0.3", "10.253.0.4"]
+
+    service.upsert_printers([
+        (_report(existing[0], "online", 100), None),
+        (_report(existing[1], "error", 200), None),
+    ])
+
+    results = service.upsert_printers(
+        [(_report(ip, "offline", 300), None) for ip in existing + new]
+    )
+    by_ip = {result["ip_address"]: result for result in results}
+
+    assert set(by_ip) == set(existing + new)
+    assert by_ip[existing[0]]["previous_status"] == "online"
+    assert by_ip[existing[1]]["previous_status"] == "error"
+    for ip_address in new:
+        assert by_ip[ip_address]["previous_status"] is None
+    assert all(result["status"] == "offline" for result in results)
@@ -0,0 +1,46 @@
+# server/tests/test_prefix_trie.py
+import pytest
+
+from app.utils.prefix_trie import PrefixTrie
+
+trie = PrefixTrie(["/api/v1/drivers/download", "/api/v1/printer-oids", "/static", "/favicon.ico"])
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/drivers/download",
+    "/api/v1/printer-oids",
+    "/favicon.ico",
+    "/static",
+])
+def test_exact_prefixes_match(path):
+    assert trie.match(path)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/drivers/download/",
+    "/api/v1/drivers/download/7",
+    "/api/v1/printer-oids/5/edit",
+    "/static/js/app.js",
+    "//static//css/app.css",
+])
+def test_subpaths_match(path):
+    assert trie.match(path)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/drivers/downloadX",
+    "/api/v1/drivers/download-all",
+    "/api/v1/drivers",
+    "/api/v1/printer-oidsX/5",
+    "/staticfiles/app.js",
+    "/favicon.ico.bak",
+    "/api/v1/STATIC",
+    "/",
+    "",
+])
+def test_lookalikes_and_parents_do_not_match(path):
+    assert not trie.match(path)
+
+
+def test_empty_trie_matches_nothing():
+    assert not PrefixTrie([]).match("/api/v1/auth/login")
@@ -0,0 +1,44 @@
+# server/tests/test_printer_supplies.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import select, update  # noqa: E402
+
+from app.db.models.printer import Printer, backfill_supply_summary  # noqa: E402
+
+
+def test_backfill_hook_is_registered_on_printers():
+    assert Printer.__table__.info['after_add_columns'] is backfill_supply_summary
+
+
+def test_backfill_fills_summary_of_existing_printers(db):
+    from app.services.monitor_service import PrinterMonitorService
+
+    ip_address = "10.253.1.1"
+    PrinterMonitorService(db).upsert_printers([({
+        "name": f"test-{ip_address}",
+        "brand": "Test",
+        "model": "T-1",
+        "ip_address": ip_address,
+        "status": "online",
+        "printer_data": {"supplies": {"toners": {"black": {"percentage": 5}, "cyan": {"percentage": 60}}}},
+    }, None)])
+    # Como quedan las filas previas a la columna recién añadida
+    db.execute(update(Printer).where(Printer.ip_address == ip_address).values(
+        min_supply_percentage=None, has_critical_supplies=None, critical_supplies=None
+    ))
+
+    table = Printer.__table__
+    assert backfill_supply_summary(db.connection(), table, {'critical_supplies'}) >= 1
+
+    row = db.execute(select(
+        table.c.min_supply_percentage, table.c.has_critical_supplies, table.c.critical_supplies
+    ).where(table.c.ip_address == ip_address)).one()
+    assert row.min_supply_percentage == 5
+    assert row.has_critical_supplies is True
+    assert [supply['type'] for supply in row.critical_supplies] == ['black toner']
+
+
+def test_backfill_ignores_unrelated_columns(db):
+    assert backfill_supply_summary(db.connection(), Printer.__table__, {'location'}) == 0
@@ -0,0 +1,84 @@
+# server/tests/test_report_service.py
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+
+def _printer(db, ip_address):
+    from app.db.models.printer import Printer
+    from app.services.monitor_service import PrinterMonitorService
+
+    # Sin printer_data: no se registra muestra y las lecturas son solo las de la prueba
+    PrinterMonitorService(db).upsert_printers([({
+        "name": f"test-{ip_address}",
+        "brand": "Test",
+        "model": "T-1",
+        "ip_address": ip_address,
+        "status": "online",
+    }, None)])
+    return db.query(Printer).filter(Printer.ip_address == ip_address).one()
+
+
+def test_billing_counts_increments_across_a_counter_reset(db):
+    from app.db.models.printer_sample import PrinterSample
+    from app.services.report_service import BillingReportService
+
+    printer = _printer(db, "10.253.2.1")
+    readings = [
+        (datetime(2001, 1, 28), 1000),  # referencia previa al periodo
+        (datetime(2001, 2, 2), 1100),
+        (datetime(2001, 2, 10), 1200),
+        (datetime(2001, 2, 15), 50),    # reinicio del contador
+        (datetime(2001, 2, 20), 150),
+        (datetime(2001, 3, 2), 400),    # posterior al periodo
+    ]
+    db.add_all(PrinterSample(printer_id=printer.id, ts=ts, total_pages=total) for ts, total in readings)
+    db.flush()
+
+    rows = [
+        row for row in BillingReportService(db).iter_rows(datetime(2001, 2, 1), datetime(2001, 3, 1))
+        if row['printer_id'] == printer.id
+    ]
+
+    assert len(rows) == 1
+    row = rows[0]
+    assert row['start_counter'] == 1000
+    assert row['end_counter'] == 150
+    assert row['total_pages'] == 100 + 100 + 50 + 100
+    assert row['counter_resets'] == 1
+    assert row['samples'] == 4
+    assert row['first_reading_at'] == datetime(2001, 2, 2)
+    assert row['last_reading_at'] == datetime(2001, 2, 20)
+
+
+def _age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_maintenance_fails_orphaned_jobs_and_purges_old_files(db, tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.services import report_service
+    from app.services.report_service import ReportStatus
+
+    monkeypatch.setattr(settings, "REPORTS_STORAGE_PATH", str(tmp_path))
+    now = datetime(2001, 2, 1)
+
+    orphaned = report_service.create_billing_job(now, now, None, "csv")
+    alive = report_service.create_billing_job(now, now, None, "csv")
+    _age(tmp_path / f"{orphaned['id']}.json", settings.REPORT_JOB_STALE_AFTER + 60)
+
+    old_report = tmp_path / f"{'0' * 32}.csv"
+    old_report.write_text("")
+    _age(old_report, settings.REPORT_RETENTION_DAYS * 86400 + 60)
+
+    assert report_service.fail_stale_jobs() == 1
+    assert report_service.get_job(orphaned['id'])['status'] == ReportStatus.FAILED
+    assert report_service.get_job(alive['id'])['status'] == ReportStatus.PENDING
+
+    assert report_service.purge_old_reports() == 1
+    assert not old_report.exists()
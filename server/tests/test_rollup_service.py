@@ -0,0 +1,51 @@
+# server/tests/test_rollup_service.py
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.rollup_service import counter_delta, pick_granularity, truncate  # noqa: E402
+
+
+@pytest.mark.parametrize("previous, current, expected", [
+    (1000, 1250, 250),
+    (1000, 1000, 0),
+    (1000, 40, 40),     # reinicio: cuentan las páginas desde cero
+    (1000, 0, 0),
+    (None, 1250, 0),    # primera lectura, sin referencia
+    (1000, None, 0),
+    (None, None, 0),
+])
+def test_counter_delta(previous, current, expected):
+    assert counter_delta(previous, current) == expected
+
+
+START = datetime(2024, 3, 1)
+
+
+@pytest.mark.parametrize("span, expected", [
+    (timedelta(hours=1), 'hour'),
+    (timedelta(days=3), 'hour'),
+    (timedelta(days=3, seconds=1), 'day'),
+    (timedelta(days=120), 'day'),
+    (timedelta(days=120, seconds=1), 'month'),
+    (timedelta(days=730), 'month'),
+])
+def test_pick_granularity_tier_boundaries(span, expected):
+    assert pick_granularity(START, START + span) == expected
+
+
+@pytest.mark.parametrize("granularity, expected", [
+    ('hour', datetime(2024, 3, 17, 14)),
+    ('day', datetime(2024, 3, 17)),
+    ('month', datetime(2024, 3, 1)),
+])
+def test_truncate(granularity, expected):
+    assert truncate(datetime(2024, 3, 17, 14, 35, 12, 999), granularity) == expected
+
+
+@pytest.mark.parametrize("granularity", ['hour', 'day', 'month'])
+def test_truncate_keeps_period_starts(granularity):
+    start = datetime(2024, 3, 1)
+    assert truncate(start, granularity) == start
@@ -0,0 +1,60 @@
+# server/tests/test_status_hub.py
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pydantic_settings")
+
+from app.core.status_hub import Subscriber, agent_message_key  # noqa: E402
+
+
+def _queued(subscriber: Subscriber):
+    return list(subscriber._queue.items())
+
+
+def test_offer_drops_oldest_when_full():
+    subscriber = Subscriber(websocket=None, filters={}, max_queue=2)
+    subscriber.offer(1, "a")
+    subscriber.offer(2, "b")
+    subscriber.offer(3, "c")
+
+    assert _queued(subscriber) == [(2, "b"), (3, "c")]
+    assert subscriber.dropped == 1
+
+
+def test_offer_coalesces_in_place():
+    subscriber = Subscriber(websocket=None, filters={}, max_queue=2)
+    subscriber.offer("printer-1", "old")
+    subscriber.offer("printer-2", "other")
+    subscriber.offer("printer-1", "new")
+
+    # Conserva su posición y no descarta nada aunque la cola esté llena
+    assert _queued(subscriber) == [("printer-1", "new"), ("printer-2", "other")]
+    assert subscriber.coalesced == 1
+    assert subscriber.dropped == 0
+
+
+@pytest.mark.parametrize("first, second", [
+    ({"type": "installation_progress", "job_id": 1, "printer_ip": "10.0.0.1"},
+     {"type": "installation_progress", "job_id": 2, "printer_ip": "10.0.0.2"}),
+    ({"type": "tunnel_status", "tunnel_id": "a:22-2201"},
+     {"type": "tunnel_status", "tunnel_id": "b:22-2202"}),
+    ({"type": "printer_status", "printer_ip": "10.0.0.1"},
+     {"type": "printer_status", "printer_ip": "10.0.0.2"}),
+])
+def test_agent_messages_about_different_entities_do_not_coalesce(first, second):
+    assert agent_message_key(7, first) != agent_message_key(7, second)
+
+    subscriber = Subscriber(websocket=None, filters={}, max_queue=10)
+    subscriber.offer(agent_message_key(7, first), "first")
+    subscriber.offer(agent_message_key(7, second), "second")
+    assert subscriber.pending == 2
+
+
+def test_agent_messages_about_the_same_entity_coalesce():
+    progress = {"type": "installation_progress", "job_id": 1, "printer_ip": "10.0.0.1"}
+    assert agent_message_key(7, {**progress, "step": "download"}) == agent_message_key(7, {**progress, "step": "install"})
+    assert agent_message_key(7, progress) != agent_message_key(8, progress)
+
+
+def test_installation_results_are_never_coalesced():
+    assert agent_message_key(7, {"type": "installation_result", "job_id": 1}) is None
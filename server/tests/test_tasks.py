@@ -0,0 +1,46 @@
+# server/tests/test_tasks.py
+import asyncio
+import threading
+
+from app.core.tasks import PeriodicTasks
+
+
+def _run_once(func):
+    """Arranca una tarea cada 0 s, espera a su primera ejecución y la detiene."""
+    done = asyncio.Event()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        tasks = PeriodicTasks()
+
+        if asyncio.iscoroutinefunction(func):
+            async def wrapped():
+                await func()
+                done.set()
+        else:
+            def wrapped():
+                func()
+                loop.call_soon_threadsafe(done.set)
+
+        tasks.add("test", 0, wrapped)
+        tasks.start()
+        await asyncio.wait_for(done.wait(), 5)
+        await tasks.stop()
+
+    asyncio.run(main())
+
+
+def test_sync_tasks_run_off_the_event_loop_thread():
+    threads = []
+    _run_once(lambda: threads.append(threading.current_thread()))
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_async_tasks_run_on_the_event_loop():
+    threads = []
+
+    async def task():
+        threads.append(threading.current_thread())
+
+    _run_once(task)
+    assert threads and threads[0] is threading.main_thread()
@@ -0,0 +1,129 @@
+# server/tests/test_tunnel_mux.py
+"""
+tunnel_mux se mantiene idéntico en agent y server: esta prueba y su copia en
+agent/tests comprueban el protocolo con los mismos vectores de bytes.
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.core import tunnel_mux
+from app.core.tunnel_mux import INITIAL_WINDOW, MAX_FRAME, MuxSession
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def _run(scenario):
+    """Ejecuta scenario(session, sent) sobre una sesión que guarda lo enviado."""
+    sent = []
+
+    async def main():
+        async def send_bytes(frame):
+            sent.append(frame)
+
+        async def open_handler(stream):
+            await session.accept(stream)
+
+        session = MuxSession(send_bytes, open_handler)
+        await scenario(session, sent)
+
+    asyncio.run(main())
+    return sent
+
+
+def test_frame_header_layout():
+    assert tunnel_mux.HEADER.pack(tunnel_mux.DATA, 1) + b'hi' == b'\x03\x00\x00\x00\x01hi'
+    assert tunnel_mux.HEADER.size == 5
+    assert (tunnel_mux.OPEN, tunnel_mux.OPEN_OK, tunnel_mux.DATA,
+            tunnel_mux.EOF, tunnel_mux.CLOSE, tunnel_mux.WINDOW_UPDATE) == (1, 2, 3, 4, 5, 6)
+
+
+def test_open_from_peer_is_accepted_and_data_round_trips():
+    received = {}
+
+    async def scenario(session, sent):
+        await session.feed(b'\x01\x00\x00\x01\x02' + b'10.0.0.1:22')
+        await asyncio.sleep(0)
+        stream = session.streams[0x0102]
+        await stream.send(b'pong')
+        await session.feed(b'\x03\x00\x00\x01\x02' + b'ping')
+        await session.feed(b'\x04\x00\x00\x01\x02')
+        received['data'] = bytes(await stream.inbound.get())
+        received['eof'] = await stream.inbound.get()
+        received['tag'] = stream.tag
+
+    sent = _run(scenario)
+    assert sent == [b'\x02\x00\x00\x01\x02', b'\x03\x00\x00\x01\x02pong']
+    assert received == {'data': b'ping', 'eof': None, 'tag': '10.0.0.1:22'}
+
+
+def test_open_stream_sends_open_and_waits_for_open_ok():
+    async def scenario(session, sent):
+        opening = asyncio.create_task(session.open_stream('printer', timeout=1))
+        await asyncio.sleep(0)
+        assert sent == [b'\x01\x00\x00\x00\x01printer']
+        await session.feed(b'\x02\x00\x00\x00\x01')
+        stream = await opening
+        assert stream.id == 1
+
+    _run(scenario)
+
+
+def test_close_from_peer_refuses_pending_open():
+    async def scenario(session, sent):
+        opening = asyncio.create_task(session.open_stream('printer', timeout=1))
+        await asyncio.sleep(0)
+        await session.feed(b'\x05\x00\x00\x00\x01' + 'rechazado'.encode())
+        with pytest.raises(ConnectionRefusedError, match='rechazado'):
+            await opening
+        assert session.streams == {}
+
+    _run(scenario)
+
+
+def test_send_stops_at_the_window_and_resumes_on_window_update():
+    async def scenario(session, sent):
+        await session.feed(b'\x01\x00\x00\x00\x09tag')
+        await asyncio.sleep(0)
+        stream = session.streams[9]
+        sent.clear()
+
+        sending = asyncio.create_task(stream.send(b'x' * (INITIAL_WINDOW + 10)))
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert not sending.done()
+        assert [len(frame) - 5 for frame in sent] == [MAX_FRAME] * (INITIAL_WINDOW // MAX_FRAME)
+        assert stream.credit == 0
+
+        await session.feed(b'\x06\x00\x00\x00\x09' + b'\x00\x00\x00\x0a')
+        await asyncio.wait_for(sending, 1)
+        assert sent[-1] == b'\x03\x00\x00\x00\x09' + b'x' * 10
+        assert stream.credit == 0
+
+    _run(scenario)
+
+
+def test_consumed_returns_credit_every_half_window():
+    async def scenario(session, sent):
+        await session.feed(b'\x01\x00\x00\x00\x09tag')
+        await asyncio.sleep(0)
+        stream = session.streams[9]
+        sent.clear()
+
+        await stream.consumed(INITIAL_WINDOW // 2 - 1)
+        assert sent == []
+        await stream.consumed(1)
+        # 256 KiB = 0x00040000
+        assert sent == [b'\x06\x00\x00\x00\x09' + b'\x00\x04\x00\x00']
+
+    _run(scenario)
+
+
+def test_copies_in_agent_and_server_are_identical():
+    copies = [ROOT / app / 'app' / 'core' / 'tunnel_mux.py' for app in ('agent', 'server')]
+    if not all(path.exists() for path in copies):
+        pytest.skip("Solo una de las dos aplicaciones está presente")
+    # Solo difiere la primera línea, con la ruta del fichero
+    agent, server = (path.read_text(encoding='utf-8').splitlines()[1:] for path in copies)
+    assert agent == server, "agent/app/core/tunnel_mux.py y server/app/core/tunnel_mux.py han divergido"